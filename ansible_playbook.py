@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import os
+import time
+import logging
+import threading
+import yaml
+import webex_apis
+import job_store
+import artifact_store
+
+from dotenv import load_dotenv
+
+load_dotenv('environment.env')
+
+logger = logging.getLogger(__name__)
+
+WEBEX_ROOM = os.getenv('WEBHOOKD_ROOM')
+
+PLAYBOOK_TEMPLATE = os.getenv('PLAYBOOK_TEMPLATE', 'project.yml')  # the remediation Ansible playbook template
+# time to collect the drifted devices for one consolidated playbook, seconds, 0 for one playbook for each device
+PLAYBOOK_WINDOW = int(os.getenv('PLAYBOOK_WINDOW', '0'))
+PLAYBOOK_FORKS = int(os.getenv('PLAYBOOK_FORKS', '20'))  # max Ansible forks for the consolidated playbook
+PLAYBOOK_HOST_GROUP = 'drifted_devices'  # the inventory group of the devices in the consolidated playbook
+
+# the libyaml loader and dumper, if PyYAML was built with libyaml, several times faster than the Python classes
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+template = None  # ((mtime, size), the parsed playbook template)
+template_lock = threading.Lock()
+window_devices = {}  # (dnac ip, hostname) -> device remediation, the devices collected when the job store is disabled
+window_timer = None
+window_lock = threading.Lock()
+
+
+def get_template():
+    """
+    This function will return the parsed {PLAYBOOK_TEMPLATE} playbook. The file is parsed once, and parsed again only
+    when the file is modified. The playbook is shared by all the jobs, the callers will not modify it
+    :return: the playbook, list of plays
+    """
+    global template
+    stat = os.stat(PLAYBOOK_TEMPLATE)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with template_lock:
+        if template is None or template[0] != version:
+            with open(PLAYBOOK_TEMPLATE) as file:
+                template = (version, yaml.load(file, Loader=YAML_LOADER))
+            logger.info('Playbook template loaded from file: %s', PLAYBOOK_TEMPLATE)
+        return template[1]
+
+
+def create_playbook(cli_template):
+    """
+    This function will create the Ansible playbook to remediate the configuration drift, from the playbook template,
+    with the {cli_template}
+    :param cli_template: the CLI commands to be deployed
+    :return: the Ansible playbook text
+    """
+    # only the play and the play vars are copied, the tasks are shared with the cached template
+    play = dict(get_template()[0])
+    play['vars'] = dict(play['vars'], cli_template=cli_template)
+    return yaml.dump([play], Dumper=YAML_DUMPER, default_flow_style=False)
+
+
+def create_consolidated_playbook(devices):
+    """
+    This function will create one Ansible playbook to remediate the configuration drift of multiple devices.
+    The first play adds the devices to the inventory group {PLAYBOOK_HOST_GROUP}, with the device name, the Cisco DNA
+    Center and the CLI template as host vars. The second play is the playbook template, executed for all the hosts in
+    the group, in parallel, "ansible-playbook -f {forks}"
+    :param devices: list of device remediations, {'device_name': ..., 'dnac_host': ..., 'cli_template': ...}
+    :return: the Ansible playbook text
+    """
+    add_hosts_play = {
+        'name': 'Add the drifted devices to the inventory',
+        'hosts': 'localhost',
+        'connection': 'local',
+        'gather_facts': False,
+        'vars': {'remediation_devices': devices},
+        'tasks': [{
+            'name': 'Add device {{ item.device_name }}',
+            'ansible.builtin.add_host': {
+                'name': '{{ item.dnac_host }}_{{ item.device_name }}',
+                'groups': PLAYBOOK_HOST_GROUP,
+                'device_name': '{{ item.device_name }}',
+                'dnac_host': '{{ item.dnac_host }}',
+                'cli_template': '{{ item.cli_template }}'
+            },
+            'loop': '{{ remediation_devices }}',
+            'loop_control': {'label': '{{ item.device_name }}'}
+        }]
+    }
+    # the play vars have precedence over the host vars, the device vars are removed from the template play
+    remediation_play = dict(get_template()[0], hosts=PLAYBOOK_HOST_GROUP)
+    remediation_play['vars'] = {key: value for key, value in remediation_play['vars'].items()
+                                if key not in ('device_name', 'dnac_host', 'cli_template')}
+    return yaml.dump([add_hosts_play, remediation_play], Dumper=YAML_DUMPER, default_flow_style=False)
+
+
+def post_consolidated_playbook(devices, file_name):
+    """
+    This function will create the consolidated Ansible playbook for the {devices}, save it to the {file_name} file,
+    and post it to the Webex room, one message with the command to execute the playbook, and the file
+    :param devices: list of device remediations, {'device_name': ..., 'dnac_host': ..., 'cli_template': ...}
+    :param file_name: the playbook file name
+    :return: none
+    """
+    playbook = create_consolidated_playbook(devices)
+    artifact_store.save_artifact(file_name, playbook)
+    forks = max(min(len(devices), PLAYBOOK_FORKS), 1)
+    card_message = {
+        "roomId": webex_apis.get_room_id(WEBEX_ROOM),
+        "markdown": "Consolidated Ansible Playbook",
+        "attachments": [
+            {
+                "contentType": "application/vnd.microsoft.card.adaptive",
+                "content": {
+                    "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
+                    "type": "AdaptiveCard",
+                    "version": "1.0",
+                    "body": [
+                        {
+                            "type": "TextBlock",
+                            "text": "Consolidated Ansible Playbook",
+                            "weight": "bolder"
+                        },
+                        {
+                            "type": "TextBlock",
+                            "wrap": True,
+                            "text": "Here is attached the Ansible Playbook to remediate the configuration drift of " +
+                                    str(len(devices)) + " devices: " +
+                                    ", ".join(device['device_name'] for device in devices)
+                        },
+                        {
+                            "type": "TextBlock",
+                            "wrap": True,
+                            "text": "Execute the attached file by using the command:\n"
+                        },
+                        {
+                            "type": "TextBlock",
+                            "wrap": True,
+                            "text": "ansible-playbook -f " + str(forks) + " " + file_name
+                        }
+                    ]
+                }
+            }
+        ]
+    }
+    response = webex_apis.post_room_card_message(WEBEX_ROOM, card_message)
+    webex_apis.post_room_file(WEBEX_ROOM, file_name, 'text/plain', response.json()['id'], file_content=playbook)
+    logger.info('Consolidated Ansible Playbook uploaded to Webex, number of devices: %s', len(devices))
+
+
+def add_window_device(device_name, dnac_host, cli_template):
+    """
+    This function will add the device to the consolidated playbook for the current time window. The playbook is
+    posted {PLAYBOOK_WINDOW} seconds after the first device of the window is added. The devices are saved to the job
+    store, shared by the worker processes, one playbook is posted for each window, by the first process with the
+    window timer expired. For a device added again in the same window, the last CLI template is used
+    :param device_name: the device hostname
+    :param dnac_host: the Cisco DNA Center IP address
+    :param cli_template: the CLI commands to be deployed
+    :return: none
+    """
+    device = {'device_name': device_name, 'dnac_host': dnac_host, 'cli_template': cli_template}
+    window_start = job_store.add_playbook_device(device)
+    with window_lock:
+        if window_start is None:
+            # the job store is disabled, the devices are collected by the current process
+            window_devices[(dnac_host, device_name)] = device
+            window_start = time.time()
+        _start_window_timer(window_start)
+
+
+def flush_window_devices(window_end=None):
+    """
+    This function will post the consolidated playbook for the devices collected in the time window ending at
+    {window_end}, called when the window timer expires, and for all the devices when the application is stopped
+    :param window_end: optional, the end of the time window, epoch seconds
+    :return: none
+    """
+    global window_timer
+    with window_lock:
+        if window_timer is not None and window_end is None:
+            window_timer.cancel()
+        window_timer = None
+        devices = list(window_devices.values())
+        window_devices.clear()
+        shared_devices, next_window_start = job_store.pop_playbook_devices(window_end)
+        devices.extend(shared_devices)
+        # the devices added after the window end, by any process, are posted with the next window
+        if next_window_start is not None and window_end is not None:
+            _start_window_timer(next_window_start)
+    if not devices:
+        return
+    try:
+        post_consolidated_playbook(devices, 'remediation_' + time.strftime('%Y%m%d_%H%M%S') + '.yml')
+    except Exception:
+        logger.exception('Consolidated Ansible Playbook not posted, number of devices: %s', len(devices))
+
+
+def _start_window_timer(window_start):
+    """
+    Start the timer for the window with the {window_start} time, if not started, caller holds {window_lock}
+    """
+    global window_timer
+    if window_timer is None:
+        window_end = window_start + PLAYBOOK_WINDOW
+        window_timer = threading.Timer(max(window_end - time.time(), 0), flush_window_devices, args=(window_end,))
+        window_timer.daemon = True
+        window_timer.start()
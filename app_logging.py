@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+import os
+import sys
+import queue
+import atexit
+import logging
+
+from logging.handlers import QueueHandler, QueueListener
+from dotenv import load_dotenv
+
+load_dotenv('environment.env')
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')  # DEBUG will log the notification payloads
+LOG_FILE = os.getenv('LOG_FILE', 'application_run.log')  # the log file, '' to disable
+LOG_CONSOLE = os.getenv('LOG_CONSOLE', 'True').lower() == 'true'  # log to the console
+
+listener = None
+listener_pid = None
+
+
+def setup_logging():
+    """
+    This function will configure the application logging, it is called once, at startup.
+    The log records are added to a queue by the application threads, and written to the log file and the console by
+    a background thread, logging will not block the webhook requests and the workflows on disk or terminal writes.
+    Call again in the forked worker processes, the background thread is not running after fork
+    :return: none
+    """
+    global listener, listener_pid
+    if listener is not None and listener_pid == os.getpid():
+        return
+    handlers = []
+    if LOG_FILE:
+        file_handler = logging.FileHandler(LOG_FILE)
+        file_handler.setFormatter(logging.Formatter(
+            '%(asctime)s.%(msecs)03d %(levelname)s %(module)s - %(funcName)s: %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'))
+        handlers.append(file_handler)
+    if LOG_CONSOLE:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s', datefmt='%H:%M:%S'))
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    root_logger = logging.getLogger()
+    root_logger.setLevel(LOG_LEVEL.upper())
+    root_logger.handlers = [QueueHandler(log_queue)]
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    listener_pid = os.getpid()
+    atexit.register(listener.stop)
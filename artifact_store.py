@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+import os
+import logging
+import uuid
+import queue
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv('environment.env')
+
+logger = logging.getLogger(__name__)
+
+SAVE_ARTIFACTS = os.getenv('SAVE_ARTIFACTS', 'True').lower() == 'true'  # save the configs, diff and playbook files
+ARTIFACTS_DIR = os.getenv('ARTIFACTS_DIR', '')  # folder for the saved files, default the current folder
+
+artifact_queue = queue.Queue()
+writer_lock = threading.Lock()
+writer = None
+
+
+def save_artifact(file_name, content):
+    """
+    This function will save the {content} to the file with the {file_name}, in the folder {ARTIFACTS_DIR}.
+    The file is written by a background thread, the function will return right away.
+    The file is replaced atomically, the jobs for the same device will not write partial files
+    :param file_name: the file name
+    :param content: the file content
+    :return: none
+    """
+    global writer
+    if not SAVE_ARTIFACTS:
+        return
+    with writer_lock:
+        if writer is None:
+            writer = threading.Thread(target=_writer, name='artifact-writer', daemon=True)
+            writer.start()
+    artifact_queue.put((file_name, content))
+
+
+def wait_for_artifacts():
+    """
+    This function will wait for all the queued files to be written
+    :return: none
+    """
+    if writer is not None:
+        artifact_queue.join()
+
+
+def _writer():
+    """
+    Writer thread loop, write each queued file to a temporary file, and rename it to the file name
+    """
+    while True:
+        file_name, content = artifact_queue.get()
+        try:
+            file_path = os.path.join(ARTIFACTS_DIR, file_name)
+            temp_file_path = file_path + '.' + uuid.uuid4().hex + '.tmp'
+            with open(temp_file_path, 'w') as file:
+                file.write(content)
+            os.replace(temp_file_path, file_path)
+        except Exception:
+            logger.exception('Artifact not saved: %s', file_name)
+        finally:
+            artifact_queue.task_done()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+# config diff and remediation playbook benchmark, synthetic configs from 1k to 200k lines, with 0.1% to 20% drift.
+# The runtime and the peak memory of each stage are compared with the saved baseline
+# python benchmark/bench_config_diff.py
+# python benchmark/bench_config_diff.py --lines 1000,10000 --drift 0.01 --save-baseline
+
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import tracemalloc
+import synthetic_configs
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# the benchmark will not start the job workers when the receiver module is imported
+os.environ['JOB_WORKERS_AUTOSTART'] = 'False'
+
+import config_diff  # noqa: E402
+import json_stream  # noqa: E402
+import compliance_check_receiver  # noqa: E402
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline_config_diff.json')
+
+SHOW_RUN_HEADER = ('show running-config\nBuilding configuration...\n\nCurrent configuration : 0 bytes\n!\n'
+                   '! Last configuration change at 10:22:35 UTC Mon Sep 27 2021\n'
+                   '! NVRAM config last updated at 10:22:35 UTC Mon Sep 27 2021\n!\n')
+
+
+def config_stages(startup_config, file_content):
+    """
+    This function will return the stages of the config diff and remediation path, in the compliance workflow order.
+    Each stage is a (name, function) tuple, the function is called with the result of the previous stage
+    :param startup_config: the startup config text
+    :param file_content: the Command Runner file with the "show running-config" output
+    :return: list of stages
+    """
+    def file_chunks():
+        for index in range(0, len(file_content), json_stream.CHUNK_SIZE):
+            yield file_content[index:index + json_stream.CHUNK_SIZE]
+
+    return [
+        ('file parse', lambda _: json_stream.load_chunks(file_chunks())[0]['commandResponses']['SUCCESS']),
+        ('strip header', lambda command_responses: config_diff.strip_config_header(
+            command_responses['show running-config'], 'show running-config')),
+        ('diff', lambda running_config: config_diff.diff_configs(startup_config, running_config)),
+        ('format diff', lambda diff: (config_diff.format_diff(diff),
+                                      config_diff.format_diff(diff, "'+'     ", "'-'     "), diff)[-1]),
+        ('remediation cli', config_diff.remediation_cli),
+        ('playbook', compliance_check_receiver.create_ansible_playbook)
+    ]
+
+
+def run_stages(stages, measure_memory=False):
+    """
+    This function will run the {stages}, and return the runtime, or the peak memory, of each stage
+    :param stages: list of stages, from the function config_stages
+    :param measure_memory: measure the peak memory with tracemalloc, instead of the runtime
+    :return: dict, stage name -> seconds, or peak KiB
+    """
+    results = {}
+    value = None
+    for name, function in stages:
+        gc.collect()
+        if measure_memory:
+            tracemalloc.start()
+            value = function(value)
+            results[name] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+            tracemalloc.stop()
+        else:
+            start_time = time.perf_counter()
+            value = function(value)
+            results[name] = time.perf_counter() - start_time
+    return results
+
+
+def benchmark_case(lines, drift, repeat):
+    """
+    This function will benchmark the config diff and remediation stages for a config with {lines} lines and {drift}
+    ratio of lines changed. The runtime is the best of {repeat} runs, the peak memory is measured in a separate run,
+    tracemalloc slows down the code
+    :param lines: the number of config lines
+    :param drift: the ratio of lines changed
+    :param repeat: the number of runs
+    :return: dict, stage name -> {'seconds': ..., 'peak_kib': ...}
+    """
+    startup_config = synthetic_configs.generate_config(lines)
+    running_config = synthetic_configs.drift_config(startup_config, drift)
+    file_content = json.dumps([{'deviceUuid': 'bench-device', 'commandResponses': {
+        'SUCCESS': {'show running-config': SHOW_RUN_HEADER + running_config}, 'FAILURE': {}}}]).encode('utf-8')
+    stages = config_stages(startup_config, file_content)
+    runs = [run_stages(stages) for _ in range(repeat)]
+    peak_memory = run_stages(stages, measure_memory=True)
+    return {name: {'seconds': round(min(run[name] for run in runs), 5), 'peak_kib': peak_memory[name]}
+            for name, _ in stages}
+
+
+def compare_results(results, baseline, tolerance, min_seconds):
+    """
+    This function will compare the benchmark {results} with the {baseline}, the stages slower, or using more memory,
+    than the baseline by more than {tolerance} are reported as regressions
+    :param results: the benchmark results
+    :param baseline: the baseline results
+    :param tolerance: the ratio, for example 0.25 for 25%
+    :param min_seconds: the runtime differences smaller than {min_seconds} are ignored, timer noise
+    :return: list of regression messages
+    """
+    regressions = []
+    for case, stages in results.items():
+        for name, result in stages.items():
+            base = baseline.get(case, {}).get(name)
+            if base is None:
+                continue
+            if result['seconds'] > base['seconds'] * (1 + tolerance) and \
+                    result['seconds'] - base['seconds'] > min_seconds:
+                regressions.append('%s, %s: %.4f seconds, baseline %.4f seconds' %
+                                   (case, name, result['seconds'], base['seconds']))
+            if result['peak_kib'] > base['peak_kib'] * (1 + tolerance) and result['peak_kib'] - base['peak_kib'] > 64:
+                regressions.append('%s, %s: %.1f KiB peak memory, baseline %.1f KiB' %
+                                   (case, name, result['peak_kib'], base['peak_kib']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Config diff and remediation playbook benchmark')
+    parser.add_argument('--lines', default='1000,10000,50000,200000', help='config sizes, comma separated')
+    parser.add_argument('--drift', default='0.001,0.01,0.05,0.2', help='ratios of lines changed, comma separated')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs, the best runtime is reported')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='the baseline results file')
+    parser.add_argument('--save-baseline', action='store_true', help='save the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown ratio, compared to the baseline')
+    parser.add_argument('--min-seconds', type=float, default=0.005, help='ignore smaller runtime differences')
+    parser.add_argument('--output', help='save the results to a JSON file')
+    args = parser.parse_args()
+
+    # the playbook stage reads the project.yml playbook template, from the repository folder
+    os.chdir(REPO_DIR)
+
+    results = {}
+    print('%-30s %-16s %12s %12s' % ('case', 'stage', 'seconds', 'peak KiB'))
+    for lines in [int(value) for value in args.lines.split(',')]:
+        for drift in [float(value) for value in args.drift.split(',')]:
+            case = 'lines=%s drift=%s' % (lines, drift)
+            results[case] = benchmark_case(lines, drift, args.repeat)
+            for name, result in results[case].items():
+                print('%-30s %-16s %12.4f %12.1f' % (case, name, result['seconds'], result['peak_kib']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=4)
+        print('Baseline saved to file: ' + args.baseline)
+        return
+    if not os.path.exists(args.baseline):
+        print('No baseline file: ' + args.baseline + ', use --save-baseline')
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare_results(results, baseline, args.tolerance, args.min_seconds)
+    for regression in regressions:
+        print('Regression - ' + regression)
+    if regressions:
+        sys.exit(1)
+    print('No regressions, compared to the baseline: ' + args.baseline)
+
+
+if __name__ == '__main__':
+    main()
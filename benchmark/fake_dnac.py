@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+# fake Cisco DNA Center, the API calls used by the compliance workflow and the compliance sweep, for the load benchmark
+# python benchmark/fake_dnac.py --port 9443 --task-latency 2 --config-lines 5000 --drift 0.01 --rate-limit 0.01
+
+import os
+import json
+import time
+import uuid
+import argparse
+import threading
+import synthetic_configs
+
+from fake_server import FakeServer, FakeHandler
+from werkzeug.serving import generate_adhoc_ssl_context
+
+
+class FakeDnacHandler(FakeHandler):
+    """
+    The fake Cisco DNA Center API request handler
+    """
+    routes = [
+        ('POST', '/dna/system/api/v1/auth/token', 'auth_token'),
+        ('GET', '/dna/intent/api/v1/network-device/ip-address/(?P<ip>[^/]+)', 'device_by_ip'),
+        ('GET', '/dna/intent/api/v1/network-device', 'device_list'),
+        ('GET', '/dna/intent/api/v1/device-detail', 'device_detail'),
+        ('PUT', '/dna/intent/api/v1/network-device/sync', 'device_sync'),
+        ('POST', '/dna/intent/api/v1/compliance/?', 'run_compliance'),
+        ('GET', '/dna/intent/api/v1/compliance/detail', 'compliance_detail'),
+        ('GET', '/dna/intent/api/v1/compliance/(?P<device_id>[^/]+)/detail', 'device_compliance_detail'),
+        ('POST', '/dna/intent/api/v1/network-device-poller/cli/read-request', 'command_runner'),
+        ('GET', '/dna/intent/api/v1/task/(?P<task_id>[^/]+)', 'task'),
+        ('GET', '/dna/intent/api/v1/file/(?P<file_id>[^/]+)', 'file')
+    ]
+
+    def auth_token(self, match, query):
+        return 200, {'Token': 'fake-token'}
+
+    def device_by_ip(self, match, query):
+        return 200, {'response': _device(match.group('ip'))}
+
+    def device_list(self, match, query):
+        offset = int(query.get('offset', 1))
+        limit = int(query.get('limit', 500))
+        last = min(offset - 1 + limit, self.server.devices)
+        return 200, {'response': [_device('10.%d.%d.%d' % (index // 65536 % 256, index // 256 % 256, index % 256))
+                                  for index in range(offset - 1, last)]}
+
+    def device_detail(self, match, query):
+        return 200, {'response': {'platformId': 'C9300-48P', 'softwareVersion': '17.3.4', 'serialNumber': 'FOC0000X0X0',
+                                  'location': 'Global/Lab/Floor 1', 'nwDeviceName': query.get('searchBy')}}
+
+    def device_sync(self, match, query):
+        self.read_body()
+        return 202, {'response': {'taskId': self.server.create_task()}}
+
+    def run_compliance(self, match, query):
+        self.read_body()
+        return 202, {'response': {'taskId': self.server.create_task()}}
+
+    def compliance_detail(self, match, query):
+        checks = []
+        for device_id in query.get('deviceUuid', '').split(','):
+            checks.extend(_compliance_checks(device_id, self.server.started))
+        return 200, {'response': checks}
+
+    def device_compliance_detail(self, match, query):
+        return 200, {'response': _compliance_checks(match.group('device_id'), self.server.started)}
+
+    def command_runner(self, match, query):
+        body = self.read_json()
+        outputs = {}
+        for command in body['commands']:
+            config = self.server.running_config if 'running' in command else self.server.startup_config
+            header_lines = ('! Last configuration change at ' + self.server.last_change_timestamp + '\n'
+                            '! NVRAM config last updated at ' + self.server.nvram_timestamp + '\n')
+            if '| include' in command:
+                outputs[command] = command + '\n' + header_lines
+                continue
+            outputs[command] = (command + '\nBuilding configuration...\n\nCurrent configuration : ' +
+                                str(len(config)) + ' bytes\n!\n' + header_lines + '!\n' + config)
+        file_content = json.dumps([{'deviceUuid': device_id, 'commandResponses': {
+            'SUCCESS': outputs, 'FAILURE': {}, 'BLACKLISTED': {}}} for device_id in body['deviceUuids']])
+        return 202, {'response': {'taskId': self.server.create_task(file_content.encode('utf-8'))}}
+
+    def task(self, match, query):
+        task = self.server.tasks.get(match.group('task_id'))
+        if task is None:
+            return 404, {'message': 'task not found'}
+        response = {'taskId': match.group('task_id'), 'isError': False, 'progress': 'task in progress'}
+        if time.time() - task['created'] >= self.server.task_latency:
+            response['endTime'] = int(time.time() * 1000)
+            response['progress'] = json.dumps({'fileId': task['file_id']}) if task['file_id'] else 'completed'
+        return 200, {'response': response}
+
+    def file(self, match, query):
+        file_content = self.server.files.get(match.group('file_id'))
+        if file_content is None:
+            return 404, {'message': 'file not found'}
+        return 200, file_content, {'Content-Type': 'application/octet-stream',
+                                   'Content-Disposition': 'attachment; filename=' + match.group('file_id') + '.json'}
+
+
+class FakeDnac(FakeServer):
+    """
+    The fake Cisco DNA Center, the tasks are completed after {task_latency} seconds
+    """
+    def __init__(self, address, task_latency=2.0, config_lines=2000, drift=0.01, devices=1000, **kwargs):
+        super().__init__(address, FakeDnacHandler, FakeDnacHandler.routes, **kwargs)
+        self.task_latency = task_latency
+        self.devices = devices  # the number of devices in the inventory, for the compliance sweep
+        self.startup_config = synthetic_configs.generate_config(config_lines)
+        self.running_config = synthetic_configs.drift_config(self.startup_config, drift)
+        self.nvram_timestamp = time.strftime('%H:%M:%S UTC %a %b %d %Y', time.gmtime())
+        self.last_change_timestamp = self.nvram_timestamp + ' by admin'
+        self.started = int(time.time() * 1000)
+        self.tasks = {}  # task id -> {'created': ..., 'file_id': ...}
+        self.files = {}  # file id -> file content
+        self.tasks_lock = threading.Lock()
+
+    def create_task(self, file_content=None):
+        """
+        Create a task, with the Command Runner {file_content} if provided, and return the task id
+        """
+        task_id = str(uuid.uuid4())
+        file_id = str(uuid.uuid4()) if file_content is not None else None
+        with self.tasks_lock:
+            self.tasks[task_id] = {'created': time.time(), 'file_id': file_id}
+            if file_id:
+                self.files[file_id] = file_content
+        return task_id
+
+
+def _device(ip_address):
+    """
+    Return the device with the {ip_address}, the device id is derived from the IP address
+    """
+    return {'hostname': 'bench-' + ip_address.replace('.', '-'), 'id': str(uuid.uuid5(uuid.NAMESPACE_DNS, ip_address)),
+            'managementIpAddress': ip_address, 'family': 'Switches and Hubs'}
+
+
+def _compliance_checks(device_id, last_update_time):
+    """
+    Return the compliance checks for the device with the {device_id}, the running config is not compliant
+    """
+    return [{'deviceUuid': device_id, 'complianceType': compliance_type, 'status': status,
+             'lastUpdateTime': last_update_time}
+            for compliance_type, status in (('RUNNING_CONFIG', 'NON_COMPLIANT'), ('IMAGE', 'COMPLIANT'),
+                                            ('PSIRT', 'COMPLIANT'), ('APPLICATION_VISIBILITY', 'COMPLIANT'))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Cisco DNA Center for the load benchmark')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9443)
+    parser.add_argument('--task-latency', type=float, default=2.0, help='time to complete the tasks, seconds')
+    parser.add_argument('--latency', type=float, default=0.02, help='API call latency, seconds')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='ratio of the API calls rejected with 429')
+    parser.add_argument('--config-lines', type=int, default=2000, help='number of lines of the device configs')
+    parser.add_argument('--drift', type=float, default=0.01, help='ratio of running config lines changed')
+    parser.add_argument('--devices', type=int, default=1000, help='number of devices in the inventory')
+    args = parser.parse_args()
+
+    server = FakeDnac((args.host, args.port), task_latency=args.task_latency, config_lines=args.config_lines,
+                      drift=args.drift, devices=args.devices, latency=args.latency, rate_limit=args.rate_limit)
+    server.socket = generate_adhoc_ssl_context().wrap_socket(server.socket, server_side=True)
+    print('Fake Cisco DNA Center listening on https://' + args.host + ':' + str(args.port) + ', process id ' +
+          str(os.getpid()))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
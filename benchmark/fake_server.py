@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+# the HTTP server shared by the fake Cisco DNA Center and the fake Webex servers, used by the load benchmark
+
+import re
+import json
+import time
+import random
+import threading
+import collections
+import requests
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+
+class FakeServer(ThreadingHTTPServer):
+    """
+    The fake API server, the requests are routed to the handler methods using the {routes}:
+    [(method, path regex, handler method name), ...]. Each API call is counted, GET /_stats returns the counters
+    """
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, handler_class, routes, latency=0.0, rate_limit=0.0, retry_after=1):
+        super().__init__(address, handler_class)
+        self.routes = [(method, re.compile(path + '$'), name) for method, path, name in routes]
+        self.latency = latency  # the API call latency, seconds
+        self.rate_limit = rate_limit  # the ratio of the API calls rejected with "429 Too Many Requests"
+        self.retry_after = retry_after
+        self.stats = collections.Counter()  # 'METHOD route' -> number of API calls
+        self.stats_lock = threading.Lock()
+
+    def count(self, key):
+        """
+        Count an API call
+        """
+        with self.stats_lock:
+            self.stats[key] += 1
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    """
+    The fake API request handler, the handler methods are called with the path regex match and the query parameters,
+    and return the status code, the response body and optional headers
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        """
+        Return the request body
+        """
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def read_json(self):
+        """
+        Return the request JSON body
+        """
+        body = self.read_body()
+        return json.loads(body) if body else None
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        if method == 'GET' and url.path == '/_stats':
+            with self.server.stats_lock:
+                self._send(200, dict(self.server.stats))
+            return
+        for route_method, path, name in self.server.routes:
+            match = path.match(url.path)
+            if route_method == method and match:
+                break
+        else:
+            self.read_body()
+            self.server.count(method + ' not found')
+            self._send(404, {'message': 'not found: ' + url.path})
+            return
+        self.server.count(method + ' ' + name)
+        if self.server.latency:
+            time.sleep(self.server.latency * random.uniform(0.5, 1.5))
+        if self.server.rate_limit and random.random() < self.server.rate_limit:
+            self.read_body()
+            self.server.count('429 ' + name)
+            self._send(429, {'message': 'rate limited'}, {'Retry-After': str(self.server.retry_after)})
+            return
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self._send(*getattr(self, name)(match, query))
+
+    def _send(self, status_code, body, headers=None):
+        if isinstance(body, bytes):
+            data = body
+        else:
+            data = json.dumps(body).encode('utf-8')
+            headers = dict({'Content-Type': 'application/json'}, **(headers or {}))
+        self.send_response(status_code)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def get_stats(url):
+    """
+    This function will return the API call counters of the fake server with the {url}
+    :param url: the fake server URL
+    :return: dict, 'METHOD route' -> number of API calls
+    """
+    return requests.get(url.rstrip('/') + '/_stats', verify=False).json()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+# fake Webex API, the rooms and messages API calls, for the load benchmark
+# python benchmark/fake_webex.py --port 9444 --room "Compliance Room" --rate-limit 0.01
+
+import os
+import uuid
+import argparse
+
+from fake_server import FakeServer, FakeHandler
+
+
+class FakeWebexHandler(FakeHandler):
+    """
+    The fake Webex API request handler
+    """
+    routes = [
+        ('GET', '/v1/rooms', 'rooms'),
+        ('POST', '/v1/messages', 'message')
+    ]
+
+    def rooms(self, match, query):
+        return 200, {'items': [{'id': self.server.room_id, 'title': self.server.room, 'type': 'group'}]}
+
+    def message(self, match, query):
+        # JSON or multipart messages, the files are not parsed
+        self.read_body()
+        return 200, {'id': str(uuid.uuid4()), 'roomId': self.server.room_id}
+
+
+class FakeWebex(FakeServer):
+    """
+    The fake Webex API, with one room titled {room}
+    """
+    def __init__(self, address, room, **kwargs):
+        super().__init__(address, FakeWebexHandler, FakeWebexHandler.routes, **kwargs)
+        self.room = room
+        self.room_id = str(uuid.uuid4())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Webex API for the load benchmark')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9444)
+    parser.add_argument('--room', default=os.getenv('WEBHOOKD_ROOM', 'Compliance Room'), help='the Webex room title')
+    parser.add_argument('--latency', type=float, default=0.05, help='API call latency, seconds')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='ratio of the API calls rejected with 429')
+    args = parser.parse_args()
+
+    server = FakeWebex((args.host, args.port), args.room, latency=args.latency, rate_limit=args.rate_limit)
+    print('Fake Webex API listening on http://' + args.host + ':' + str(args.port) + '/v1, process id ' +
+          str(os.getpid()))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+# load benchmark for the compliance check receiver, replays the recorded event notifications, or synthetic events,
+# at a fixed rate, and reports the throughput, the end-to-end latency and the API calls per event
+# python benchmark/load_test.py --receiver https://127.0.0.1:5000 --dnac 127.0.0.1:9443 --rate 5 --count 200 \
+#     --dnac-url https://127.0.0.1:9443 --webex-url http://127.0.0.1:9444
+
+import os
+import re
+import sys
+import gzip
+import json
+import time
+import uuid
+import argparse
+import threading
+import requests
+import urllib3
+
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from requests.auth import HTTPBasicAuth
+from urllib3.exceptions import InsecureRequestWarning
+from fake_server import get_stats
+
+urllib3.disable_warnings(InsecureRequestWarning)  # disable insecure https warnings
+
+load_dotenv('environment.env')
+
+JOB_ID_PATTERN = re.compile(r'Job Id: (\S+)')
+
+
+def load_events(events_file):
+    """
+    This function will load the event notifications recorded in the {events_file}, one JSON event for each line,
+    for example the compliance_check_data.log event log segments, plain or gzip compressed
+    :param events_file: the file name
+    :return: list of event notifications
+    """
+    open_file = gzip.open if events_file.endswith('.gz') else open
+    events = []
+    with open_file(events_file, 'rt', encoding='utf-8') as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(event, dict) and event.get('details'):
+                events.append(event)
+    return events
+
+
+def synthetic_event(dnac_ip, device_ip):
+    """
+    This function will create an active issue event notification for the device with the {device_ip}
+    :param dnac_ip: the Cisco DNA Center IP address
+    :param device_ip: the device IP address
+    :return: the event notification
+    """
+    instance_id = str(uuid.uuid4())
+    return {
+        'version': '1.0.0',
+        'instanceId': instance_id,
+        'eventId': 'NETWORK-NETWORKS-2-303',
+        'namespace': 'ASSURANCE',
+        'type': 'NETWORK',
+        'category': 'ERROR',
+        'severity': 2,
+        'timestamp': int(time.time() * 1000),
+        'details': {
+            'Type': 'Network Device',
+            'Assurance Issue Priority': 'P2',
+            'Assurance Issue Details': 'Device name: bench - BGP peering with neighbor failed due to AS number mismatch',
+            'Device': device_ip,
+            'Assurance Issue Name': 'Device Received Error Message From Neighbor (Peer in Wrong AS)',
+            'Assurance Issue Category': 'connectivity',
+            'Assurance Issue Status': 'active'
+        },
+        'ciscoDnaEventLink': 'https://' + dnac_ip + '/dna/assurance/issueDetails?issueId=' + instance_id,
+        'dnacIP': dnac_ip
+    }
+
+
+def percentile(values, percent):
+    """
+    This function will return the {percent} percentile of the {values}, nearest rank
+    :param values: list of numbers
+    :param percent: the percentile, 0 to 100
+    :return: the percentile, or None if no values
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    index = max(int(round(percent / 100 * len(values) + 0.5)) - 1, 0)
+    return round(values[min(index, len(values) - 1)], 3)
+
+
+def post_event(session, receiver, event, results, results_lock):
+    """
+    This function will post the {event} to the receiver, and save the response and the timing to the {results}
+    :param session: the requests session, with the receiver credentials
+    :param receiver: the receiver URL
+    :param event: the event notification
+    :param results: list of results
+    :param results_lock: lock for the {results}
+    :return: none
+    """
+    result = {'posted': time.time()}
+    try:
+        response = session.post(receiver + '/compliance_check', json=event, verify=False, timeout=60)
+        result['status_code'] = response.status_code
+        job_id = JOB_ID_PATTERN.search(response.text)
+        if job_id:
+            result['job_id'] = job_id.group(1)
+        result['coalesced'] = 'coalesced' in response.text
+    except requests.RequestException as e:
+        result['status_code'] = None
+        result['error'] = repr(e)
+    result['accepted'] = time.time()
+    with results_lock:
+        results.append(result)
+
+
+def wait_for_jobs(session, receiver, job_ids, timeout):
+    """
+    This function will poll the job status until all the jobs with the {job_ids} are finished, or {timeout} seconds
+    :param session: the requests session, with the receiver credentials
+    :param receiver: the receiver URL
+    :param job_ids: list of job ids
+    :param timeout: max time to wait, in seconds
+    :return: dict, job id -> job status, for the finished jobs
+    """
+    finished_jobs = {}
+    pending = set(job_ids)
+    deadline = time.time() + timeout
+    while pending and time.time() < deadline:
+        for job_id in list(pending):
+            response = session.get(receiver + '/compliance_check_jobs/' + job_id, verify=False, timeout=30)
+            if response.status_code != 200:
+                continue
+            job = response.json()
+            if job['status'] in ('completed', 'failed'):
+                finished_jobs[job_id] = job
+                pending.discard(job_id)
+        if pending:
+            time.sleep(0.5)
+    return finished_jobs
+
+
+def run_load_test(args):
+    """
+    This function will post the events at the {args.rate} events per second, wait for the compliance check jobs to
+    finish, and return the benchmark report
+    :param args: the command line arguments
+    :return: the report
+    """
+    if args.events:
+        events = load_events(args.events)
+        if not events:
+            sys.exit('No events found in the file: ' + args.events)
+    else:
+        events = [synthetic_event(args.dnac or '127.0.0.1:9443', '10.0.%d.%d' % (index // 256, index % 256))
+                  for index in range(args.devices)]
+    session = requests.Session()
+    session.auth = HTTPBasicAuth(args.username, args.password)
+    stats_before = {name: get_stats(url) for name, url in (('dnac', args.dnac_url), ('webex', args.webex_url)) if url}
+
+    results = []
+    results_lock = threading.Lock()
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix='load-test') as executor:
+        for index in range(args.count):
+            event = json.loads(json.dumps(events[index % len(events)]))
+            # new instance ids, the receiver will not ignore the replayed events as duplicates
+            event['instanceId'] = str(uuid.uuid4())
+            if args.dnac:
+                event['dnacIP'] = args.dnac
+            delay = start_time + index / args.rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(post_event, session, args.receiver, event, results, results_lock)
+    post_duration = time.time() - start_time
+
+    job_results = {result['job_id']: result for result in results if result.get('job_id') and not result['coalesced']}
+    finished_jobs = wait_for_jobs(session, args.receiver, list(job_results), args.timeout)
+    duration = time.time() - start_time
+
+    e2e_latency = [job['finished'] - job_results[job_id]['posted'] for job_id, job in finished_jobs.items()
+                   if job.get('finished')]
+    accept_latency = [result['accepted'] - result['posted'] for result in results]
+    report = {
+        'events': len(results),
+        'rate': args.rate,
+        'post_duration': round(post_duration, 1),
+        'duration': round(duration, 1),
+        'throughput': round(len(finished_jobs) / duration, 2),  # jobs finished per second
+        'accept_latency': {'p50': percentile(accept_latency, 50), 'p99': percentile(accept_latency, 99)},
+        'e2e_latency': {'p50': percentile(e2e_latency, 50), 'p99': percentile(e2e_latency, 99)},
+        'responses': {
+            'accepted': len(job_results),
+            'coalesced': sum(1 for result in results if result.get('coalesced')),
+            'ignored': sum(1 for result in results if result['status_code'] == 202 and not result.get('job_id')),
+            'rejected': sum(1 for result in results if result['status_code'] != 202)
+        },
+        'jobs': {
+            'completed': sum(1 for job in finished_jobs.values() if job['status'] == 'completed'),
+            'failed': sum(1 for job in finished_jobs.values() if job['status'] == 'failed'),
+            'not_finished': len(job_results) - len(finished_jobs)
+        },
+        'api_calls_per_event': {}
+    }
+    for name, url in (('dnac', args.dnac_url), ('webex', args.webex_url)):
+        if not url:
+            continue
+        stats_after = get_stats(url)
+        calls = {key: count - stats_before[name].get(key, 0) for key, count in stats_after.items()
+                 if count != stats_before[name].get(key, 0)}
+        report['api_calls_per_event'][name] = {key: round(count / len(results), 2) for key, count in sorted(calls.items())}
+        report['api_calls_per_event'][name]['total'] = round(sum(calls.values()) / len(results), 2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load benchmark for the compliance check receiver')
+    parser.add_argument('--receiver', default='https://127.0.0.1:5000', help='the receiver URL')
+    parser.add_argument('--username', default=os.getenv('WEBHOOK_USERNAME'))
+    parser.add_argument('--password', default=os.getenv('WEBHOOK_PASSWORD'))
+    parser.add_argument('--events', help='recorded events file, one JSON event for each line, default synthetic events')
+    parser.add_argument('--devices', type=int, default=50, help='number of devices for the synthetic events')
+    parser.add_argument('--dnac', help='replace the dnacIP of the events, for example the fake Cisco DNA Center '
+                                       '"127.0.0.1:9443"')
+    parser.add_argument('--rate', type=float, default=5.0, help='events per second')
+    parser.add_argument('--count', type=int, default=100, help='number of events to post')
+    parser.add_argument('--concurrency', type=int, default=32, help='max concurrent event posts')
+    parser.add_argument('--timeout', type=float, default=600, help='max time to wait for the jobs, seconds')
+    parser.add_argument('--dnac-url', help='the fake Cisco DNA Center URL, for the API call counters')
+    parser.add_argument('--webex-url', help='the fake Webex API URL, for the API call counters')
+    parser.add_argument('--output', help='save the report to a JSON file')
+    parser.add_argument('--max-p99', type=float, help='exit with an error if the end-to-end p99 latency is higher, '
+                                                       'seconds')
+    args = parser.parse_args()
+
+    report = run_load_test(args)
+    print(json.dumps(report, indent=4))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    p99 = report['e2e_latency']['p99']
+    if args.max_p99 is not None and (p99 is None or p99 > args.max_p99):
+        sys.exit('End-to-end p99 latency ' + str(p99) + ' seconds, higher than ' + str(args.max_p99) + ' seconds')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+# synthetic Cisco IOS XE configurations, for the fake Cisco DNA Center Command Runner files and the benchmarks
+
+import random
+
+
+def generate_config(lines, hostname='bench-router', seed=0):
+    """
+    This function will create a synthetic IOS XE running configuration, with about {lines} lines: interfaces,
+    access lists, route maps, BGP neighbors and the usual global config lines
+    :param lines: the number of config lines
+    :param hostname: the device hostname
+    :param seed: the random seed, the same seed will create the same configuration
+    :return: the configuration text, starting with the "version" line
+    """
+    rng = random.Random(seed)
+    config = ['version 17.3', 'service timestamps debug datetime msec', 'service timestamps log datetime msec',
+              'service password-encryption', 'platform qfp utilization monitor load 80', '!',
+              'hostname ' + hostname, '!', 'boot-start-marker', 'boot-end-marker', '!', 'vrf definition Mgmt-vrf',
+              ' address-family ipv4', ' exit-address-family', '!', 'no aaa new-model', 'ip domain name lab.local', '!']
+    sections = [_interface_section, _access_list_section, _route_map_section, _prefix_list_section]
+    index = 0
+    # the BGP neighbors are added at the end, about 10% of the config
+    body_lines = lines - len(config) - lines // 10 - 10
+    while len(config) < body_lines:
+        config.extend(sections[index % len(sections)](index, rng))
+        config.append('!')
+        index += 1
+    config.extend(['router bgp 65001', ' bgp log-neighbor-changes'])
+    neighbor = 0
+    while len(config) < lines - 8:
+        address = '10.%d.%d.%d' % (100 + neighbor // 65536 % 100, neighbor // 256 % 256, neighbor % 256)
+        config.append(' neighbor ' + address + ' remote-as ' + str(65002 + neighbor % 1000))
+        config.append(' neighbor ' + address + ' description peer-' + str(neighbor))
+        neighbor += 1
+    config.extend(['!', 'line con 0', ' stopbits 1', 'line vty 0 4', ' login local', ' transport input ssh', '!',
+                   'end'])
+    return '\n'.join(config) + '\n'
+
+
+def drift_config(config, ratio, seed=0):
+    """
+    This function will change about {ratio} of the {config} lines: lines removed, lines added and lines changed.
+    The first lines, to the hostname, and the "end" line are not changed
+    :param config: the configuration text
+    :param ratio: the ratio of the changed lines, for example 0.01 for 1%
+    :param seed: the random seed
+    :return: the changed configuration text
+    """
+    rng = random.Random(seed)
+    lines = config.splitlines()
+    first_line = lines.index(next(line for line in lines if line.startswith('hostname '))) + 1
+    changes = max(1, int(len(lines) * ratio))
+    positions = sorted(rng.sample(range(first_line, len(lines) - 1), min(changes, len(lines) - 1 - first_line)),
+                       reverse=True)
+    for count, position in enumerate(positions):
+        line = lines[position]
+        change = count % 3
+        if line in ('!', '') or change == 0:
+            indent = ' ' if line.startswith(' ') else ''
+            lines.insert(position, indent + 'logging host 192.0.2.' + str(count % 250 + 1) + ' transport udp port ' +
+                         str(1024 + count))
+        elif change == 1:
+            del lines[position]
+        else:
+            lines[position] = line + ' drift-' + str(count)
+    return '\n'.join(lines) + '\n'
+
+
+def _interface_section(index, rng):
+    """
+    Return the config lines for an interface
+    """
+    return ['interface GigabitEthernet1/0/' + str(index), ' description link-' + str(rng.randint(1, 100000)),
+            ' switchport access vlan ' + str(rng.randint(2, 4000)), ' switchport mode access',
+            ' ip access-group ACL-' + str(index % 50) + ' in', ' spanning-tree portfast',
+            ' service-policy input POLICY-IN']
+
+
+def _access_list_section(index, rng):
+    """
+    Return the config lines for an extended access list
+    """
+    section = ['ip access-list extended ACL-' + str(index)]
+    for entry in range(rng.randint(4, 12)):
+        section.append(' ' + str((entry + 1) * 10) + ' permit tcp 10.' + str(rng.randint(0, 255)) + '.' +
+                       str(rng.randint(0, 255)) + '.0 0.0.0.255 any eq ' + str(rng.choice([22, 80, 443, 8443])))
+    return section
+
+
+def _route_map_section(index, rng):
+    """
+    Return the config lines for a route map
+    """
+    return ['route-map RM-' + str(index) + ' permit 10', ' match ip address prefix-list PL-' + str(index),
+            ' set local-preference ' + str(rng.randint(100, 300)), ' set community 65001:' + str(index)]
+
+
+def _prefix_list_section(index, rng):
+    """
+    Return the config lines for a prefix list
+    """
+    return ['ip prefix-list PL-' + str(index) + ' seq ' + str((entry + 1) * 5) + ' permit 172.' +
+            str(rng.randint(16, 31)) + '.' + str(rng.randint(0, 255)) + '.0/24' for entry in range(rng.randint(2, 6))]
@@ -24,34 +24,54 @@ __license__ = "Cisco Sample Code License, Version 1.1"
 import os
 import time
 import urllib3
-import json
-import difflib
 import webex_apis
-import yaml
+import config_diff
+import dnac_apis
+import job_queue
+import job_store
+import artifact_store
+import ansible_playbook
+import config_store
+import event_log
+import workflow_engine
+import asyncio
+import datetime
+import hashlib
+import zlib
 import logging
+import app_logging
+import metrics
+import tracing
 
-from flask import Flask, request, send_from_directory
+from flask import Flask, request, jsonify, Response
 from flask_basicauth import BasicAuth
-from requests.auth import HTTPBasicAuth  # for Basic Auth
 from urllib3.exceptions import InsecureRequestWarning  # for insecure https warnings
 from dotenv import load_dotenv
-from dnacentersdk import DNACenterAPI
 
 urllib3.disable_warnings(InsecureRequestWarning)  # disable insecure https warnings
 
 load_dotenv('environment.env')
 
+logger = logging.getLogger(__name__)
+
+# logging, to the file {application_run.log} and the console, configured once at startup
+app_logging.setup_logging()
+
 WEBHOOK_USERNAME = os.getenv('WEBHOOK_USERNAME')
 WEBHOOK_PASSWORD = os.getenv('WEBHOOK_PASSWORD')
 
-DNAC_URL = os.getenv('DNAC_URL')
-DNAC_USER = os.getenv('DNAC_USER')
-DNAC_PASS = os.getenv('DNAC_PASS')
-
 WEBEX_BOT_AUTH = os.getenv('WEBHOOKD_BOT_AUTH')
 WEBEX_URL = os.getenv('WEBEX_URL')
 WEBEX_ROOM = os.getenv('WEBHOOKD_ROOM')
 
+# optional wait before the device sync, for the Cisco DNA Center config compliance timer, seconds
+COMPLIANCE_TIMER_WAIT = int(os.getenv('COMPLIANCE_TIMER_WAIT', '0'))
+
+TLS_CERT_FILE = os.getenv('TLS_CERT_FILE')  # the server certificate, a self-signed certificate is used if not set
+TLS_KEY_FILE = os.getenv('TLS_KEY_FILE')
+# start the job workers when the module is loaded, False when the workers are started after fork by the WSGI server
+JOB_WORKERS_AUTOSTART = os.getenv('JOB_WORKERS_AUTOSTART', 'True').lower() == 'true'
+
 os.environ['TZ'] = 'America/Los_Angeles'  # define the timezone for PST
 time.tzset()  # adjust the timezone, more info https://help.pythonanywhere.com/pages/SettingTheTimezone/
 
@@ -63,92 +83,144 @@ app.config['BASIC_AUTH_PASSWORD'] = WEBHOOK_PASSWORD
 
 basic_auth = BasicAuth(app)
 
-DNAC_AUTH = HTTPBasicAuth(DNAC_USER, DNAC_PASS)
 
-
-def pprint(json_data):
+def validate_notification(webhook_json):
     """
-    Pretty print JSON formatted data
-    :param json_data: data to pretty print
-    :return None
+    This function will verify the event notification includes the fields required by the compliance workflow
+    :param webhook_json: the event notification
+    :return: the validation error, or None if the notification is valid
     """
-    print(json.dumps(json_data, indent=4, separators=(' , ', ' : ')))
-
-
-def time_sleep(time_sec):
+    if not isinstance(webhook_json, dict):
+        return 'payload is not a JSON object'
+    for key in ['dnacIP', 'eventId', 'ciscoDnaEventLink', 'details']:
+        if not webhook_json.get(key):
+            return 'missing field: ' + key
+    details = webhook_json['details']
+    if not isinstance(details, dict):
+        return 'details is not a JSON object'
+    for key in ['Assurance Issue Status', 'Assurance Issue Details', 'Device']:
+        if not details.get(key):
+            return 'missing field: details/' + key
+    return None
+
+
+def parse_time(value):
     """
-    This function will wait for the specified time_sec, while printing a progress bar, one '!' / second
-    Sample Output :
-    Wait for 10 seconds
-    !!!!!!!!!!
-    :param time_sec: time, in seconds
-    :return: none
+    This function will convert the time {value} to epoch seconds
+    :param value: the time, epoch seconds or ISO 8601 format, for example "2021-09-27T10:22:35-07:00"
+    :return: the time in epoch seconds
     """
-    print('\nWait for ' + str(time_sec) + ' seconds')
-    for i in range(time_sec):
-        print('!', end='')
-        time.sleep(1)
-    return
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
 
 
-def compare_configs(cfg1, cfg2):
+def create_ansible_playbook(cli_template):
     """
-    This function, using the unified diff function, will compare two config files and identify the changes.
-    '+' or '-' will be prepended in front of the lines with changes
-    :param cfg1: old configuration file path and filename
-    :param cfg2: new configuration file path and filename
-    :return: text with the configuration lines that changed. The return will include the configuration for the sections
-    that include the changes
+    This function will create the Ansible playbook to remediate the configuration drift, from the "project.yml"
+    playbook, with the {cli_template}. The "project.yml" playbook is parsed once, and cached
+    :param cli_template: the CLI commands to be deployed
+    :return: the Ansible playbook text
     """
+    return ansible_playbook.create_playbook(cli_template)
 
-    # open the old and new configuration files
-    f1 = open(cfg1, 'r')
-    old_cfg = f1.readlines()
-    f1.close()
-
-    f2 = open(cfg2, 'r')
-    new_cfg = f2.readlines()
-    f2.close()
-
-    # compare the two specified config files {cfg1} and {cfg2}
-    d = difflib.unified_diff(old_cfg, new_cfg, n=9)
-
-    # create a diff_list that will include all the lines that changed
-    # create a diff_output string that will collect the generator output from the unified_diff function
-    diff_list = []
-    diff_output = ''
-
-    for line in d:
-        diff_output += line
-        if line.find('xxxx') == -1:
-            if line.find('quit') == -1:
-                if (line.find('+++') == -1) and (line.find('---') == -1):
-                    if (line.find('-!') == -1) and (line.find('+!') == -1):
-                        if line.startswith('+'):
-                            diff_list.append('\n' + line)
-                        elif line.startswith('-'):
-                            diff_list.append('\n' + line)
-
-    # process the diff_output to select only the sections between '!' characters for the sections that changed,
-    # replace the empty '+' or '-' lines with space
-    diff_output = diff_output.replace('+!', '!')
-    diff_output = diff_output.replace('-!', '!')
-    diff_output_list = diff_output.split('!')
-
-    all_changes = []
-
-    for changes in diff_list:
-        for config_changes in diff_output_list:
-            if changes in config_changes:
-                if config_changes not in all_changes:
-                    all_changes.append(config_changes)
-
-    # create a config_text string with all the sections that include changes
-    config_text = ''
-    for items in all_changes:
-        config_text += items
 
-    return config_text
+async def collect_device_configs(dnac_api, device_id, tasks=None, on_task=None):
+    """
+    This function will collect the running config and startup config for the device with the {device_id}.
+    The running config is reused from the snapshot store if the "Last configuration change" and "NVRAM config last
+    updated" times reported by the device are not changed, the header lines are collected with a short "show
+    running-config | include" command. The startup config is reused if the "NVRAM config last updated" time is not
+    changed. The configs not reused are collected together, with one more Command Runner task, the configs are
+    collected with one task if the running config was not saved before.
+    The snapshot store calls are executed by the workflow engine executor, they read and write files
+    :param dnac_api: Cisco DNA Center client
+    :param device_id: the device id
+    :param tasks: optional dict, commands -> the Command Runner task id started before a restart
+    :param on_task: optional function called with the commands and the task id, when a Command Runner task is started
+    :return: tuple, the running config snapshot and the startup config snapshot
+    """
+    async def run_commands(commands):
+        commands_key = ', '.join(commands)
+        return await dnac_apis.run_read_only_commands_async(
+            dnac_api, device_id, commands, task_id=(tasks or {}).get(commands_key),
+            on_task=lambda task_id: on_task(commands_key, task_id) if on_task else None)
+
+    running_config = await workflow_engine.run_blocking(config_store.get_snapshot, device_id, 'running')
+    if running_config is not None and running_config['timestamp'] is None:
+        running_config = None
+    startup_config = await workflow_engine.run_blocking(config_store.get_snapshot, device_id, 'startup')
+    if startup_config is not None and startup_config['timestamp'] is None:
+        startup_config = None
+
+    commands = []
+    command_responses = {}
+    if running_config is None:
+        startup_config = None
+    else:
+        # the snapshots are validated with the config timestamps, collected with the startup config if not saved
+        timestamp_commands = [config_store.CONFIG_TIMESTAMP_COMMAND]
+        if startup_config is None:
+            timestamp_commands.append('show startup-config')
+        commands.extend(timestamp_commands)
+        command_responses = await run_commands(timestamp_commands)
+        config_timestamps = command_responses[config_store.CONFIG_TIMESTAMP_COMMAND]
+        nvram_timestamp = config_store.nvram_timestamp(config_timestamps)
+        if (config_store.last_change_timestamp(config_timestamps) != running_config['timestamp'] or
+                nvram_timestamp != running_config['nvram_timestamp']):
+            running_config = None
+        # the startup config was saved since the snapshot
+        if startup_config is not None and startup_config['timestamp'] != nvram_timestamp:
+            startup_config = None
+
+    # the configs not reused are collected with one Command Runner task
+    config_commands = [command for command, snapshot in (('show running-config', running_config),
+                                                          ('show startup-config', startup_config))
+                       if snapshot is None and command not in command_responses]
+    if config_commands:
+        commands.extend(config_commands)
+        command_responses.update(await run_commands(config_commands))
+
+    if running_config is None:
+        show_run_file_content = command_responses['show running-config']
+        running_config = await workflow_engine.run_blocking(
+            config_store.put_snapshot, device_id, 'running',
+            config_diff.strip_config_header(show_run_file_content, 'show running-config'),
+            timestamp=config_store.last_change_timestamp(show_run_file_content),
+            nvram_timestamp=config_store.nvram_timestamp(show_run_file_content))
+    if startup_config is None:
+        startup_config = await workflow_engine.run_blocking(
+            config_store.put_snapshot, device_id, 'startup',
+            config_diff.strip_config_header(command_responses['show startup-config'], 'show startup-config'),
+            timestamp=running_config['nvram_timestamp'])
+    logger.info('The running config and startup config have been collected, commands sent: %s', ', '.join(commands))
+    return running_config, startup_config
+
+
+def post_coalesced_events(job, events):
+    """
+    This function will post the event notifications coalesced with the {job} to the job Webex thread
+    :param job: the job record
+    :param events: list of the event notifications
+    :return: none
+    """
+    if not events:
+        return
+    room_id = webex_apis.get_room_id(WEBEX_ROOM)
+    dnac_ip = job['payload'].get('dnacIP')
+    for event in events:
+        message = {
+            "roomId": room_id,
+            "parentId": job['message_id'],
+            "markdown": "Related notification received, the compliance check is shared with this notification\n" +
+                        "- Assurance Issue Details: " + event['details']['Assurance Issue Details'] + "\n" +
+                        "- Event Id: " + event['eventId'] + "\n" +
+                        "- [Cisco DNA Center Issue Details](" + event['ciscoDnaEventLink'] + ")"
+        }
+        with metrics.time_step('webex coalesced event', dnac_ip):
+            webex_apis.post_room_card_message(WEBEX_ROOM, message)
+    logger.info('Coalesced notifications posted: %s', len(events))
 
 
 @app.route('/')  # create a decorator for testing the Flask framework
@@ -160,62 +232,100 @@ def index():
 @app.route('/compliance_check', methods=['POST'])  # API endpoint to receive the compliance event notifications
 @basic_auth.required
 def compliance_check():
-
-    # logging, debug level, to file {application_run.log}
-    logging.basicConfig(
-        filename='application_run.log',
-        level=logging.DEBUG,
-        format='%(asctime)s.%(msecs)03d %(levelname)s %(module)s - %(funcName)s: %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S')
-
     if request.method == 'POST':
-        print('Webhook Received')
-        webhook_json = request.json
+        logger.info('Webhook Received')
+        webhook_json = request.get_json(silent=True)
+
+        # log the received notification
+        logger.debug('Payload: %s', webhook_json)
 
-        # save to a file, create new file if not existing, append to existing file
-        with open('compliance_check_data.log', 'a') as filehandle:
-            filehandle.write('%s\n' % json.dumps(webhook_json))
+        validation_error = validate_notification(webhook_json)
+        if validation_error:
+            logger.warning('Notification not valid: %s', validation_error)
+            metrics.count_event(None, 'rejected')
+            return 'Notification Not Valid, ' + validation_error, 400
 
-        # print the received notification
-        print('Payload: ')
-        print(webhook_json, '\n')
+        # save to the event log, the events are written in batches by a background thread
+        event_log.append_event(webhook_json)
+        dnac_ip = webhook_json['dnacIP']
+        metrics.count_event(dnac_ip, 'received')
 
         # check if a new open issue, ignore if an resolved issue notification
         issue_status = webhook_json['details']['Assurance Issue Status']
         if issue_status == 'resolved':
+            metrics.count_event(dnac_ip, 'resolved')
             return 'Notification Received', 202
 
-        # identify the Cisco DNA Center reporting the issue
-        dnac_ip = webhook_json['dnacIP']
-        dnac_url = 'https://' + dnac_ip
+        # the notifications for the same device will share one compliance check workflow
+        coalesce_key = (webhook_json['dnacIP'], webhook_json['details']['Device'])
+        job, coalesced = job_queue.submit_job(webhook_json, coalesce_key)
+        if job is None:
+            logger.warning('Job queue full, notification not accepted')
+            metrics.count_event(dnac_ip, 'rejected')
+            return 'Job Queue Full, Retry Later', 503
+        if coalesced:
+            metrics.count_event(dnac_ip, 'deduped')
+            primary_job_id = job['coalesced_into'] or job['id']
+            logger.info('Notification coalesced with Job Id: %s', primary_job_id)
+            return 'Notification Received, coalesced with Job Id: ' + primary_job_id, 202
+        logger.info('Compliance check job queued, Job Id: %s', job['id'])
+        return 'Notification Received, Job Id: ' + job['id'], 202
+    else:
+        return 'Method not supported', 405
+
+
+async def compliance_workflow(job):
+    """
+    This function will execute the compliance check workflow for the event notification in the {job}.
+    It is executed on the workflow engine event loop, outside of the webhook request. The workflow steps are executed
+    as soon as the steps they depend on are completed, for example the device details are collected while the
+    notification message is posted, and the compliance check starts right after the device lookup
+    :param job: the job record, with the event notification as the payload
+    :return: none
+    """
+    webhook_json = job['payload']
+
+    # the notification was received after the workflow for the same device finished, post to the workflow thread
+    if job['coalesced_into']:
+        await workflow_engine.run_blocking(post_coalesced_events, job, [webhook_json])
+        return
+
+    # identify the Cisco DNA Center reporting the issue
+    dnac_ip = webhook_json['dnacIP']
 
-        # create a DNACenterAPI "Connection Object"
-        dnac_api = DNACenterAPI(username=DNAC_USER, password=DNAC_PASS, base_url=dnac_url, version='2.2.2.3', verify=False)
+    # identify what type of event notification was received
+    event_id = webhook_json['eventId']
+    logger.info('Event Id: %s', event_id)
 
-        # identify what type of event notification was received
-        event_id = webhook_json['eventId']
-        print('\nEvent Id:', event_id)
+    # identify the event details
+    event_details = webhook_json['details']['Assurance Issue Details']
+    logger.info('Event Details: %s', event_details)
+    logger.info('Cisco DNA Center Reporting the issue: %s', dnac_ip)
+    event_link = webhook_json['ciscoDnaEventLink']
 
-        # identify the event details
-        event_details = webhook_json['details']['Assurance Issue Details']
-        print('Event Details:', event_details)
-        print('Cisco DNA Center Reporting the issue:', dnac_ip)
-        event_link = webhook_json['ciscoDnaEventLink']
+    # parse the payload for the event, and select device info
+    device_management_ip = webhook_json['details']['Device']
+    logger.info('Device Management IP Address: %s', device_management_ip)
 
-        # parse the payload for the event, and select device info
-        device_management_ip = webhook_json['details']['Device']
-        print('Device Management IP Address:', device_management_ip)
-        device_info = dnac_api.devices.get_network_device_by_ip(ip_address=device_management_ip)
+    # the DNACenterAPI "Connection Object", shared by all the jobs for this Cisco DNA Center
+    dnac_api = await workflow_engine.run_blocking(dnac_apis.get_dnac_api, dnac_ip)
+
+    def get_device(results):
+        with metrics.time_step('device lookup', dnac_ip):
+            device_info = dnac_api.devices.get_network_device_by_ip(ip_address=device_management_ip)
         device_hostname = device_info['response']['hostname']
-        print('Device Hostname:', device_hostname)
+        logger.info('Device Hostname: %s', device_hostname)
         device_id = device_info['response']['id']
-        print('Device Id:', device_id)
+        logger.info('Device Id: %s', device_id)
+        return {'hostname': device_hostname, 'id': device_id}
 
-        # post message to Webex Room
-        room_id = webex_apis.get_room_id(WEBEX_ROOM)
+    def get_room(results):
+        return webex_apis.get_room_id(WEBEX_ROOM)
 
+    def post_notification_message(results):
+        # post message to Webex Room
         card_message = {
-            "roomId": room_id,
+            "roomId": results['room'],
             "parentId": None,
             "markdown": "Cisco DNA Center Notification",
             "attachments": [
@@ -241,7 +351,7 @@ def compliance_check():
                                     },
                                     {
                                         "title": "Device Hostname:",
-                                        "value": device_hostname
+                                        "value": results['device']['hostname']
                                     },
                                     {
                                         "title": "Device Management IP:",
@@ -266,29 +376,33 @@ def compliance_check():
             ]
         }
 
-        response = webex_apis.post_room_card_message(WEBEX_ROOM, card_message)
+        with metrics.time_step('webex notification message', dnac_ip):
+            response = webex_apis.post_room_card_message(WEBEX_ROOM, card_message)
         response_json = response.json()
         message_id = response_json['id']
+        job_queue.update_job(job, message_id=message_id)
+        post_coalesced_events(job, job_queue.pop_attached_events(job))
 
-        print('\nCisco DNA Center notification message posted')
+        logger.info('Cisco DNA Center notification message posted')
+        return message_id
 
+    def get_device_detail(results):
         # collect device detail info
-        device_detail_response = dnac_api.devices.get_device_detail(identifier='uuid', search_by=device_id)
+        device_id = results['device']['id']
+        with metrics.time_step('device detail', dnac_ip):
+            device_detail_response = dnac_api.devices.get_device_detail(identifier='uuid', search_by=device_id)
         device_detail_json = device_detail_response['response']
-        device_sn = device_detail_json['serialNumber']
-        device_os_version = device_detail_json['softwareVersion']
-        device_family = device_detail_json['platformId']
-        device_location = device_detail_json['location']
-
-        print('\nDevice Family:', device_family)
-        print('Device OS Version:', device_os_version)
-        print('Device Serial Number:', device_sn)
-        print('Device Location:', device_location)
-
-        time.sleep(1)
+        logger.info('Device Family: %s', device_detail_json['platformId'])
+        logger.info('Device OS Version: %s', device_detail_json['softwareVersion'])
+        logger.info('Device Serial Number: %s', device_detail_json['serialNumber'])
+        logger.info('Device Location: %s', device_detail_json['location'])
+        return device_detail_json
+
+    def post_device_detail_message(results):
+        device_detail_json = results['device detail']
         card_message = {
-            "roomId": room_id,
-            "parentId": message_id,
+            "roomId": results['room'],
+            "parentId": results['notification message'],
             "markdown": "Device Details",
             "attachments": [
                 {
@@ -308,19 +422,19 @@ def compliance_check():
                                 "facts": [
                                     {
                                         "title": "Family:",
-                                        "value": device_family
+                                        "value": device_detail_json['platformId']
                                     },
                                     {
                                         "title": "Serial Number:",
-                                        "value": device_sn
+                                        "value": device_detail_json['serialNumber']
                                     },
                                     {
                                         "title": "OS Version:",
-                                        "value": device_os_version
+                                        "value": device_detail_json['softwareVersion']
                                     },
                                     {
                                         "title": "Location",
-                                        "value": device_location
+                                        "value": device_detail_json['location']
                                     }
                                 ]
                             },
@@ -334,7 +448,7 @@ def compliance_check():
                             {
                                 "type": "Action.openURL",
                                 "title": "Device 360 View",
-                                "url": 'https://10.93.141.45/dna/assurance/device/details?id=' + device_id
+                                "url": 'https://10.93.141.45/dna/assurance/device/details?id=' + results['device']['id']
                             }
                         ]
                     }
@@ -342,43 +456,46 @@ def compliance_check():
             ]
         }
 
-        response = webex_apis.post_room_card_message(WEBEX_ROOM, card_message)
-
-        print('\nDevice Details message posted\nWait for Config Compliance timer')
-        time_sleep(180)
-
-        # re-sync device
-        resync = dnac_api.devices.sync_devices_using_forcesync(force_sync=True, payload=[device_id])
-        print('\n\nDevice re-sync started, wait for re-sync to complete')
-        time_sleep(180)
-
-        # check compliance
-        run_compliance = dnac_api.compliance.run_compliance(deviceUuids=[device_id])
-        compliance_task_id = run_compliance['response']['taskId']
-        print('\n\nCompliance Task Id:', compliance_task_id)
-
-        # wait for 30 seconds for compliance checks to complete
-        time_sleep(30)
-
-        # check task by id
-        task_info = dnac_api.task.get_task_by_id(task_id=compliance_task_id)
-        task_result = task_info['response']['progress']
-        print('\n\nCompliance check status:', task_result)
+        with metrics.time_step('webex device detail message', dnac_ip):
+            webex_apis.post_room_card_message(WEBEX_ROOM, card_message)
+        logger.info('Device Details message posted')
+
+    async def check_compliance(results):
+        if COMPLIANCE_TIMER_WAIT:
+            logger.info('Wait for Config Compliance timer')
+            await asyncio.sleep(COMPLIANCE_TIMER_WAIT)
+
+        # re-sync device and check compliance, the devices are batched with the devices from the other notifications.
+        # The batch task ids are saved in the job state, the job will wait for the same tasks after a restart
+        device_id = results['device']['id']
+        tasks = job['state']['tasks']
+
+        def on_task(task_name, task_id):
+            job_queue.update_job_state(job, task_name, task_id, 'tasks')
+
+        if 'device sync' in tasks:
+            logger.info('Device re-sync and compliance check resumed')
+            compliance_info_json = (await dnac_apis.run_compliance_batch_async(
+                dnac_ip, [device_id], tasks, on_task)).get(device_id, [])
+        else:
+            logger.info('Device re-sync and compliance check started')
+            compliance_future = dnac_apis.submit_compliance_batch(dnac_ip, device_id, on_task)
+            compliance_info_json = await asyncio.wrap_future(compliance_future)
+        compliance_checks = {}
+        for check in compliance_info_json:
+            logger.info('Compliance Type: %s, Status: %s', check['complianceType'], check['status'])
+            compliance_checks.update({check['complianceType']: check})
+        return compliance_checks
 
-        # retrieve the compliance status
-        compliance_info = dnac_api.compliance.compliance_details_of_device(device_uuid=device_id)
-        compliance_info_json = compliance_info['response']
-        compliance_status = {}
+    def post_compliance_message(results):
         facts = []  # to be used for the adaptive cards message
-        for check in compliance_info_json:
-            print('Compliance Type:', check['complianceType'], ', Status:', check['status'])
-            compliance_status.update({check['complianceType']: check['status']})
+        for check in results['compliance check'].values():
             facts.append({'title': check['complianceType'], 'value': check['status']})
 
         # update Webex room with compliance result
         card_message = {
-            "roomId": room_id,
-            "parentId": message_id,
+            "roomId": results['room'],
+            "parentId": results['notification message'],
             "markdown": "Device Compliance",
             "attachments": [
                 {
@@ -402,221 +519,341 @@ def compliance_check():
                             {
                                 "type": "Action.openURL",
                                 "title": "Device Compliance",
-                                "url": 'https://10.93.141.45/dna/provision/devices/inventory/device-details?deviceId=' + device_id + '&defaultTab=Summary'
+                                "url": 'https://10.93.141.45/dna/provision/devices/inventory/device-details?deviceId=' + results['device']['id'] + '&defaultTab=Summary'
                             }
                         ]
                     }
                 }
             ]
         }
-        response = webex_apis.post_room_card_message(WEBEX_ROOM, card_message)
+        with metrics.time_step('webex compliance message', dnac_ip):
+            webex_apis.post_room_card_message(WEBEX_ROOM, card_message)
 
-        print('\nCompliance Status message posted')
+        logger.info('Compliance Status message posted')
 
+    def is_non_compliant(results):
         # check config compliance state
-        if compliance_status['RUNNING_CONFIG'] == 'NON_COMPLIANT':
-            # trigger workflow to identify what has changed
-
-            # send command runner API for "show run" and "show start"
-            show_run_result = dnac_api.command_runner.run_read_only_commands_on_devices(deviceUuids=[device_id], commands=['show running-config'])
-            show_run_task_id = show_run_result['response']['taskId']
-            time.sleep(5)  # for pacing the API calls
-            show_start_result = dnac_api.command_runner.run_read_only_commands_on_devices(deviceUuids=[device_id], commands=['show startup-config'])
-            show_start_task_id = show_start_result['response']['taskId']
-
-            # wait for Command Runner APIs to execute
-            print('\nWait for Command Runner APIs tasks to complete')
-            time_sleep(30)
-
-            # collect the show running output file
-            show_run_task_result = dnac_api.task.get_task_by_id(task_id=show_run_task_id)
-            show_run_file_info = show_run_task_result['response']['progress']
-            show_run_file_id = json.loads(show_run_file_info)['fileId']
-            print('\n\nThe show running file id:', show_run_file_id)
-
-            show_run_file_result = dnac_api.file.download_a_file_by_fileid(file_id=show_run_file_id, save_file=False)
-            # the function will return data encoded using
-            # <https://urllib3.readthedocs.io/en/latest/reference/urllib3.response.html>
-
-            # retrieve the running config
-            show_run_file_json = json.loads(show_run_file_result.data.decode('utf-8'))
-            show_run_file_content = show_run_file_json[0]['commandResponses']['SUCCESS']['show running-config'].replace('show running-config','')
-
-            # remove all the config lines before version
-            show_run_file_updated = show_run_file_content.split('version')[1]
-
-            # save the running config to file
-            run_file = device_hostname + '_run.txt'
-            f_temp = open(run_file, 'w')
-            f_temp.write(show_run_file_updated)
-            f_temp.seek(0)  # reset the file pointer to 0
-            f_temp.close()
-
-            # collect the show startup-config output file
-            show_start_task_result = dnac_api.task.get_task_by_id(task_id=show_start_task_id)
-            show_start_file_info = show_start_task_result['response']['progress']
-            show_start_file_id = json.loads(show_start_file_info)['fileId']
-            print('The show startup-config file id:', show_start_file_id)
-
-            show_start_file_result = dnac_api.file.download_a_file_by_fileid(file_id=show_start_file_id, save_file=False)
-            # the function will return data encoded using
-            # <https://urllib3.readthedocs.io/en/latest/reference/urllib3.response.html>
-
-            # retrieve the startup config
-            show_start_file_json = json.loads(show_start_file_result.data.decode('utf-8'))
-            show_start_file_content = show_start_file_json[0]['commandResponses']['SUCCESS']['show startup-config'].replace(
-                'show startup-config', '')
-
-            # remove all the config lines before version
-            show_start_file_updated = show_start_file_content.split('version')[1]
-
-            # save the startup config to file
-            start_file = device_hostname + '_start.txt'
-            f_temp = open(start_file, 'w')
-            f_temp.write(show_start_file_updated)
-            f_temp.seek(0)  # reset the file pointer to 0
-            f_temp.close()
-
-            print('The running config and startup config have been collected and saved to files')
-
-            # check for the config diff
-            diff_result = compare_configs(start_file, run_file)
-            print('\n\nThe Config Diff:\n', diff_result)
-
-            # save the diff to file
-            diff_file = device_hostname + '_diff.txt'
-            f_temp = open(diff_file, 'w')
-            f_temp.write(diff_result)
-            f_temp.seek(0)  # reset the file pointer to 0
-            f_temp.close()
-
-            body = [
-                {
-                    "type": "TextBlock",
-                    "text": "Device Configuration Changes",
-                    "weight": "bolder"
-                },
-                {
-                    "type": "TextBlock",
-                    "wrap": True,
-                    "text": "There are differences between the \nRunning Configuration and Start Configuration."
-                },
-                {
-                    "type": "TextBlock",
-                    "wrap": True,
-                    "text": "Lines marked wth '+' have been added to the Running Configuration, \nLines marked with '-' have been removed from the Running Configuration"
-                }
-            ]
+        running_config_check = results['compliance check'].get('RUNNING_CONFIG')
+        return running_config_check is not None and running_config_check['status'] == 'NON_COMPLIANT'
+
+    async def collect_configs(results):
+        if not is_non_compliant(results):
+            return None
+        # trigger workflow to identify what has changed
+
+        # collect the running config and startup config, the configs not changed since the last event are reused
+        logger.info('Collect the running config and startup config')
+        running_config, startup_config = await collect_device_configs(
+            dnac_api, results['device']['id'], tasks=job['state']['tasks'],
+            on_task=lambda commands, task_id: job_queue.update_job_state(job, commands, task_id, 'tasks'))
+
+        # save the running config and startup config to files, in the background
+        device_hostname = results['device']['hostname']
+        artifact_store.save_artifact(device_hostname + '_run.txt', running_config['config'])
+        artifact_store.save_artifact(device_hostname + '_start.txt', startup_config['config'])
+
+        logger.info('The running config and startup config have been collected')
+
+        # check for the config diff
+        def diff_configs(old_config, new_config):
+            # profile the large config diffs, if the profiler is enabled
+            with tracing.profile('config diff', new_config.count('\n')):
+                return config_diff.diff_configs(old_config, new_config)
+
+        with metrics.time_step('config diff', dnac_ip):
+            config_changes = await workflow_engine.run_blocking(config_store.get_diff, startup_config,
+                                                                running_config, diff_configs)
+            diff_result = config_diff.format_diff(config_changes)
+        logger.info('The Config Diff:\n%s', diff_result)
+
+        # save the diff to file, in the background
+        artifact_store.save_artifact(device_hostname + '_diff.txt', diff_result)
+        return config_changes
+
+    def post_config_diff_message(results):
+        config_changes = results['config diff']
+        if config_changes is None:
+            return
+        body = [
+            {
+                "type": "TextBlock",
+                "text": "Device Configuration Changes",
+                "weight": "bolder"
+            },
+            {
+                "type": "TextBlock",
+                "wrap": True,
+                "text": "There are differences between the \nRunning Configuration and Start Configuration."
+            },
+            {
+                "type": "TextBlock",
+                "wrap": True,
+                "text": "Lines marked wth '+' have been added to the Running Configuration, \nLines marked with '-' have been removed from the Running Configuration"
+            }
+        ]
 
-            # prepare the Webex message with diff config
+        # prepare the Webex message with diff config
 
-            diff_result_update_message = diff_result.replace("\n+", "\n'+'     ")
-            diff_result_update_final = diff_result_update_message.replace("\n-", "\n'-'     ")
+        diff_result_update_final = config_diff.format_diff(config_changes, "'+'     ", "'-'     ")
 
-            body.append({'type': 'TextBlock', 'text': diff_result_update_final, "wrap": True, "color": "attention"})
+        body.append({'type': 'TextBlock', 'text': diff_result_update_final, "wrap": True, "color": "attention"})
 
-            card_message = {
-                "roomId": room_id,
-                "parentId": message_id,
-                "markdown": "Device Configuration Changes",
-                "attachments": [
-                    {
-                        "contentType": "application/vnd.microsoft.card.adaptive",
-                        "content": {
-                            "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
-                            "type": "AdaptiveCard",
-                            "version": "1.0",
-                            "body": body
-                        }
+        card_message = {
+            "roomId": results['room'],
+            "parentId": results['notification message'],
+            "markdown": "Device Configuration Changes",
+            "attachments": [
+                {
+                    "contentType": "application/vnd.microsoft.card.adaptive",
+                    "content": {
+                        "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
+                        "type": "AdaptiveCard",
+                        "version": "1.0",
+                        "body": body
                     }
-                ]
-            }
-
-            response = webex_apis.post_room_card_message(WEBEX_ROOM, card_message)
+                }
+            ]
+        }
 
-            print('\nConfig Diff Webex message posted')
+        with metrics.time_step('webex config diff message', dnac_ip):
+            webex_apis.post_room_card_message(WEBEX_ROOM, card_message)
 
-            # prepare CLI templates
-            diff_result_update = diff_result.replace('\n+', '\nno')
-            diff_result_final = diff_result_update.replace('\n-', '\n')
+        logger.info('Config Diff Webex message posted')
 
-            print('\nRemediation CLI Template:\n', diff_result_final)
+    def post_ansible_playbook(results):
+        config_changes = results['config diff']
+        if config_changes is None:
+            return
+        device_hostname = results['device']['hostname']
+        message_id = results['notification message']
 
-            # create Ansible Playbook
-            source_file = "project.yml"
-            ansible_file = device_hostname + '.yml'
+        changed_lines = len(config_changes['added']) + len(config_changes['removed'])
+        with metrics.time_step('playbook', dnac_ip), tracing.profile('playbook', changed_lines):
+            # prepare CLI templates
+            diff_result_final = config_diff.remediation_cli(config_changes)
+
+            logger.info('Remediation CLI Template:\n%s', diff_result_final)
+
+            if ansible_playbook.PLAYBOOK_WINDOW:
+                # one playbook for all the devices with a config drift in the time window
+                ansible_playbook.add_window_device(device_hostname, dnac_ip, diff_result_final)
+            else:
+                # create Ansible Playbook
+                ansible_file = device_hostname + '.yml'
+                playbook = create_ansible_playbook(diff_result_final)
+        if ansible_playbook.PLAYBOOK_WINDOW:
+            message = {
+                "roomId": results['room'],
+                "parentId": message_id,
+                "markdown": "The remediation for this device will be included in the consolidated Ansible Playbook, "
+                            "posted in " + str(ansible_playbook.PLAYBOOK_WINDOW) + " seconds or less"
+            }
+            with metrics.time_step('webex playbook message', dnac_ip):
+                webex_apis.post_room_card_message(WEBEX_ROOM, message)
+            return
+        artifact_store.save_artifact(ansible_file, playbook)
 
-            with open(source_file) as file:
-                data_list = yaml.load(file, Loader=yaml.SafeLoader)
+        # upload the Ansible playbook file to Webex
+        card_message = {
+            "roomId": results['room'],
+            "parentId": message_id,
+            "markdown": "Ansible Playbook",
+            "attachments": [
+                {
+                    "contentType": "application/vnd.microsoft.card.adaptive",
+                    "content": {
+                        "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
+                        "type": "AdaptiveCard",
+                        "version": "1.0",
+                        "body": [
+                            {
+                                "type": "TextBlock",
+                                "text": "Ansible Playbook",
+                                "weight": "bolder"
+                            },
+                            {
+                                "type": "TextBlock",
+                                "wrap": True,
+                                "text": "Here is attached the Ansible Playbook to remediate the configuration drift"
+                            },
+                            {
+                                "type": "TextBlock",
+                                "wrap": True,
+                                "text": "Execute the attached file by using the command:\n"
+                            },
+                            {
+                                "type": "TextBlock",
+                                "wrap": True,
+                                "text": 'ansible-playbook -e "device_name=' + device_hostname + ' dnac_host=' + dnac_ip + '" ' + ansible_file
+                            }
+                        ]
+                    }
+                }
+            ]
+        }
 
-            data_dict = data_list[0]
-            data_dict['vars']['cli_template'] = diff_result_final
+        with metrics.time_step('webex playbook message', dnac_ip):
+            webex_apis.post_room_card_message(WEBEX_ROOM, card_message)
+        with metrics.time_step('webex playbook file', dnac_ip):
+            webex_apis.post_room_file(WEBEX_ROOM, ansible_file, 'text/plain', message_id, file_content=playbook)
+
+        logger.info('Ansible Playbook uploaded to Webex')
+
+    # the workflow steps, and the steps each of them depends on
+    workflow_steps = {
+        'device': (get_device, []),
+        'room': (get_room, []),
+        'notification message': (post_notification_message, ['device', 'room']),
+        'device detail': (get_device_detail, ['device']),
+        'device detail message': (post_device_detail_message, ['notification message', 'device detail']),
+        'compliance check': (check_compliance, ['device']),
+        'compliance message': (post_compliance_message, ['device detail message', 'compliance check']),
+        'config diff': (collect_configs, ['compliance check']),
+        'config diff message': (post_config_diff_message, ['compliance message', 'config diff']),
+        'ansible playbook': (post_ansible_playbook, ['config diff message'])
+    }
+    # the steps completed before a restart are not executed again, the step results are saved in the job state
+    await workflow_engine.run_dag(workflow_steps,
+                                  on_step=lambda running: job_queue.update_job(job, step=', '.join(running)),
+                                  results=job['state']['steps'],
+                                  on_result=lambda step, result: job_queue.update_job_state(job, step, result))
+
+    await workflow_engine.run_blocking(post_coalesced_events, job, job_queue.pop_attached_events(job))
+
+
+async def traced_compliance_workflow(job):
+    """
+    This function will execute the compliance check workflow for the {job}, in a trace if {TRACE_FILE} is configured.
+    The trace id is the notification instanceId, the trace includes the workflow steps, the Cisco DNA Center and the
+    Webex API calls
+    :param job: the job record, with the event notification as the payload
+    :return: none
+    """
+    webhook_json = job['payload']
+    with tracing.start_trace(webhook_json.get('instanceId'), 'compliance workflow', **{
+            'job.id': job['id'], 'dnac': webhook_json.get('dnacIP'), 'device': webhook_json['details'].get('Device'),
+            'event.id': webhook_json.get('eventId')}):
+        await compliance_workflow(job)
 
-            final_data = [data_dict]
 
-            with open(ansible_file, 'w') as file:
-                yaml.dump(final_data, file, default_flow_style=False)
+@app.route('/compliance_check_jobs', methods=['GET'])  # API endpoint to return the job queue and the jobs status
+@basic_auth.required
+def compliance_check_jobs():
+    queue_status = job_queue.get_queue_status()
+    queue_status['task_latency'] = dnac_apis.get_task_stats()
+    queue_status['webex_room_cache'] = webex_apis.get_room_cache_stats()
+    queue_status['config_snapshots'] = config_store.get_store_stats()
+    return jsonify(queue_status), 200
 
-            # upload the Ansible playbook file to Webex
-            card_message = {
-                "roomId": room_id,
-                "parentId": message_id,
-                "markdown": "Ansible Playbook",
-                "attachments": [
-                    {
-                        "contentType": "application/vnd.microsoft.card.adaptive",
-                        "content": {
-                            "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
-                            "type": "AdaptiveCard",
-                            "version": "1.0",
-                            "body": [
-                                {
-                                    "type": "TextBlock",
-                                    "text": "Ansible Playbook",
-                                    "weight": "bolder"
-                                },
-                                {
-                                    "type": "TextBlock",
-                                    "wrap": True,
-                                    "text": "Here is attached the Ansible Playbook to remediate the configuration drift"
-                                },
-                                {
-                                    "type": "TextBlock",
-                                    "wrap": True,
-                                    "text": "Execute the attached file by using the command:\n"
-                                },
-                                {
-                                    "type": "TextBlock",
-                                    "wrap": True,
-                                    "text": 'ansible-playbook -e "device_name=' + device_hostname + ' dnac_host=' + dnac_ip + '" ' + ansible_file
-                                }
-                            ]
-                        }
-                    }
-                ]
-            }
 
-            response = webex_apis.post_room_card_message(WEBEX_ROOM, card_message)
-            time.sleep(2)
-            response = webex_apis.post_room_file(WEBEX_ROOM, ansible_file, 'text/plain', message_id)
+@app.route('/compliance_check_jobs/<job_id>', methods=['GET'])  # API endpoint to return the status of one job
+@basic_auth.required
+def compliance_check_job(job_id):
+    job_status = job_queue.get_job(job_id)
+    if job_status is None:
+        return 'Job Not Found', 404
+    return jsonify(job_status), 200
 
-            print('\nAnsible Playbook uploaded to Webex')
 
-        return 'Notification Received', 202
-    else:
-        return 'Method not supported', 405
+@app.route('/metrics', methods=['GET'])  # API endpoint to return the Prometheus metrics
+@basic_auth.required
+def prometheus_metrics():
+    metrics_text, content_type = metrics.generate_metrics()
+    return Response(metrics_text, content_type=content_type)
 
 
 @app.route('/compliance_check_data', methods=['GET'])  # API endpoint to return the compliance check activity data, consumption by other apps
 @basic_auth.required
 def compliance_check_data():
-    print('File "compliance_check_data.log" requested, transfer started')
-    return send_from_directory('', 'compliance_check_data.log', as_attachment=True)
-
+    # optional filters, ?since={epoch seconds or ISO 8601 time}&device={device management IP}&eventId=...&limit=...
+    # and the cursor, ?cursor={the X-Next-Cursor header from the previous response}, to receive only the new events
+    try:
+        since = parse_time(request.args['since']) if request.args.get('since') else None
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+        cursor = int(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError as e:
+        return 'Query Not Valid, ' + str(e), 400
+    filters = {'since': since, 'device': request.args.get('device'), 'event_id': request.args.get('eventId'),
+               'limit': limit, 'after_seq': cursor}
+
+    # the ETag is calculated from the query and the events matching the query, the events are not read.
+    # The gzip and the identity responses have different bytes, the content coding is added to the ETag
+    compress = 'gzip' in request.accept_encodings
+    first_seq, last_seq = event_log.get_query_range(**filters)
+    etag = hashlib.sha1((request.query_string.decode('utf-8') + '|' + str(first_seq) + '|' +
+                         str(last_seq)).encode('utf-8')).hexdigest() + ('-gzip' if compress else '')
+    headers = {'ETag': '"' + etag + '"',
+               'X-Next-Cursor': str(last_seq if last_seq is not None else (cursor or 0)),
+               'Vary': 'Accept-Encoding'}
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    logger.info('Event log requested, transfer started')
+    events = event_log.query_events(**filters) if last_seq is not None else []
+    return Response(stream_events(events, last_seq, compress), mimetype='application/x-ndjson', headers=headers)
+
+
+def stream_events(events, last_seq, compress):
+    """
+    This function will return the {events} JSON lines in chunks of about 64 KB, gzip compressed if {compress}.
+    The events received after the event {last_seq} are not included, they will be returned for the next cursor
+    :param events: iterable of tuples, the event sequence number and the event JSON line
+    :param last_seq: the sequence number of the last event to return
+    :param compress: True to compress the response with gzip
+    :return: generator of the response chunks
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 for the gzip format
+    lines = []
+    lines_size = 0
+    for seq, line in events:
+        if seq > last_seq:
+            break
+        lines.append(line)
+        lines_size += len(line)
+        if lines_size >= 65536:
+            chunk = ''.join(lines).encode('utf-8')
+            lines = []
+            lines_size = 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    chunk = ''.join(lines).encode('utf-8')
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def start_job_workers():
+    """
+    This function will start the job workers, and resume the jobs not completed by the stopped processes.
+    With gunicorn, it is called in each worker process, after fork
+    :return: none
+    """
+    job_queue.start_workers(traced_compliance_workflow)
+    job_queue.resume_jobs()
 
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', debug=True, ssl_context='adhoc')
 
+def stop_job_workers(timeout):
+    """
+    This function will wait up to {timeout} seconds for the running jobs to complete, release the queued jobs, and
+    save the pending job updates, event notifications and files, and post the consolidated playbook for the devices
+    collected in the current time window
+    :param timeout: max time to wait for the running jobs, in seconds
+    :return: none
+    """
+    job_queue.drain(timeout)
+    job_store.flush()
+    event_log.flush_events()
+    ansible_playbook.flush_window_devices()
+    artifact_store.wait_for_artifacts()
 
 
+# with the debug reloader the module is loaded by the reloader process too, start the workers only in the app process
+if JOB_WORKERS_AUTOSTART and (__name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+    start_job_workers()
 
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', debug=True, ssl_context=(TLS_CERT_FILE, TLS_KEY_FILE) if TLS_CERT_FILE else 'adhoc')
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+import os
+import logging
+import time
+import json
+import datetime
+import collections
+import webex_apis
+import dnac_apis
+import artifact_store
+import app_logging
+import config_diff
+import ansible_playbook
+
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv('environment.env')
+
+logger = logging.getLogger(__name__)
+
+WEBEX_ROOM = os.getenv('WEBHOOKD_ROOM')
+
+DNAC_CLUSTERS = os.getenv('DNAC_CLUSTERS', '')  # the Cisco DNA Center clusters to audit, "dnac_ip,dnac_ip"
+SWEEP_PAGE_SIZE = int(os.getenv('SWEEP_PAGE_SIZE', '500'))  # number of devices for each inventory API call, max 500
+SWEEP_BATCH_SIZE = int(os.getenv('SWEEP_BATCH_SIZE', '200'))  # number of devices for each compliance run
+SWEEP_DETAIL_WORKERS = int(os.getenv('SWEEP_DETAIL_WORKERS', '8'))  # concurrent compliance detail API calls, per cluster
+SWEEP_SKIP_FAMILIES = os.getenv('SWEEP_SKIP_FAMILIES', 'Unified AP')  # device families without config compliance
+# create one Ansible playbook to remediate the running config drift of all the non compliant devices
+SWEEP_PLAYBOOK = os.getenv('SWEEP_PLAYBOOK', 'False').lower() == 'true'
+
+
+def get_inventory(dnac_api):
+    """
+    This function will return all the devices managed by Cisco DNA Center, using {SWEEP_PAGE_SIZE} devices pages.
+    The devices from the families in {SWEEP_SKIP_FAMILIES} are not included
+    Call to Cisco DNA Center - /network-device
+    :param dnac_api: Cisco DNA Center SDK API object
+    :return: list of devices
+    """
+    skip_families = [family.strip() for family in SWEEP_SKIP_FAMILIES.split(',') if family.strip()]
+    devices = []
+    offset = 1  # the first device is at offset 1
+    while True:
+        device_list = dnac_api.devices.get_device_list(offset=offset, limit=SWEEP_PAGE_SIZE)['response']
+        devices.extend(device for device in device_list if device.get('family') not in skip_families)
+        if len(device_list) < SWEEP_PAGE_SIZE:
+            break
+        offset += SWEEP_PAGE_SIZE
+    return devices
+
+
+def get_device_compliance(dnac_api, device_id):
+    """
+    This function will return the compliance checks for the device with the {device_id}
+    Call to Cisco DNA Center - /compliance/{device_id}/detail
+    :param dnac_api: Cisco DNA Center SDK API object
+    :param device_id: the device id
+    :return: list with the device compliance checks
+    """
+    return dnac_api.compliance.compliance_details_of_device(device_uuid=device_id)['response']
+
+
+def get_device_remediation(dnac_api, device):
+    """
+    This function will collect the running config and the startup config of the {device}, and return the CLI commands
+    to restore the startup config
+    Call to Cisco DNA Center - /network-device-poller/cli/read-request, /task/{task_id}, /file/{file_id}
+    :param dnac_api: Cisco DNA Center SDK API object
+    :param device: the device
+    :return: the CLI commands, or None if the running config and the startup config are the same
+    """
+    commands = ['show running-config', 'show startup-config']
+    command_responses = dnac_apis.run_read_only_commands(dnac_api, device['id'], commands)
+    running_config, startup_config = [config_diff.strip_config_header(command_responses[command], command)
+                                      for command in commands]
+    config_changes = config_diff.diff_configs(startup_config, running_config)
+    if not config_changes['sections']:
+        return None
+    return config_diff.remediation_cli(config_changes)
+
+
+def sweep_cluster(dnac_ip):
+    """
+    This function will run the compliance checks for all the devices managed by the Cisco DNA Center with the {dnac_ip}.
+    The compliance runs are executed for {SWEEP_BATCH_SIZE} devices at a time. The compliance checks for the devices
+    in a batch are collected by {SWEEP_DETAIL_WORKERS} threads, while the compliance runs for the next batch
+    :param dnac_ip: the Cisco DNA Center IP address
+    :return: the cluster report
+    """
+    start_time = time.time()
+    dnac_api = dnac_apis.get_dnac_api(dnac_ip)
+    devices = get_inventory(dnac_api)
+    logger.info('Compliance sweep started, Cisco DNA Center %s, number of devices: %s', dnac_ip, len(devices))
+
+    device_checks = {}  # device id -> future with the list of compliance checks
+    with ThreadPoolExecutor(max_workers=SWEEP_DETAIL_WORKERS, thread_name_prefix='sweep-detail') as executor:
+        for index in range(0, len(devices), SWEEP_BATCH_SIZE):
+            device_ids = [device['id'] for device in devices[index:index + SWEEP_BATCH_SIZE]]
+            try:
+                run_compliance = dnac_api.compliance.run_compliance(deviceUuids=device_ids)
+                dnac_apis.wait_for_task(dnac_api, run_compliance['response']['taskId'], 'sweep compliance check')
+            except Exception:
+                # report the last compliance result for the devices in the failed batch
+                logger.exception('Compliance run failed, Cisco DNA Center %s', dnac_ip)
+            for device_id in device_ids:
+                device_checks[device_id] = executor.submit(get_device_compliance, dnac_api, device_id)
+            logger.info('Compliance sweep, Cisco DNA Center %s, devices checked: %s', dnac_ip, index + len(device_ids))
+
+    status_count = collections.defaultdict(collections.Counter)  # compliance type -> status -> number of devices
+    non_compliant_devices = []
+    failed_devices = []
+    for device in devices:
+        try:
+            checks = device_checks[device['id']].result()
+        except Exception as e:
+            failed_devices.append({'hostname': device.get('hostname'), 'id': device['id'], 'error': repr(e)})
+            continue
+        non_compliant = []
+        for check in checks:
+            status_count[check['complianceType']][check['status']] += 1
+            if check['status'] == 'NON_COMPLIANT':
+                non_compliant.append(check['complianceType'])
+        if non_compliant:
+            non_compliant_devices.append({'hostname': device.get('hostname'), 'id': device['id'],
+                                          'managementIpAddress': device.get('managementIpAddress'),
+                                          'complianceTypes': non_compliant})
+
+    remediation = []
+    if SWEEP_PLAYBOOK:
+        remediation = get_remediation(dnac_api, dnac_ip, [device for device in non_compliant_devices
+                                                          if 'RUNNING_CONFIG' in device['complianceTypes']])
+
+    duration = time.time() - start_time
+    logger.info('Compliance sweep completed, Cisco DNA Center %s, in %s seconds', dnac_ip, round(duration))
+    return {
+        'dnacIP': dnac_ip,
+        'devices': len(devices),
+        'duration': round(duration, 1),
+        'status': {compliance_type: dict(count) for compliance_type, count in status_count.items()},
+        'nonCompliantDevices': non_compliant_devices,
+        'failedDevices': failed_devices,
+        'remediation': remediation
+    }
+
+
+def get_remediation(dnac_api, dnac_ip, devices):
+    """
+    This function will return the CLI commands to remediate the running config drift for the {devices}, collected by
+    {SWEEP_DETAIL_WORKERS} threads
+    :param dnac_api: Cisco DNA Center SDK API object
+    :param dnac_ip: the Cisco DNA Center IP address
+    :param devices: list of devices with the running config not compliant
+    :return: list of device remediations, {'device_name': ..., 'dnac_host': ..., 'cli_template': ...}
+    """
+    remediation = []
+    with ThreadPoolExecutor(max_workers=SWEEP_DETAIL_WORKERS, thread_name_prefix='sweep-config') as executor:
+        futures = [(device, executor.submit(get_device_remediation, dnac_api, device)) for device in devices]
+        for device, future in futures:
+            try:
+                cli_template = future.result()
+            except Exception:
+                logger.exception('Device configs not collected, Cisco DNA Center %s, device %s', dnac_ip,
+                                 device['hostname'])
+                continue
+            if cli_template:
+                remediation.append({'device_name': device['hostname'], 'dnac_host': dnac_ip,
+                                    'cli_template': cli_template})
+    logger.info('Compliance sweep, Cisco DNA Center %s, devices to remediate: %s', dnac_ip, len(remediation))
+    return remediation
+
+
+def run_sweep(dnac_clusters=None):
+    """
+    This function will run the compliance sweep for all the {dnac_clusters}, in parallel, save the aggregated report
+    to a file and post one summary card to Webex. If {SWEEP_PLAYBOOK}, one Ansible playbook to remediate all the
+    devices with a running config drift is posted to Webex
+    :param dnac_clusters: list of Cisco DNA Center IP addresses, default the clusters from {DNAC_CLUSTERS}
+    :return: the aggregated report
+    """
+    if dnac_clusters is None:
+        dnac_clusters = [dnac_ip.strip() for dnac_ip in DNAC_CLUSTERS.split(',') if dnac_ip.strip()]
+    start_time = datetime.datetime.now()
+
+    cluster_reports = []
+    remediation = []
+    with ThreadPoolExecutor(max_workers=max(len(dnac_clusters), 1), thread_name_prefix='sweep-cluster') as executor:
+        for dnac_ip, future in [(dnac_ip, executor.submit(sweep_cluster, dnac_ip)) for dnac_ip in dnac_clusters]:
+            try:
+                cluster_report = future.result()
+                # the CLI commands are saved to the playbook, not to the report
+                remediation.extend(cluster_report.pop('remediation'))
+                cluster_reports.append(cluster_report)
+            except Exception as e:
+                logger.exception('Compliance sweep failed, Cisco DNA Center %s', dnac_ip)
+                cluster_reports.append({'dnacIP': dnac_ip, 'error': repr(e)})
+
+    report = {
+        'started': start_time.isoformat(),
+        'duration': round((datetime.datetime.now() - start_time).total_seconds(), 1),
+        'devices': sum(cluster.get('devices', 0) for cluster in cluster_reports),
+        'nonCompliantDevices': sum(len(cluster.get('nonCompliantDevices', [])) for cluster in cluster_reports),
+        'clusters': cluster_reports
+    }
+
+    report_file = 'compliance_sweep_' + start_time.strftime('%Y%m%d_%H%M%S') + '.json'
+    artifact_store.save_artifact(report_file, json.dumps(report, indent=4))
+    artifact_store.wait_for_artifacts()
+    logger.info('Compliance sweep report saved to file: %s', report_file)
+
+    post_sweep_summary(report)
+    if remediation:
+        ansible_playbook.post_consolidated_playbook(
+            remediation, 'compliance_sweep_' + start_time.strftime('%Y%m%d_%H%M%S') + '_remediation.yml')
+        artifact_store.wait_for_artifacts()
+    return report
+
+
+def post_sweep_summary(report):
+    """
+    This function will post the compliance sweep summary card to the Webex room
+    :param report: the aggregated report
+    :return: none
+    """
+    facts = [
+        {'title': 'Devices', 'value': str(report['devices'])},
+        {'title': 'Non Compliant Devices', 'value': str(report['nonCompliantDevices'])},
+        {'title': 'Duration', 'value': str(round(report['duration'] / 60, 1)) + ' minutes'}
+    ]
+    for cluster in report['clusters']:
+        if 'error' in cluster:
+            value = 'Failed: ' + cluster['error']
+        else:
+            value = str(len(cluster['nonCompliantDevices'])) + ' of ' + str(cluster['devices']) + \
+                    ' devices non compliant'
+            if cluster['failedDevices']:
+                value += ', ' + str(len(cluster['failedDevices'])) + ' devices not checked'
+        facts.append({'title': 'Cisco DNA Center ' + cluster['dnacIP'], 'value': value})
+
+    card_message = {
+        "roomId": webex_apis.get_room_id(WEBEX_ROOM),
+        "markdown": "Compliance Sweep",
+        "attachments": [
+            {
+                "contentType": "application/vnd.microsoft.card.adaptive",
+                "content": {
+                    "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
+                    "type": "AdaptiveCard",
+                    "version": "1.0",
+                    "body": [
+                        {
+                            "type": "TextBlock",
+                            "text": "Compliance Sweep",
+                            "weight": "bolder",
+                            "size": "large"
+                        },
+                        {
+                            "type": "TextBlock",
+                            "text": "Started: " + report['started'],
+                            "wrap": True
+                        },
+                        {
+                            "type": "FactSet",
+                            "facts": facts
+                        }
+                    ]
+                }
+            }
+        ]
+    }
+    webex_apis.post_room_card_message(WEBEX_ROOM, card_message)
+    logger.info('Compliance sweep summary message posted')
+
+
+if __name__ == '__main__':
+    app_logging.setup_logging()
+    run_sweep()
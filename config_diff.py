@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+import re
+import difflib
+
+VERSION_LINE = re.compile(r'^version ', re.MULTILINE)  # the first config line, after the command output header
+
+
+def parse_config(config):
+    """
+    This function will parse an IOS/IOS-XE configuration into sections.
+    A section is a global configuration line, with all the indented lines that follow it. Each of the section lines is
+    saved with the path of the parent lines, for example the "address-family" line for the "neighbor" lines.
+    Comment lines, starting with '!', are not included. Banner lines are included in the banner section
+    Sample section:
+    {'header': 'router bgp 65002', 'children': [((), ' address-family ipv4'),
+                                                ((' address-family ipv4',), '  neighbor 10.93.141.42 activate')]}
+    :param config: the configuration text, or an iterable with the configuration lines
+    :return: dict, section key -> section. The key is the tuple (header, occurrence), in configuration order
+    """
+    if isinstance(config, str):
+        config = config.splitlines()
+
+    sections = {}
+    section = None
+    parents = []  # the parent lines of the current line, list of (indent, line)
+    banner_delimiter = None
+
+    for config_line in config:
+        line = config_line.rstrip()
+        if banner_delimiter:
+            section['children'].append(((), line))
+            if banner_delimiter in line:
+                banner_delimiter = None
+            continue
+
+        stripped_line = line.lstrip()
+        if not stripped_line or stripped_line.startswith('!'):
+            continue
+        indent = len(line) - len(stripped_line)
+
+        if indent == 0:
+            occurrence = 1
+            while (line, occurrence) in sections:
+                occurrence += 1
+            section = {'header': line, 'children': []}
+            sections[(line, occurrence)] = section
+            parents = []
+            banner_delimiter = _banner_delimiter(line)
+        elif section is not None:
+            while parents and parents[-1][0] >= indent:
+                parents.pop()
+            section['children'].append((tuple(parent for _, parent in parents), line))
+            parents.append((indent, line))
+
+    for section in sections.values():
+        section['hash'] = hash((section['header'], tuple(section['children'])))
+    return sections
+
+
+def diff_configs(old_config, new_config):
+    """
+    This function will compare two configurations, section by section, and identify the changes.
+    The sections with the same key are compared using the section hash, only the sections with a different hash are
+    compared line by line. The lines are compared in order, with the path of the parent lines, the order is relevant
+    for the access-list, route-map, policy-map and banner lines. The changed sections with lines moved, and the banner
+    sections, include the old section lines, to restore the section in order
+    :param old_config: the old configuration text, or an iterable with the configuration lines
+    :param new_config: the new configuration text, or an iterable with the configuration lines
+    :return: dict with the changed sections, and the lines added and removed, in configuration order
+    {'sections': [{'header': header, 'status': 'added' | 'removed' | 'changed', 'lines': [(tag, line), ...],
+                   'restore': [line, ...]}, ...],
+     'added': [line, ...], 'removed': [line, ...]}
+    The line tag is '+' for the lines added, '-' for the lines removed, ' ' for the parent lines included for context
+    """
+    old_sections = parse_config(old_config)
+    new_sections = parse_config(new_config)
+    old_keys = list(old_sections)
+    old_positions = {key: position for position, key in enumerate(old_keys)}
+
+    diff = {'sections': [], 'added': [], 'removed': []}
+    old_position = 0
+    for key, new_section in new_sections.items():
+        if key not in old_sections:
+            _add_section(diff, 'added', new_section, [], new_section['children'])
+            continue
+        # the removed sections are reported in the old configuration order, before the next common section
+        while old_position < old_positions[key]:
+            _add_removed_section(diff, old_sections, new_sections, old_keys[old_position])
+            old_position += 1
+        old_position = old_positions[key] + 1
+        old_section = old_sections[key]
+        if old_section['hash'] != new_section['hash']:
+            removed_lines, added_lines = _changed_lines(old_section['children'], new_section['children'])
+            restore = None
+            if _is_reordered(new_section, removed_lines, added_lines):
+                restore = [old_section['header']] + [line for _, line in old_section['children']]
+            _add_section(diff, 'changed', new_section, removed_lines, added_lines, restore)
+    while old_position < len(old_keys):
+        _add_removed_section(diff, old_sections, new_sections, old_keys[old_position])
+        old_position += 1
+    return diff
+
+
+def format_diff(diff, added_prefix='+', removed_prefix='-', context_prefix=' '):
+    """
+    This function will format the configuration changes as text, one line for each changed line, with the
+    {added_prefix} or {removed_prefix} in front, and the sections separated by '!'
+    :param diff: the configuration changes, from the function diff_configs
+    :param added_prefix: the prefix for the lines added
+    :param removed_prefix: the prefix for the lines removed
+    :param context_prefix: the prefix for the parent lines
+    :return: the configuration changes text
+    """
+    prefixes = {'+': added_prefix, '-': removed_prefix, ' ': context_prefix}
+    return '\n!\n'.join('\n'.join(prefixes[tag] + line for tag, line in section['lines'])
+                        for section in diff['sections'])
+
+
+def remediation_cli(diff):
+    """
+    This function will create the CLI commands to restore the old configuration.
+    The lines added are negated with 'no', or the 'no' is removed, the lines removed are configured again.
+    For the lines added under a parent line also added, only the parent line is negated.
+    The sections with lines moved are removed and configured again with the old lines, in order, the banner sections
+    are configured again
+    :param diff: the configuration changes, from the function diff_configs
+    :return: the CLI commands text
+    """
+    sections_cli = []
+    for section in diff['sections']:
+        if 'restore' in section:
+            section_cli = [] if _banner_delimiter(section['header']) else ['no ' + section['header']]
+            section_cli.extend(line for line in section['restore'] if not _is_ignored(line))
+            sections_cli.append('\n'.join(section_cli))
+            continue
+        section_cli = []
+        negated_indent = None  # the indent of the last line negated, the child lines are not needed
+        for tag, line in section['lines']:
+            stripped_line = line.lstrip()
+            indent = len(line) - len(stripped_line)
+            if negated_indent is not None and indent > negated_indent and tag == '+':
+                continue
+            negated_indent = None
+            if tag == '+':
+                if stripped_line.startswith('no '):
+                    section_cli.append(line[:indent] + stripped_line[3:])
+                else:
+                    section_cli.append(line[:indent] + 'no ' + stripped_line)
+                negated_indent = indent
+            else:
+                section_cli.append(line)
+        sections_cli.append('\n'.join(section_cli))
+    return '\n!\n'.join(sections_cli)
+
+
+def strip_config_header(command_output, command):
+    """
+    This function will remove the command and all the config lines before version, from the {command_output}.
+    The version line is found as a line starting with "version ", not the first "version" word in the output, and the
+    config is copied only once
+    :param command_output: the command output
+    :param command: the command
+    :return: the config text, after the "version" word
+    """
+    match = VERSION_LINE.search(command_output)
+    if match is None:
+        raise ValueError('The version line was not found in the "' + command + '" output')
+    return command_output[match.start() + len('version'):]
+
+
+def _banner_delimiter(line):
+    """
+    Return the banner delimiter, if the {line} starts a multi-line banner, for example "banner motd ^C"
+    """
+    words = line.split()
+    if len(words) < 3 or words[0] != 'banner':
+        return None
+    text = line.split(None, 2)[2]
+    delimiter = text[:2] if text.startswith('^') else text[0]
+    if delimiter in text[len(delimiter):]:
+        return None
+    return delimiter
+
+
+def _is_ignored(line):
+    """
+    The lines with hidden secrets and the certificate 'quit' lines are not reported as changes
+    """
+    return 'xxxx' in line or line.strip() == 'quit'
+
+
+def _changed_lines(section_lines, other_section_lines):
+    """
+    Return the lines removed from the {section_lines} and the lines added in the {other_section_lines}, the lines are
+    compared in order, duplicate lines are counted
+    """
+    # the common first and last lines are not compared, most of the changes are a few lines added or removed
+    start = 0
+    end = len(section_lines)
+    other_end = len(other_section_lines)
+    while start < end and start < other_end and section_lines[start] == other_section_lines[start]:
+        start += 1
+    while end > start and other_end > start and section_lines[end - 1] == other_section_lines[other_end - 1]:
+        end -= 1
+        other_end -= 1
+    section_lines = section_lines[start:end]
+    other_section_lines = other_section_lines[start:other_end]
+    # the lines were replaced, no common lines to match in order
+    if not section_lines or not other_section_lines or set(section_lines).isdisjoint(other_section_lines):
+        return section_lines, other_section_lines
+
+    removed_lines = []
+    added_lines = []
+    matcher = difflib.SequenceMatcher(None, section_lines, other_section_lines, autojunk=False)
+    for opcode, start, end, other_start, other_end in matcher.get_opcodes():
+        if opcode != 'equal':
+            removed_lines.extend(section_lines[start:end])
+            added_lines.extend(other_section_lines[other_start:other_end])
+    return removed_lines, added_lines
+
+
+def _is_reordered(section, removed_lines, added_lines):
+    """
+    The section needs to be restored in order if it is a banner, or if the same line was removed and added (moved)
+    """
+    if _banner_delimiter(section['header']):
+        return True
+    if not removed_lines or not added_lines:
+        return False
+    return not {line for line in removed_lines if not _is_ignored(line[1])}.isdisjoint(added_lines)
+
+
+def _add_removed_section(diff, old_sections, new_sections, key):
+    """
+    Add the old section with the {key} to the {diff}, if the section is not in the new configuration
+    """
+    if key not in new_sections:
+        old_section = old_sections[key]
+        _add_section(diff, 'removed', old_section, old_section['children'], [])
+
+
+def _add_section(diff, status, section, removed_lines, added_lines, restore=None):
+    """
+    Add the changed {section} to the {diff}, with the parent lines needed for context, and the old section lines to
+    {restore}, if the section order changed
+    """
+    header = section['header']
+    if status == 'added':
+        lines = [('+', header)]
+        diff['added'].append(header)
+    elif status == 'removed':
+        lines = [('-', header)]
+        diff['removed'].append(header)
+    else:
+        lines = [(' ', header)]
+
+    for tag, section_lines in (('-', removed_lines), ('+', added_lines)):
+        current_path = ()
+        for path, line in section_lines:
+            if _is_ignored(line):
+                continue
+            common = 0
+            while common < len(path) and common < len(current_path) and path[common] == current_path[common]:
+                common += 1
+            if status == 'changed':
+                lines.extend((' ', parent) for parent in path[common:])
+            lines.append((tag, line))
+            diff['added' if tag == '+' else 'removed'].append(line)
+            current_path = path + (line,)
+
+    if len(lines) > 1 or status != 'changed':
+        diff['sections'].append({'header': header, 'status': status, 'lines': lines})
+        if restore is not None:
+            diff['sections'][-1]['restore'] = restore
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+import os
+import re
+import json
+import uuid
+import hashlib
+import threading
+import collections
+import contextlib
+
+try:
+    import fcntl  # the index file lock for the multi-process mode, not available on Windows
+except ImportError:
+    fcntl = None
+
+from dotenv import load_dotenv
+
+load_dotenv('environment.env')
+
+CONFIG_SNAPSHOT_DIR = os.getenv('CONFIG_SNAPSHOT_DIR', 'config_snapshots')  # folder for the config snapshots
+CONFIG_SNAPSHOT_MAX_SIZE = int(os.getenv('CONFIG_SNAPSHOT_MAX_SIZE', str(512 * 1024 * 1024)))  # max size, bytes
+CONFIG_DIFF_CACHE_SIZE = int(os.getenv('CONFIG_DIFF_CACHE_SIZE', '256'))  # number of config diffs kept in memory
+
+NVRAM_TIMESTAMP = re.compile(r'^! NVRAM config last updated at (.+)$', re.MULTILINE)
+LAST_CHANGE_TIMESTAMP = re.compile(r'^! Last configuration change at (.+)$', re.MULTILINE)
+# the running config header lines with the config timestamps, a small Command Runner output
+CONFIG_TIMESTAMP_COMMAND = 'show running-config | include Last configuration change|NVRAM config last updated'
+
+snapshots = collections.OrderedDict()  # config hash -> snapshot file size, least recently used first
+devices = {}  # device id -> {config type -> {'hash': ..., 'timestamp': ..., 'nvram_timestamp': ...}}
+diff_cache = collections.OrderedDict()  # (old config hash, new config hash) -> config diff
+store_lock = threading.RLock()
+store_loaded = False
+index_version = None  # the index file inode and modification time, when it was loaded
+store_stats = {'snapshot_hits': 0, 'snapshot_misses': 0, 'diff_hits': 0, 'diff_misses': 0, 'evictions': 0}
+
+
+def get_snapshot(device_id, config_type, timestamp=None):
+    """
+    This function will return the last config snapshot of type {config_type} for the device with the {device_id}.
+    If the {timestamp} is provided, the snapshot is returned only if it was saved with the same timestamp
+    :param device_id: the device id
+    :param config_type: the config type, 'running' or 'startup'
+    :param timestamp: the config timestamp, reported by the device
+    :return: the snapshot {'hash': ..., 'timestamp': ..., 'nvram_timestamp': ..., 'config': ...}, or None
+    """
+    with store_lock:
+        _load_store()
+        _load_index()
+        snapshot = devices.get(device_id, {}).get(config_type)
+        if snapshot is None or (timestamp is not None and snapshot['timestamp'] != timestamp):
+            store_stats['snapshot_misses'] += 1
+            return None
+        try:
+            with open(_snapshot_path(snapshot['hash']), encoding='utf-8') as file:
+                config = file.read()
+        except FileNotFoundError:
+            store_stats['snapshot_misses'] += 1
+            return None
+        if snapshot['hash'] in snapshots:
+            snapshots.move_to_end(snapshot['hash'])
+        store_stats['snapshot_hits'] += 1
+        return dict(snapshot, config=config)
+
+
+def put_snapshot(device_id, config_type, config, timestamp=None, nvram_timestamp=None):
+    """
+    This function will save the {config} as the last config snapshot of type {config_type} for the device with the
+    {device_id}. The snapshot file name is the config hash, the devices with the same config will share the file.
+    The least recently used snapshots are removed when the snapshots size is more than {CONFIG_SNAPSHOT_MAX_SIZE}
+    :param device_id: the device id
+    :param config_type: the config type, 'running' or 'startup'
+    :param config: the config text
+    :param timestamp: the config timestamp, reported by the device
+    :param nvram_timestamp: the timestamp when the startup config was saved, from the running config
+    :return: the snapshot {'hash': ..., 'timestamp': ..., 'nvram_timestamp': ..., 'config': ...}
+    """
+    # the snapshot size is the size of the file, the UTF-8 bytes written
+    config_bytes = config.encode('utf-8')
+    config_hash = hashlib.sha256(config_bytes).hexdigest()
+    snapshot = {'hash': config_hash, 'timestamp': timestamp, 'nvram_timestamp': nvram_timestamp}
+    with store_lock:
+        _load_store()
+        if config_hash not in snapshots:
+            # the file may have been saved by another worker process
+            if not os.path.exists(_snapshot_path(config_hash)):
+                _write_file(_snapshot_path(config_hash), config_bytes)
+            snapshots[config_hash] = len(config_bytes)
+        snapshots.move_to_end(config_hash)
+        _evict_snapshots()
+        # the index is updated by all the worker processes, merge the changes with the last saved index
+        with _index_lock():
+            _load_index()
+            devices.setdefault(device_id, {})[config_type] = snapshot
+            _save_index()
+    return dict(snapshot, config=config)
+
+
+def get_diff(old_snapshot, new_snapshot, diff_function):
+    """
+    This function will return the config diff between the {old_snapshot} and the {new_snapshot}.
+    The diffs are cached in memory, the {diff_function} is called only for the config pairs not compared before
+    :param old_snapshot: the old config snapshot
+    :param new_snapshot: the new config snapshot
+    :param diff_function: function to compare the old config and new config
+    :return: the config diff
+    """
+    key = (old_snapshot['hash'], new_snapshot['hash'])
+    with store_lock:
+        if key in diff_cache:
+            diff_cache.move_to_end(key)
+            store_stats['diff_hits'] += 1
+            return diff_cache[key]
+        store_stats['diff_misses'] += 1
+    diff = diff_function(old_snapshot['config'], new_snapshot['config'])
+    with store_lock:
+        diff_cache[key] = diff
+        while len(diff_cache) > CONFIG_DIFF_CACHE_SIZE:
+            diff_cache.popitem(last=False)
+    return diff
+
+
+def nvram_timestamp(running_config):
+    """
+    This function will find the time the startup config was saved, from the running config header line
+    "! NVRAM config last updated at 10:22:35 UTC Mon Sep 27 2021 by admin"
+    :param running_config: the "show running-config" output
+    :return: the timestamp text, or None if not found
+    """
+    match = NVRAM_TIMESTAMP.search(running_config)
+    return match.group(1).strip() if match else None
+
+
+def last_change_timestamp(running_config):
+    """
+    This function will find the time the running config was last changed, from the running config header line
+    "! Last configuration change at 10:22:35 UTC Mon Sep 27 2021 by admin"
+    :param running_config: the "show running-config" output
+    :return: the timestamp text, or None if not found
+    """
+    match = LAST_CHANGE_TIMESTAMP.search(running_config)
+    return match.group(1).strip() if match else None
+
+
+def get_store_stats():
+    """
+    This function will return the snapshot and diff cache statistics
+    :return: the cache statistics
+    """
+    with store_lock:
+        stats = dict(store_stats)
+        stats['snapshots'] = len(snapshots)
+        stats['snapshots_size'] = sum(snapshots.values())
+        stats['diffs'] = len(diff_cache)
+    return stats
+
+
+def _load_store():
+    """
+    Load the devices index and the list of snapshot files, oldest first, caller holds {store_lock}
+    """
+    global store_loaded
+    if store_loaded:
+        return
+    os.makedirs(CONFIG_SNAPSHOT_DIR, exist_ok=True)
+    snapshot_files = [entry for entry in os.scandir(CONFIG_SNAPSHOT_DIR) if entry.name.endswith('.cfg')]
+    for entry in sorted(snapshot_files, key=lambda entry: entry.stat().st_mtime):
+        snapshots[entry.name[:-len('.cfg')]] = entry.stat().st_size
+    store_loaded = True
+
+
+def _load_index():
+    """
+    Load the devices index, if it was changed since it was loaded, for example by another worker process, caller
+    holds {store_lock}
+    """
+    global index_version
+    try:
+        stat = os.stat(_index_path())
+    except FileNotFoundError:
+        return
+    # the index file is replaced when saved, a new inode for each version
+    if (stat.st_ino, stat.st_mtime_ns) == index_version:
+        return
+    try:
+        with open(_index_path(), encoding='utf-8') as file:
+            index = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return
+    devices.clear()
+    devices.update(index)
+    index_version = (stat.st_ino, stat.st_mtime_ns)
+
+
+def _save_index():
+    """
+    Save the devices index, caller holds {store_lock} and the index file lock
+    """
+    global index_version
+    _write_file(_index_path(), json.dumps(devices).encode('utf-8'))
+    stat = os.stat(_index_path())
+    index_version = (stat.st_ino, stat.st_mtime_ns)
+
+
+@contextlib.contextmanager
+def _index_lock():
+    """
+    Lock the devices index file for update, for the worker processes sharing the snapshot folder, caller holds
+    {store_lock}
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(CONFIG_SNAPSHOT_DIR, 'index.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _evict_snapshots():
+    """
+    Remove the least recently used snapshot files, until the total size is below the max size, caller holds {store_lock}
+    """
+    total_size = sum(snapshots.values())
+    while total_size > CONFIG_SNAPSHOT_MAX_SIZE and len(snapshots) > 1:
+        config_hash, size = snapshots.popitem(last=False)
+        total_size -= size
+        store_stats['evictions'] += 1
+        try:
+            os.remove(_snapshot_path(config_hash))
+        except FileNotFoundError:
+            pass
+
+
+def _index_path():
+    """
+    Return the devices index file path
+    """
+    return os.path.join(CONFIG_SNAPSHOT_DIR, 'index.json')
+
+
+def _snapshot_path(config_hash):
+    """
+    Return the snapshot file path for the {config_hash}
+    """
+    return os.path.join(CONFIG_SNAPSHOT_DIR, config_hash + '.cfg')
+
+
+def _write_file(file_path, content):
+    """
+    Write the {content} bytes to a temporary file, and rename it to the {file_path}
+    """
+    temp_file_path = file_path + '.' + uuid.uuid4().hex + '.tmp'
+    with open(temp_file_path, 'wb') as file:
+        file.write(content)
+    os.replace(temp_file_path, file_path)
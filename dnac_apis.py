@@ -0,0 +1,468 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+import os
+import logging
+import time
+import json
+import random
+import asyncio
+import threading
+import functools
+import urllib3
+import workflow_engine
+import metrics
+import tracing
+import json_stream
+
+from concurrent.futures import Future
+
+from urllib3.exceptions import InsecureRequestWarning  # for insecure https warnings
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from dnacentersdk import DNACenterAPI
+from dnacentersdk.response_codes import EXPECTED_RESPONSE_CODE
+
+urllib3.disable_warnings(InsecureRequestWarning)  # disable insecure https warnings
+
+load_dotenv('environment.env')
+
+logger = logging.getLogger(__name__)
+
+DNAC_USER = os.getenv('DNAC_USER')
+DNAC_PASS = os.getenv('DNAC_PASS')
+DNAC_VERSION = os.getenv('DNAC_VERSION', '2.2.2.3')
+
+DNAC_POOL_SIZE = int(os.getenv('DNAC_POOL_SIZE', '10'))  # default max keep-alive connections to each cluster
+DNAC_POOL_SIZES = os.getenv('DNAC_POOL_SIZES', '')  # per cluster pool size, "dnac_ip=size,dnac_ip=size"
+DNAC_TOKEN_REFRESH = int(os.getenv('DNAC_TOKEN_REFRESH', '3000'))  # token refresh interval, tokens expire after 1 hour
+
+DNAC_BATCH_WINDOW = float(os.getenv('DNAC_BATCH_WINDOW', '5'))  # time to collect devices for one compliance run, seconds
+DNAC_BATCH_SIZE = int(os.getenv('DNAC_BATCH_SIZE', '50'))  # max number of devices for one compliance run
+DNAC_DETAIL_CHUNK = 20  # number of devices for each compliance detail API call
+FILE_URL = '/dna/intent/api/v1/file/'  # the Command Runner file download API
+
+DNAC_TASK_TIMEOUT = float(os.getenv('DNAC_TASK_TIMEOUT', '600'))  # max time to wait for a task, seconds
+DNAC_TASK_POLL_INITIAL = float(os.getenv('DNAC_TASK_POLL_INITIAL', '1'))  # first task poll interval, seconds
+DNAC_TASK_POLL_MAX = float(os.getenv('DNAC_TASK_POLL_MAX', '15'))  # max task poll interval, seconds
+
+task_stats = {}  # task name -> task completion latency statistics
+task_stats_lock = threading.Lock()
+
+dnac_clients = {}  # dnac ip -> cached DNACenterAPI client
+dnac_clients_lock = threading.Lock()
+
+compliance_batches = {}  # dnac ip -> the batch collecting devices for the next compliance run
+compliance_batches_lock = threading.Lock()
+
+
+def get_dnac_api(dnac_ip):
+    """
+    This function will return the DNACenterAPI client for the Cisco DNA Center with the {dnac_ip}.
+    The clients are created once and shared by all the jobs, each client uses a pool of keep-alive connections.
+    The access token is refreshed every {DNAC_TOKEN_REFRESH} seconds, before it expires
+    :param dnac_ip: the Cisco DNA Center IP address
+    :return: Cisco DNA Center SDK API object
+    """
+    with dnac_clients_lock:
+        client = dnac_clients.setdefault(dnac_ip, {'api': None, 'token_time': 0, 'lock': threading.Lock()})
+
+    # the client lock is per cluster, a slow or unreachable cluster will not block the jobs for the other clusters
+    with client['lock']:
+        if client['api'] is None:
+            client['api'] = _create_dnac_api(dnac_ip)
+            client['token_time'] = time.time()
+        elif time.time() - client['token_time'] > DNAC_TOKEN_REFRESH:
+            client['api'].session.refresh_token()
+            client['token_time'] = time.time()
+            logger.info('Cisco DNA Center %s access token refreshed', dnac_ip)
+        return client['api']
+
+
+def get_pool_size(dnac_ip):
+    """
+    This function will return the connection pool size for the Cisco DNA Center with the {dnac_ip}
+    :param dnac_ip: the Cisco DNA Center IP address
+    :return: the pool size from {DNAC_POOL_SIZES} if configured for the cluster, or {DNAC_POOL_SIZE}
+    """
+    for cluster in DNAC_POOL_SIZES.split(','):
+        if '=' in cluster:
+            cluster_ip, pool_size = cluster.split('=', 1)
+            if cluster_ip.strip() == dnac_ip:
+                return int(pool_size)
+    return DNAC_POOL_SIZE
+
+
+def _dnac_ip(dnac_api):
+    """
+    Return the Cisco DNA Center IP address for the {dnac_api} client, the metrics label
+    """
+    with dnac_clients_lock:
+        for dnac_ip, client in dnac_clients.items():
+            if client['api'] is dnac_api:
+                return dnac_ip
+    return ''
+
+
+def _create_dnac_api(dnac_ip):
+    """
+    Create a DNACenterAPI client for the {dnac_ip}, with a connection pool sized for the cluster
+    """
+    dnac_api = DNACenterAPI(username=DNAC_USER, password=DNAC_PASS, base_url='https://' + dnac_ip,
+                            version=DNAC_VERSION, verify=False)
+    # the SDK does not accept a custom session, mount the sized adapter on the session it created
+    pool_size = get_pool_size(dnac_ip)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    dnac_api.session._req_session.mount('https://', adapter)
+    # all the SDK API calls are sent by the session request method, trace them
+    dnac_api.session.request = functools.partial(_traced_request, dnac_api.session.request, dnac_ip)
+    logger.info('Cisco DNA Center %s client created, connection pool size: %s', dnac_ip, pool_size)
+    return dnac_api
+
+
+def _traced_request(request, dnac_ip, method, url, *args, **kwargs):
+    """
+    Send the SDK API call using the session {request} method, in a trace span
+    """
+    with tracing.span('DNAC ' + method + ' ' + tracing.path_template(url), 'client', **{
+            'http.method': method, 'http.url': url, 'dnac': dnac_ip}) as span:
+        response = request(method, url, *args, **kwargs)
+        if span is not None:
+            span['attributes']['http.status_code'] = response.status_code
+        return response
+
+
+def wait_for_task(dnac_api, task_id, task_name='task', timeout=DNAC_TASK_TIMEOUT):
+    """
+    This function will wait for the Cisco DNA Center task with the {task_id} to complete.
+    The task is polled with exponential backoff and jitter, starting at {DNAC_TASK_POLL_INITIAL} seconds, with a ceiling
+    of {DNAC_TASK_POLL_MAX} seconds between polls, until the task reports the end time or an error
+    Call to Cisco DNA Center - /dna/intent/api/v1/task/{task_id}
+    :param dnac_api: Cisco DNA Center SDK API object
+    :param task_id: the task id
+    :param task_name: the task name, used for the completion latency statistics
+    :param timeout: max time to wait for the task to complete, in seconds
+    :return: the task info, RuntimeError is raised if the task failed
+    """
+    start_time = time.time()
+    delay = DNAC_TASK_POLL_INITIAL
+    while True:
+        task_info = dnac_api.task.get_task_by_id(task_id=task_id)
+        task_response = task_info['response']
+        if task_response.get('endTime') or task_response.get('isError'):
+            break
+        elapsed = time.time() - start_time
+        if elapsed >= timeout:
+            _record_task_latency(task_name, elapsed, timed_out=True)
+            raise TimeoutError('Task ' + task_name + ', id ' + task_id + ', not completed in ' + str(timeout) + ' seconds')
+        # randomize the delay, to avoid polling in lock-step when many tasks were started at the same time
+        time.sleep(min(random.uniform(delay / 2, delay), timeout - elapsed))
+        delay = min(delay * 2, DNAC_TASK_POLL_MAX)
+
+    return _task_completed(task_name, task_id, task_response, start_time)
+
+
+async def wait_for_task_async(dnac_api, task_id, task_name='task', timeout=DNAC_TASK_TIMEOUT):
+    """
+    This function will wait for the Cisco DNA Center task with the {task_id} to complete, same as wait_for_task.
+    The workflow is suspended between the polls, it will not hold a thread while waiting
+    Call to Cisco DNA Center - /dna/intent/api/v1/task/{task_id}
+    :param dnac_api: Cisco DNA Center SDK API object
+    :param task_id: the task id
+    :param task_name: the task name, used for the completion latency statistics
+    :param timeout: max time to wait for the task to complete, in seconds
+    :return: the task info, RuntimeError is raised if the task failed
+    """
+    start_time = time.time()
+    delay = DNAC_TASK_POLL_INITIAL
+    while True:
+        task_info = await workflow_engine.run_blocking(dnac_api.task.get_task_by_id, task_id=task_id)
+        task_response = task_info['response']
+        if task_response.get('endTime') or task_response.get('isError'):
+            break
+        elapsed = time.time() - start_time
+        if elapsed >= timeout:
+            _record_task_latency(task_name, elapsed, timed_out=True)
+            raise TimeoutError('Task ' + task_name + ', id ' + task_id + ', not completed in ' + str(timeout) + ' seconds')
+        await asyncio.sleep(min(random.uniform(delay / 2, delay), timeout - elapsed))
+        delay = min(delay * 2, DNAC_TASK_POLL_MAX)
+
+    return _task_completed(task_name, task_id, task_response, start_time)
+
+
+def _task_completed(task_name, task_id, task_response, start_time):
+    """
+    Record the task completion latency, and print the task result. A failed task raises RuntimeError, with the task
+    failure reason
+    """
+    latency = time.time() - start_time
+    _record_task_latency(task_name, latency, error=bool(task_response.get('isError')))
+    logger.info('Task %s completed in %s seconds', task_name, round(latency, 1))
+    if task_response.get('isError'):
+        logger.warning('Task %s failed: %s', task_name, task_response.get('failureReason'))
+        raise RuntimeError('Task ' + task_name + ', id ' + task_id + ', failed: ' +
+                           str(task_response.get('failureReason')))
+    return task_response
+
+
+def submit_compliance_batch(dnac_ip, device_id, on_task=None):
+    """
+    This function will add the device with the {device_id} to the open batch for the Cisco DNA Center {dnac_ip}.
+    The devices are collected for {DNAC_BATCH_WINDOW} seconds, or up to {DNAC_BATCH_SIZE} devices, for each
+    Cisco DNA Center. One device sync and one compliance run are executed for all the devices in the batch
+    :param dnac_ip: the Cisco DNA Center IP address
+    :param device_id: the device id
+    :param on_task: optional function called with the task name and the task id, when the batch device sync and
+    compliance tasks are started
+    :return: a future, with the result the list of the device compliance checks
+    """
+    with compliance_batches_lock:
+        batch = compliance_batches.get(dnac_ip)
+        if batch is None:
+            batch = {'devices': {}, 'callbacks': [], 'spans': [], 'flushed': False}
+            batch['timer'] = threading.Timer(DNAC_BATCH_WINDOW, _flush_compliance_batch, args=(dnac_ip, batch))
+            batch['timer'].daemon = True
+            batch['timer'].start()
+            compliance_batches[dnac_ip] = batch
+        # the notifications for the same device in the same batch will share the result
+        future = batch['devices'].setdefault(device_id, Future())
+        if on_task is not None:
+            batch['callbacks'].append(on_task)
+        # the batch runs in a timer thread, the batch API calls are traced with the span of each job
+        batch['spans'].append(tracing.current_span.get())
+        batch_full = len(batch['devices']) >= DNAC_BATCH_SIZE
+    if batch_full:
+        batch['timer'].cancel()
+        threading.Thread(target=_flush_compliance_batch, args=(dnac_ip, batch), daemon=True).start()
+    return future
+
+
+def _flush_compliance_batch(dnac_ip, batch):
+    """
+    Close the {batch}, run the compliance checks for all the devices and return the result to each device future.
+    The task ids are reported to all the {batch} callbacks
+    """
+    def on_task(task_name, task_id):
+        for callback in batch['callbacks']:
+            callback(task_name, task_id)
+
+    with compliance_batches_lock:
+        if batch['flushed']:
+            return
+        batch['flushed'] = True
+        if compliance_batches.get(dnac_ip) is batch:
+            del compliance_batches[dnac_ip]
+    try:
+        with tracing.batch_span(batch['spans'], 'compliance batch', dnac=dnac_ip, devices=len(batch['devices'])):
+            compliance_checks = run_compliance_batch(dnac_ip, list(batch['devices']), on_task=on_task)
+    except Exception as e:
+        for future in batch['devices'].values():
+            future.set_exception(e)
+        return
+    for device_id, future in batch['devices'].items():
+        future.set_result(compliance_checks.get(device_id, []))
+
+
+def run_compliance_batch(dnac_ip, device_ids, tasks=None, on_task=None):
+    """
+    This function will sync the devices with the {device_ids}, run the compliance checks and collect the compliance
+    checks for all the devices. The device sync and compliance tasks in {tasks}, started before a restart, are not
+    started again, the function will wait for the same tasks
+    Call to Cisco DNA Center - /network-device/sync, /compliance, /compliance/detail
+    :param dnac_ip: the Cisco DNA Center IP address
+    :param device_ids: list of device ids
+    :param tasks: optional dict, 'device sync' and 'compliance check' -> the task id started before a restart
+    :param on_task: optional function called with the task name and the task id, when a task is started
+    :return: dict, device id -> list with the device compliance checks
+    """
+    tasks = tasks or {}
+    dnac_api = get_dnac_api(dnac_ip)
+    logger.info('Compliance batch started, Cisco DNA Center %s, number of devices: %s', dnac_ip, len(device_ids))
+
+    # re-sync devices, the SDK request schema expects a list of objects, the API a list of device ids
+    with metrics.time_step('forcesync', dnac_ip):
+        task_id = tasks.get('device sync')
+        if task_id is None:
+            resync = dnac_api.devices.sync_devices_using_forcesync(force_sync=True, payload=device_ids,
+                                                                   active_validation=False)
+            task_id = resync['response']['taskId']
+            if on_task is not None:
+                on_task('device sync', task_id)
+        wait_for_task(dnac_api, task_id, 'device sync')
+
+    # check compliance
+    with metrics.time_step('compliance run', dnac_ip):
+        task_id = tasks.get('compliance check')
+        if task_id is None:
+            run_compliance = dnac_api.compliance.run_compliance(deviceUuids=device_ids)
+            task_id = run_compliance['response']['taskId']
+            if on_task is not None:
+                on_task('compliance check', task_id)
+        task_info = wait_for_task(dnac_api, task_id, 'compliance check')
+        logger.info('Compliance check status: %s', task_info['progress'])
+        return _get_compliance_checks(dnac_api, device_ids)
+
+
+async def run_compliance_batch_async(dnac_ip, device_ids, tasks=None, on_task=None):
+    """
+    This function will sync the devices with the {device_ids}, run the compliance checks and collect the compliance
+    checks for all the devices, same as run_compliance_batch. The workflow is suspended while waiting for the tasks to
+    complete, used to resume the device sync and compliance tasks started before a restart
+    Call to Cisco DNA Center - /network-device/sync, /compliance, /compliance/detail
+    :param dnac_ip: the Cisco DNA Center IP address
+    :param device_ids: list of device ids
+    :param tasks: optional dict, 'device sync' and 'compliance check' -> the task id started before a restart
+    :param on_task: optional function called with the task name and the task id, when a task is started
+    :return: dict, device id -> list with the device compliance checks
+    """
+    tasks = tasks or {}
+    dnac_api = await workflow_engine.run_blocking(get_dnac_api, dnac_ip)
+    logger.info('Compliance batch started, Cisco DNA Center %s, number of devices: %s', dnac_ip, len(device_ids))
+
+    with metrics.time_step('forcesync', dnac_ip):
+        task_id = tasks.get('device sync')
+        if task_id is None:
+            resync = await workflow_engine.run_blocking(
+                dnac_api.devices.sync_devices_using_forcesync, force_sync=True, payload=device_ids,
+                active_validation=False)
+            task_id = resync['response']['taskId']
+            if on_task is not None:
+                on_task('device sync', task_id)
+        await wait_for_task_async(dnac_api, task_id, 'device sync')
+
+    with metrics.time_step('compliance run', dnac_ip):
+        task_id = tasks.get('compliance check')
+        if task_id is None:
+            run_compliance = await workflow_engine.run_blocking(dnac_api.compliance.run_compliance,
+                                                                deviceUuids=device_ids)
+            task_id = run_compliance['response']['taskId']
+            if on_task is not None:
+                on_task('compliance check', task_id)
+        task_info = await wait_for_task_async(dnac_api, task_id, 'compliance check')
+        logger.info('Compliance check status: %s', task_info['progress'])
+        return await workflow_engine.run_blocking(_get_compliance_checks, dnac_api, device_ids)
+
+
+def _get_compliance_checks(dnac_api, device_ids):
+    """
+    Return the compliance checks for the {device_ids}, the compliance status is retrieved for groups of devices
+    """
+    compliance_checks = {}
+    for index in range(0, len(device_ids), DNAC_DETAIL_CHUNK):
+        device_uuids = ','.join(device_ids[index:index + DNAC_DETAIL_CHUNK])
+        compliance_detail = dnac_api.compliance.get_compliance_detail(device_uuid=device_uuids, limit='500')
+        for check in compliance_detail['response']:
+            compliance_checks.setdefault(check['deviceUuid'], []).append(check)
+    return compliance_checks
+
+
+def run_read_only_commands(dnac_api, device_id, commands):
+    """
+    This function will run the read-only {commands} on the device with the {device_id}, using one Command Runner API call.
+    It will wait for the task to complete and download the file with the commands output
+    Call to Cisco DNA Center - /network-device-poller/cli/read-request, /task/{task_id}, /file/{file_id}
+    :param dnac_api: Cisco DNA Center SDK API object
+    :param device_id: the device id
+    :param commands: list of commands
+    :return: dict, command -> command output
+    """
+    with metrics.time_step('command runner', _dnac_ip(dnac_api)):
+        command_result = dnac_api.command_runner.run_read_only_commands_on_devices(deviceUuids=[device_id],
+                                                                                   commands=commands)
+        task_info = wait_for_task(dnac_api, command_result['response']['taskId'], 'command runner')
+    return _download_command_responses(dnac_api, task_info, commands)
+
+
+async def run_read_only_commands_async(dnac_api, device_id, commands, task_id=None, on_task=None):
+    """
+    This function will run the read-only {commands} on the device with the {device_id}, same as run_read_only_commands.
+    The workflow is suspended while waiting for the task to complete
+    Call to Cisco DNA Center - /network-device-poller/cli/read-request, /task/{task_id}, /file/{file_id}
+    :param dnac_api: Cisco DNA Center SDK API object
+    :param device_id: the device id
+    :param commands: list of commands
+    :param task_id: optional, the id of the Command Runner task started before a restart, the task is not started again
+    :param on_task: optional function called with the task id, when the task is started
+    :return: dict, command -> command output
+    """
+    with metrics.time_step('command runner', _dnac_ip(dnac_api)):
+        if task_id is None:
+            command_result = await workflow_engine.run_blocking(
+                dnac_api.command_runner.run_read_only_commands_on_devices, deviceUuids=[device_id], commands=commands)
+            task_id = command_result['response']['taskId']
+            if on_task:
+                on_task(task_id)
+        task_info = await wait_for_task_async(dnac_api, task_id, 'command runner')
+    return await workflow_engine.run_blocking(_download_command_responses, dnac_api, task_info, commands)
+
+
+def _download_command_responses(dnac_api, task_info, commands):
+    """
+    Download the Command Runner file for the completed task, and return the output for each of the {commands}
+    """
+    file_id = json.loads(task_info['progress'])['fileId']
+    logger.info('The Command Runner file id: %s', file_id)
+
+    with metrics.time_step('file download', _dnac_ip(dnac_api)):
+        # the file is streamed and decoded as it is received, the SDK download function reads all the file to memory.
+        # The SDK session request handles the token refresh and the rate limits, the file response body is not read
+        with dnac_api.session.request('GET', FILE_URL + file_id, EXPECTED_RESPONSE_CODE['GET'], 0,
+                                      stream=True) as file_response:
+            file_json = json_stream.load_chunks(file_response.iter_content(json_stream.CHUNK_SIZE))
+
+    # the file includes the output for each command, grouped by the command status
+    command_responses = file_json[0]['commandResponses']
+    failed_commands = [command for command in commands if command not in command_responses['SUCCESS']]
+    if failed_commands:
+        raise ValueError('Command Runner commands failed: ' + str(failed_commands) + ', ' +
+                         str(command_responses.get('FAILURE')))
+    return command_responses['SUCCESS']
+
+
+def get_task_stats():
+    """
+    This function will return the completion latency statistics for each of the task names
+    :return: dict with the task count, errors, timeouts, average and max latency, in seconds
+    """
+    with task_stats_lock:
+        return {task_name: {'count': stats['count'],
+                            'errors': stats['errors'],
+                            'timeouts': stats['timeouts'],
+                            'latency_avg': round(stats['latency_total'] / stats['count'], 2) if stats['count'] else None,
+                            'latency_max': round(stats['latency_max'], 2)}
+                for task_name, stats in task_stats.items()}
+
+
+def _record_task_latency(task_name, latency, error=False, timed_out=False):
+    """
+    Update the completion latency statistics for the {task_name}
+    """
+    with task_stats_lock:
+        stats = task_stats.setdefault(task_name, {'count': 0, 'errors': 0, 'timeouts': 0,
+                                                  'latency_total': 0.0, 'latency_max': 0.0})
+        if timed_out:
+            stats['timeouts'] += 1
+            return
+        stats['count'] += 1
+        stats['errors'] += int(error)
+        stats['latency_total'] += latency
+        stats['latency_max'] = max(stats['latency_max'], latency)
@@ -0,0 +1,429 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+import os
+import logging
+import gzip
+import json
+import queue
+import atexit
+import time
+import shutil
+import sqlite3
+import threading
+import contextlib
+
+try:
+    import fcntl  # the event log file lock for the multi-process mode, not available on Windows
+except ImportError:
+    fcntl = None
+
+from dotenv import load_dotenv
+
+load_dotenv('environment.env')
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOG_DIR = os.getenv('EVENT_LOG_DIR', 'event_log')  # folder for the event log segments and index
+EVENT_LOG_MAX_SIZE = int(os.getenv('EVENT_LOG_MAX_SIZE', str(64 * 1024 * 1024)))  # max segment size, bytes
+EVENT_LOG_MAX_AGE = int(os.getenv('EVENT_LOG_MAX_AGE', '86400'))  # max segment age, seconds
+EVENT_LOG_MAX_SEGMENTS = int(os.getenv('EVENT_LOG_MAX_SEGMENTS', '90'))  # number of segments kept, 0 to keep all
+EVENT_LOG_BATCH_SIZE = 500  # max number of events written with one index update
+
+LEGACY_LOG_FILE = 'compliance_check_data.log'  # the log file used before the event log, imported as the first segment
+
+log_lock = threading.Lock()
+db = None
+active_segment = None  # {'name': ..., 'file': ..., 'size': ..., 'created': ...}
+next_seq = 1
+event_queue = queue.Queue()
+writer_lock = threading.Lock()
+writer = None
+
+
+def append_event(event):
+    """
+    This function will save the {event} notification to the event log, as one JSON line. The event is written by a
+    background thread, the events received at the same time are written together, with one index update.
+    The segment is rotated and compressed when it is larger than {EVENT_LOG_MAX_SIZE} bytes, or older than
+    {EVENT_LOG_MAX_AGE} seconds
+    :param event: the event notification
+    :return: none
+    """
+    global writer
+    details = event.get('details') if isinstance(event, dict) else None
+    device = details.get('Device') if isinstance(details, dict) else None
+    event_id = event.get('eventId') if isinstance(event, dict) else None
+    with writer_lock:
+        if writer is None or not writer.is_alive():
+            writer = threading.Thread(target=_writer, name='event-log-writer', daemon=True)
+            writer.start()
+            atexit.register(flush_events)
+    event_queue.put((time.time(), event, device, event_id))
+
+
+def flush_events():
+    """
+    This function will wait for all the queued events to be written
+    :return: none
+    """
+    if writer is not None:
+        event_queue.join()
+
+
+def query_events(since=None, device=None, event_id=None, limit=None, after_seq=None):
+    """
+    This function will find the event notifications matching the filters, using the index, and read them from the log
+    segments. The events are returned in the order they were received, while reading the segments
+    :param since: optional, the events received at or after this time, epoch seconds. The events imported from the legacy log file are
+    not returned, the time they were received is not known
+    :param device: optional, the device management IP address
+    :param event_id: optional, the event id
+    :param limit: optional, max number of events
+    :param after_seq: optional, the events with the sequence number higher than {after_seq}, the cursor from a
+    previous query
+    :return: generator of tuples, the event sequence number and the event JSON line
+    """
+    sql, parameters = _events_query('seq, segment, offset, length', since, device, event_id, limit, after_seq)
+
+    # a connection for each query, the reads will not block the writes
+    query_db = _query_connection()
+    segment_name = None
+    segment_file = None
+    try:
+        for seq, segment, offset, length in query_db.execute(sql, parameters):
+            if segment != segment_name:
+                if segment_file:
+                    segment_file.close()
+                segment_name = segment
+                segment_file = _open_segment(segment)
+            if segment_file is None:
+                continue
+            segment_file.seek(offset)
+            yield seq, segment_file.read(length).decode('utf-8')
+    finally:
+        if segment_file:
+            segment_file.close()
+        query_db.close()
+
+
+def get_query_range(since=None, device=None, event_id=None, limit=None, after_seq=None):
+    """
+    This function will return the sequence numbers of the first and last event notifications matching the filters,
+    without reading the events, for example to create the cursor and the ETag for a query
+    :param since: optional, the events received at or after this time, epoch seconds
+    :param device: optional, the device management IP address
+    :param event_id: optional, the event id
+    :param limit: optional, max number of events
+    :param after_seq: optional, the events with the sequence number higher than {after_seq}
+    :return: tuple, the first and last sequence numbers, (None, None) if no events match
+    """
+    sql, parameters = _events_query('seq', since, device, event_id, limit, after_seq)
+    query_db = _query_connection()
+    try:
+        return query_db.execute('SELECT MIN(seq), MAX(seq) FROM (' + sql + ')', parameters).fetchone()
+    finally:
+        query_db.close()
+
+
+def _events_query(columns, since, device, event_id, limit, after_seq):
+    """
+    Return the index query for the events matching the filters, and the query parameters
+    """
+    conditions = []
+    parameters = []
+    for column, operator, value in (('ts', '>=', since), ('device', '=', device), ('event_id', '=', event_id),
+                                    ('seq', '>', after_seq)):
+        if value is not None:
+            conditions.append(column + ' ' + operator + ' ?')
+            parameters.append(value)
+    sql = 'SELECT ' + columns + ' FROM events'
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY seq'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        parameters.append(int(limit))
+    return sql, parameters
+
+
+def _query_connection():
+    """
+    Return a new index connection for a query, the reads will not block the writes
+    """
+    with log_lock:
+        _open_log()
+    return sqlite3.connect(os.path.join(EVENT_LOG_DIR, 'index.db'))
+
+
+def _writer():
+    """
+    Writer thread loop, write the queued events in batches of up to {EVENT_LOG_BATCH_SIZE} events
+    """
+    while True:
+        events = [event_queue.get()]
+        while len(events) < EVENT_LOG_BATCH_SIZE:
+            try:
+                events.append(event_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            with log_lock:
+                _open_log()
+                with _log_file_lock():
+                    _refresh_log()
+                    _write_events(events)
+        except Exception:
+            logger.exception('Events not saved to the event log: %s', len(events))
+        finally:
+            for _ in events:
+                event_queue.task_done()
+
+
+def _write_events(events):
+    """
+    Append the {events} to the active segment, and add them to the index in one transaction, caller holds {log_lock}
+    and the event log file lock
+    """
+    global next_seq
+    rows = []
+    for ts, event, device, event_id in events:
+        line = (json.dumps(event) + '\n').encode('utf-8')
+        if active_segment['size'] and (active_segment['size'] + len(line) > EVENT_LOG_MAX_SIZE or
+                                       time.time() - active_segment['created'] > EVENT_LOG_MAX_AGE):
+            _write_index(rows)
+            rows = []
+            _rotate_segment()
+        active_segment['file'].write(line)
+        rows.append((next_seq, ts, device, event_id, active_segment['name'], active_segment['size'], len(line)))
+        active_segment['size'] += len(line)
+        next_seq += 1
+    _write_index(rows)
+
+
+def _write_index(rows):
+    """
+    Flush the active segment, and add the event {rows} to the index, caller holds {log_lock}
+    """
+    active_segment['file'].flush()
+    if rows:
+        with db:
+            db.executemany('INSERT INTO events (seq, ts, device, event_id, segment, offset, length) '
+                           'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+
+
+def _open_log():
+    """
+    Open the index and the active segment, import the legacy log file, caller holds {log_lock}
+    """
+    global db, active_segment, next_seq
+    if db is not None:
+        return
+    os.makedirs(EVENT_LOG_DIR, exist_ok=True)
+    db = sqlite3.connect(os.path.join(EVENT_LOG_DIR, 'index.db'), check_same_thread=False)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    db.execute('CREATE TABLE IF NOT EXISTS segments (name TEXT PRIMARY KEY, created REAL, compressed INTEGER)')
+    db.execute('CREATE TABLE IF NOT EXISTS events (seq INTEGER PRIMARY KEY, ts REAL, device TEXT, event_id TEXT, '
+               'segment TEXT, offset INTEGER, length INTEGER)')
+    db.execute('CREATE INDEX IF NOT EXISTS events_ts ON events (ts)')
+    db.execute('CREATE INDEX IF NOT EXISTS events_device ON events (device, seq)')
+    db.execute('CREATE INDEX IF NOT EXISTS events_event_id ON events (event_id)')
+    db.commit()
+
+    with _log_file_lock():
+        next_seq = (db.execute('SELECT MAX(seq) FROM events').fetchone()[0] or 0) + 1
+        row = db.execute('SELECT name, created FROM segments WHERE compressed = 0 ORDER BY name DESC '
+                         'LIMIT 1').fetchone()
+        # the legacy log file events were not saved with the time received, they are indexed without a time
+        events_ts = row[1] if row is not None else None
+        if row is None and os.path.exists(LEGACY_LOG_FILE):
+            name = _segment_name(next_seq)
+            shutil.move(LEGACY_LOG_FILE, os.path.join(EVENT_LOG_DIR, name))
+            row = (name, os.path.getmtime(os.path.join(EVENT_LOG_DIR, name)))
+            with db:
+                db.execute('INSERT INTO segments (name, created, compressed) VALUES (?, ?, 0)', row)
+            events_ts = None
+        if row is None:
+            _new_segment()
+        else:
+            active_segment = {'name': row[0], 'file': open(os.path.join(EVENT_LOG_DIR, row[0]), 'ab'),
+                              'created': row[1]}
+            active_segment['size'] = active_segment['file'].tell()
+            _index_segment_tail(events_ts)
+
+    # compress the segments not compressed before the restart
+    for (name,) in db.execute('SELECT name FROM segments WHERE compressed = 0 AND name != ?',
+                              (active_segment['name'],)).fetchall():
+        threading.Thread(target=_compress_segment, args=(name,), name='event-log-compress', daemon=True).start()
+
+
+def _refresh_log():
+    """
+    Update the active segment and the next sequence number, the events may have been written by another worker
+    process, caller holds {log_lock} and the event log file lock
+    """
+    global active_segment, next_seq
+    next_seq = (db.execute('SELECT MAX(seq) FROM events').fetchone()[0] or 0) + 1
+    row = db.execute('SELECT name, created FROM segments WHERE compressed = 0 ORDER BY name DESC LIMIT 1').fetchone()
+    if row is None:
+        active_segment['file'].close()
+        _new_segment()
+    elif row[0] != active_segment['name']:
+        # the segment was rotated by another process
+        active_segment['file'].close()
+        active_segment = {'name': row[0], 'file': open(os.path.join(EVENT_LOG_DIR, row[0]), 'ab'),
+                          'created': row[1]}
+    active_segment['size'] = os.fstat(active_segment['file'].fileno()).st_size
+
+
+@contextlib.contextmanager
+def _log_file_lock():
+    """
+    Lock the event log for the writes, for the worker processes sharing the event log folder, caller holds {log_lock}
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(EVENT_LOG_DIR, 'events.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _index_segment_tail(events_ts):
+    """
+    Index the lines of the active segment written after the last indexed event, for example the legacy log file,
+    or the events not indexed before a restart, with the time {events_ts}, caller holds {log_lock} and the event log
+    file lock
+    """
+    global next_seq
+    row = db.execute('SELECT MAX(offset + length) FROM events WHERE segment = ?', (active_segment['name'],)).fetchone()
+    offset = row[0] or 0
+    if offset >= active_segment['size']:
+        return
+    with open(os.path.join(EVENT_LOG_DIR, active_segment['name']), 'rb') as file, db:
+        file.seek(offset)
+        for line in file:
+            try:
+                event = json.loads(line)
+                details = event.get('details') or {}
+                device, event_id = details.get('Device'), event.get('eventId')
+            except (ValueError, AttributeError):
+                device, event_id = None, None
+            db.execute('INSERT INTO events (seq, ts, device, event_id, segment, offset, length) '
+                       'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                       (next_seq, events_ts, device, event_id, active_segment['name'], offset, len(line)))
+            offset += len(line)
+            next_seq += 1
+
+
+def _new_segment():
+    """
+    Create a new active segment, the segment name includes the sequence number of the first event, caller holds
+    {log_lock} and the event log file lock
+    """
+    global active_segment
+    name = _segment_name(next_seq)
+    created = time.time()
+    with db:
+        db.execute('INSERT INTO segments (name, created, compressed) VALUES (?, ?, 0)', (name, created))
+    active_segment = {'name': name, 'file': open(os.path.join(EVENT_LOG_DIR, name), 'ab'), 'size': 0,
+                      'created': created}
+
+
+def _rotate_segment():
+    """
+    Close the active segment, compress it in the background and create a new active segment, caller holds {log_lock}
+    and the event log file lock
+    """
+    name = active_segment['name']
+    active_segment['file'].close()
+    _new_segment()
+    threading.Thread(target=_compress_segment, args=(name,), name='event-log-compress', daemon=True).start()
+
+
+def _compress_segment(name):
+    """
+    Compress the segment with the {name}, and remove the oldest segments when more than {EVENT_LOG_MAX_SEGMENTS}
+    """
+    try:
+        segment_path = os.path.join(EVENT_LOG_DIR, name)
+        temp_file_path = segment_path + '.' + str(os.getpid()) + '.gz.tmp'
+        try:
+            with open(segment_path, 'rb') as segment_file, gzip.open(temp_file_path, 'wb') as compressed_file:
+                shutil.copyfileobj(segment_file, compressed_file)
+            os.replace(temp_file_path, segment_path + '.gz')
+            os.remove(segment_path)
+        except FileNotFoundError:
+            # the segment was compressed by another worker process
+            return
+        with log_lock:
+            with db:
+                db.execute('UPDATE segments SET compressed = 1 WHERE name = ?', (name,))
+            if EVENT_LOG_MAX_SEGMENTS:
+                _remove_old_segments()
+        logger.info('Event log segment compressed: %s', name)
+    except Exception:
+        logger.exception('Event log segment not compressed: %s', name)
+
+
+def _remove_old_segments():
+    """
+    Remove the oldest compressed segments and their index entries, caller holds {log_lock}
+    """
+    segments = db.execute('SELECT name FROM segments ORDER BY name').fetchall()
+    for (name,) in segments[:max(len(segments) - EVENT_LOG_MAX_SEGMENTS, 0)]:
+        if name == active_segment['name']:
+            continue
+        with db:
+            db.execute('DELETE FROM events WHERE segment = ?', (name,))
+            db.execute('DELETE FROM segments WHERE name = ?', (name,))
+        for path in (os.path.join(EVENT_LOG_DIR, name), os.path.join(EVENT_LOG_DIR, name + '.gz')):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _open_segment(name):
+    """
+    Open the segment with the {name} for reading, the compressed file if the segment was compressed
+    """
+    segment_path = os.path.join(EVENT_LOG_DIR, name)
+    try:
+        return open(segment_path, 'rb')
+    except FileNotFoundError:
+        pass
+    try:
+        return gzip.open(segment_path + '.gz', 'rb')
+    except FileNotFoundError:
+        return None
+
+
+def _segment_name(first_seq):
+    """
+    Return the segment file name, for the segment starting with the event {first_seq}
+    """
+    return 'events_%012d.log' % first_seq
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+# gunicorn settings, start the webhook receiver with: gunicorn -c gunicorn.conf.py wsgi:app
+
+import os
+import shutil
+import multiprocessing
+
+from dotenv import load_dotenv
+
+load_dotenv('environment.env')
+
+# the job workers are started in each worker process, after fork, not when the app is loaded by the master process
+os.environ['JOB_WORKERS_AUTOSTART'] = 'False'
+
+# the Prometheus metrics of all the worker processes, the folder is cleared when gunicorn starts
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.abspath('prometheus_metrics'))
+shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'])
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', str(multiprocessing.cpu_count())))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))  # threads for the webhook requests, for each worker process
+preload_app = True  # the app is loaded once, by the master process, before the worker processes are forked
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '120'))  # max time for the running jobs at shutdown
+
+certfile = os.getenv('TLS_CERT_FILE')
+keyfile = os.getenv('TLS_KEY_FILE')
+
+
+def post_fork(server, worker):
+    """
+    This function will configure the logging and start the job workers in the new worker process
+    :param server: the gunicorn arbiter
+    :param worker: the worker
+    :return: none
+    """
+    import app_logging
+    import compliance_check_receiver
+    app_logging.setup_logging()
+    compliance_check_receiver.start_job_workers()
+
+
+def worker_exit(server, worker):
+    """
+    This function will wait for the running jobs to complete before the worker process exits, the queued jobs are
+    released and resumed by the next worker process started
+    :param server: the gunicorn arbiter
+    :param worker: the worker
+    :return: none
+    """
+    import compliance_check_receiver
+    # keep some time to save the job updates before the worker is killed
+    compliance_check_receiver.stop_job_workers(max(graceful_timeout - 10, 1))
+
+
+def child_exit(server, worker):
+    """
+    This function will remove the in-flight jobs gauges of the worker process that exited
+    :param server: the gunicorn arbiter
+    :param worker: the worker
+    :return: none
+    """
+    import metrics
+    metrics.mark_process_dead(worker.pid)
@@ -0,0 +1,492 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+import os
+import logging
+import time
+import uuid
+import queue
+import inspect
+import functools
+import threading
+import collections
+import workflow_engine
+import job_store
+import metrics
+
+from dotenv import load_dotenv
+
+load_dotenv('environment.env')
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))  # number of workflows executed in parallel
+JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', '100'))  # max number of jobs waiting for a worker
+JOB_HISTORY_SIZE = int(os.getenv('JOB_HISTORY_SIZE', '500'))  # max number of finished jobs to keep for status
+JOB_COALESCE_WINDOW = int(os.getenv('JOB_COALESCE_WINDOW', '300'))  # time to coalesce events after a job finished
+JOB_COALESCE_INDEX_SIZE = int(os.getenv('JOB_COALESCE_INDEX_SIZE', '1000'))  # max number of devices in the index
+
+job_queue = queue.Queue(maxsize=JOB_QUEUE_SIZE)
+jobs = collections.OrderedDict()  # job id -> job record, oldest first
+jobs_lock = threading.Lock()
+recent_jobs = collections.OrderedDict()  # coalesce key -> in-flight or recent job, least recently used first
+workers = []
+worker_count = 0  # max number of jobs executed in parallel
+busy_workers = 0
+draining = threading.Event()  # set when the process is stopping, the queued jobs are not started
+resumer = None  # the thread resuming the jobs with an expired lease
+
+
+def start_workers(job_handler, num_workers=JOB_WORKERS):
+    """
+    This function will start the worker threads that will execute the queued jobs.
+    If the {job_handler} is a coroutine function, the jobs are executed on the workflow engine event loop, up to
+    {num_workers} jobs in parallel, without a thread for each job
+    :param job_handler: function to be called with the job record, for each job
+    :param num_workers: max number of jobs executed in parallel
+    :return: none
+    """
+    global worker_count
+    worker_count += num_workers
+    if inspect.iscoroutinefunction(job_handler):
+        dispatcher = threading.Thread(target=_dispatcher, args=(job_handler, num_workers), name='job-dispatcher',
+                                      daemon=True)
+        dispatcher.start()
+        workers.append(dispatcher)
+        return
+    for i in range(num_workers):
+        worker = threading.Thread(target=_worker, args=(job_handler,), name='job-worker-' + str(i), daemon=True)
+        worker.start()
+        workers.append(worker)
+
+
+def submit_job(payload, coalesce_key=None):
+    """
+    This function will create a new job for the {payload} and add it to the job queue.
+    If a job for the same {coalesce_key} is in-flight, or finished less than {JOB_COALESCE_WINDOW} seconds ago,
+    the event is attached to that job instead of starting a new workflow
+    :param payload: the event notification to be processed
+    :param coalesce_key: the key for the events that will share one workflow, for example the device
+    :return: tuple, the job record, or None if the job queue is full, and True if the event was coalesced
+    """
+    with jobs_lock:
+        primary_job = _find_recent_job(coalesce_key)
+        if primary_job is None and coalesce_key is not None and JOB_COALESCE_WINDOW:
+            # the job for the same device may be owned by another worker process
+            remote_job = job_store.find_recent_job(coalesce_key, JOB_COALESCE_WINDOW)
+            if remote_job is not None and remote_job['finished'] is None:
+                if job_store.attach_event(remote_job['id'], payload):
+                    return remote_job, True
+                remote_job = job_store.get_job(remote_job['id'])
+            if remote_job is not None and remote_job['status'] != 'failed':
+                return _queue_job(payload, coalesced_into=remote_job), True
+        if primary_job is not None and primary_job['finished'] is None:
+            primary_job['attached_events'].append(payload)
+            primary_job['coalesced_events'] += 1
+            job_store.save_job(primary_job)
+            return primary_job, True
+        if primary_job is not None:
+            # the workflow finished, queue a job to post the event to the Webex thread of the finished job
+            primary_job['coalesced_events'] += 1
+            return _queue_job(payload, coalesced_into=primary_job), True
+        job = _queue_job(payload, coalesce_key=coalesce_key)
+        if job is not None and coalesce_key is not None:
+            recent_jobs[coalesce_key] = job
+            while len(recent_jobs) > JOB_COALESCE_INDEX_SIZE:
+                recent_jobs.popitem(last=False)
+        return job, False
+
+
+def pop_attached_events(job):
+    """
+    This function will return the events attached to the {job} since the last call, including the events attached by
+    the other worker processes
+    :param job: the job record
+    :return: list of event notifications
+    """
+    with jobs_lock:
+        events = job['attached_events']
+        job['attached_events'] = []
+        if events:
+            job_store.save_job(job)
+    return events + job_store.pop_attached_events(job['id'])
+
+
+def _queue_job(payload, coalesced_into=None, coalesce_key=None):
+    """
+    Create a job record and add it to the job queue, caller holds {jobs_lock}
+    """
+    job_id = str(uuid.uuid4())
+    job = {
+        'id': job_id,
+        'status': 'queued',
+        'step': None,
+        'error': None,
+        'submitted': time.time(),
+        'started': None,
+        'finished': None,
+        'coalesced_into': coalesced_into['id'] if coalesced_into else None,
+        'coalesced_events': 0,
+        'message_id': coalesced_into['message_id'] if coalesced_into else None,
+        'attached_events': [],
+        'state': {'steps': {}, 'tasks': {}},
+        'payload': payload
+    }
+    if coalesce_key is not None:
+        # saved with the new job, the other worker processes will find it
+        job['coalesce_key'] = coalesce_key
+    try:
+        job_queue.put_nowait(job)
+    except queue.Full:
+        return None
+    metrics.queued_jobs.labels(dnac=_job_dnac(job)).inc()
+    jobs[job_id] = job
+    job_store.create_job(job)
+    _trim_jobs()
+    return job
+
+
+def _find_recent_job(coalesce_key):
+    """
+    Return the in-flight or recent job for the {coalesce_key}, caller holds {jobs_lock}
+    """
+    if coalesce_key is None or not JOB_COALESCE_WINDOW:
+        return None
+    job = recent_jobs.get(coalesce_key)
+    if job is None:
+        return None
+    if job['status'] == 'failed' or (job['finished'] and time.time() - job['finished'] > JOB_COALESCE_WINDOW):
+        del recent_jobs[coalesce_key]
+        return None
+    recent_jobs.move_to_end(coalesce_key)
+    return job
+
+
+def update_job(job, **kwargs):
+    """
+    This function will update the fields of the {job} record, for example the current workflow step
+    :param job: the job record
+    :param kwargs: the fields to update
+    :return: none
+    """
+    with jobs_lock:
+        job.update(kwargs)
+        job_store.save_job(job)
+
+
+def update_job_state(job, key, value, state_type='steps'):
+    """
+    This function will save the result of a completed workflow step, or a Cisco DNA Center task id, in the {job} state.
+    The job state is used to resume the workflow after a restart
+    :param job: the job record
+    :param key: the step name, or the task name
+    :param value: the step result, JSON serializable, or the task id
+    :param state_type: 'steps' or 'tasks'
+    :return: none
+    """
+    with jobs_lock:
+        job['state'][state_type][key] = value
+        job_store.save_job(job)
+
+
+def resume_jobs():
+    """
+    This function will queue again the jobs not completed when the application stopped, or by the worker processes
+    that exited, the workflows will continue from the last completed step. Each job is resumed by only one process.
+    The jobs are queued by a background thread, when the job queue has free slots. The function is called again every
+    half {job_store.JOB_LEASE_TIME} by a background thread, for the jobs of the processes killed
+    :return: number of jobs resumed
+    """
+    global resumer
+    with jobs_lock:
+        if resumer is None or not resumer.is_alive():
+            resumer = threading.Thread(target=_resumer, name='job-resumer', daemon=True)
+            resumer.start()
+    unfinished_jobs = job_store.claim_unfinished_jobs()
+    with jobs_lock:
+        for job in unfinished_jobs:
+            job.update(status='queued', started=None)
+            if job.get('coalesce_key') is not None:
+                job['coalesce_key'] = tuple(job['coalesce_key'])
+                recent_jobs[job['coalesce_key']] = job
+            jobs[job['id']] = job
+            metrics.queued_jobs.labels(dnac=_job_dnac(job)).inc()
+    if unfinished_jobs:
+        threading.Thread(target=lambda: [job_queue.put(job) for job in unfinished_jobs], name='job-resume',
+                         daemon=True).start()
+        logger.info('Jobs resumed: %s', len(unfinished_jobs))
+    return len(unfinished_jobs)
+
+
+def get_job(job_id):
+    """
+    This function will return the status of the job with the {job_id}
+    :param job_id: the job id
+    :return: job status, or None if the job is not known
+    """
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is not None:
+            return _job_summary(job)
+    # the job may be owned by another worker process
+    job = job_store.get_job(job_id)
+    return _job_summary(job) if job is not None else None
+
+
+def drain(timeout):
+    """
+    This function will stop starting the queued jobs, and wait up to {timeout} seconds for the running jobs to
+    complete, for example when the application is stopped. The queued jobs are released, they will be resumed by the
+    next process started
+    :param timeout: max time to wait, in seconds
+    :return: True if all the running jobs completed
+    """
+    draining.set()
+    deadline = time.time() + timeout
+    while busy_workers and time.time() < deadline:
+        time.sleep(0.1)
+    queued_jobs = []
+    while True:
+        try:
+            queued_jobs.append(job_queue.get_nowait())
+        except queue.Empty:
+            break
+        metrics.queued_jobs.labels(dnac=_job_dnac(queued_jobs[-1])).dec()
+        job_queue.task_done()
+    job_store.release_jobs([job['id'] for job in queued_jobs])
+    logger.info('Job workers stopped, running jobs: %s, queued jobs released: %s', busy_workers, len(queued_jobs))
+    return busy_workers == 0
+
+
+def get_queue_status():
+    """
+    This function will return the job queue depth, the jobs by status and by owner process, and the status of the last
+    jobs, for all the worker processes sharing the job store. The worker utilisation and the in-memory queue are
+    returned for the current process, in "process"
+    :return: queue status
+    """
+    with jobs_lock:
+        job_list = {job_id: _job_summary(job) for job_id, job in jobs.items()}
+        busy = busy_workers
+    process_status = {
+        'pid': os.getpid(),
+        'queue_depth': job_queue.qsize(),
+        'queue_size': JOB_QUEUE_SIZE,
+        'workers': worker_count,
+        'busy_workers': busy,
+        'worker_utilisation': round(busy / worker_count, 2) if worker_count else 0
+    }
+    stored_jobs = job_store.get_jobs_status(JOB_HISTORY_SIZE)
+    if stored_jobs is None:
+        # one process, without the job store
+        counts = collections.Counter((job['status'], str(os.getpid())) for job in job_list.values())
+        counts = [(status, owner, count) for (status, owner), count in counts.items()]
+    else:
+        counts, records = stored_jobs
+        # the jobs of the current process are up to date in memory
+        for record in records:
+            job_list.setdefault(record['id'], _job_summary(record))
+    jobs_by_status = collections.Counter()
+    jobs_by_owner = {}
+    for status, owner, count in counts:
+        jobs_by_status[status] += count
+        owner_jobs = jobs_by_owner.setdefault(owner or 'released', {})
+        owner_jobs[status] = owner_jobs.get(status, 0) + count
+    return {
+        'queue_depth': jobs_by_status['queued'],
+        'running_jobs': jobs_by_status['running'],
+        'jobs_by_status': dict(jobs_by_status),
+        'jobs_by_owner': jobs_by_owner,
+        'process': process_status,
+        'jobs': sorted(job_list.values(), key=lambda job: job['submitted'])[-JOB_HISTORY_SIZE:]
+    }
+
+
+def _job_summary(job):
+    """
+    Return the job record without the notification payload
+    """
+    summary = {key: value for key, value in job.items()
+               if key not in ('payload', 'attached_events', 'coalesce_key', 'state')}
+    summary['completed_steps'] = list(job['state']['steps'])
+    summary['tasks'] = dict(job['state']['tasks'])
+    payload = job['payload']
+    summary['eventId'] = payload.get('eventId')
+    summary['instanceId'] = payload.get('instanceId')
+    summary['dnacIP'] = payload.get('dnacIP')
+    summary['device'] = payload['details'].get('Device')
+    return summary
+
+
+def _job_dnac(job):
+    """
+    Return the Cisco DNA Center IP address for the {job}, the metrics label
+    """
+    return job['payload'].get('dnacIP') or ''
+
+
+def _trim_jobs():
+    """
+    Remove the oldest finished jobs when more than {JOB_HISTORY_SIZE} jobs are kept, caller holds {jobs_lock}
+    """
+    excess = len(jobs) - JOB_HISTORY_SIZE
+    if excess <= 0:
+        return
+    for job_id in [job_id for job_id, job in jobs.items() if job['finished'] is not None][:excess]:
+        del jobs[job_id]
+
+
+def _worker(job_handler):
+    """
+    Worker thread loop, execute the {job_handler} for each job from the job queue
+    """
+    while True:
+        job = _next_job()
+        if job is None:
+            continue
+        _start_job(job)
+        try:
+            job_handler(job)
+        except Exception as e:
+            _finish_job(job, e)
+        else:
+            _finish_job(job, None)
+
+
+def _resumer():
+    """
+    Resumer thread loop, resume the jobs with an expired lease every half {job_store.JOB_LEASE_TIME}, until the process
+    is stopping
+    """
+    while not draining.wait(job_store.JOB_LEASE_TIME / 2):
+        try:
+            resume_jobs()
+        except Exception:
+            logger.exception('Jobs not resumed')
+
+
+def _dispatcher(job_handler, num_workers):
+    """
+    Dispatcher thread loop, start the {job_handler} coroutine for each job from the job queue, on the workflow engine
+    event loop, up to {num_workers} jobs in parallel
+    """
+    job_slots = threading.BoundedSemaphore(num_workers)
+    while True:
+        job_slots.acquire()
+        job = _next_job()
+        if job is None:
+            job_slots.release()
+            continue
+        _start_job(job)
+        future = workflow_engine.run_coroutine(_run_job(job_handler, job))
+        future.add_done_callback(functools.partial(_coroutine_done, job, job_slots))
+
+
+async def _run_job(job_handler, job):
+    """
+    Run the {job_handler} coroutine for the {job}, the job record is updated in an executor thread, the job store
+    writes will not block the event loop
+    """
+    try:
+        await job_handler(job)
+    except Exception as e:
+        await workflow_engine.run_blocking(_finish_job, job, e)
+    else:
+        await workflow_engine.run_blocking(_finish_job, job, None)
+
+
+def _coroutine_done(job, job_slots, future):
+    """
+    Release the job slot when the job coroutine is done
+    """
+    job_slots.release()
+    if not future.cancelled() and future.exception() is not None:
+        logger.error('Job %s not finished', job['id'], exc_info=future.exception())
+
+
+def _next_job():
+    """
+    Return the next job from the job queue, or None if the workers are draining, the job is released
+    """
+    job = job_queue.get()
+    if not draining.is_set():
+        return job
+    metrics.queued_jobs.labels(dnac=_job_dnac(job)).dec()
+    job_store.release_jobs([job['id']])
+    job_queue.task_done()
+    return None
+
+
+def _start_job(job):
+    """
+    Mark the {job} running
+    """
+    global busy_workers
+    with jobs_lock:
+        busy_workers += 1
+        job.update(status='running', started=time.time())
+        metrics.queued_jobs.labels(dnac=_job_dnac(job)).dec()
+        metrics.running_jobs.labels(dnac=_job_dnac(job)).inc()
+        job_store.save_job(job)
+
+
+def _finish_job(job, error):
+    """
+    Mark the {job} completed, or failed if the workflow raised the {error}
+    """
+    global busy_workers
+    try:
+        if error is not None:
+            logger.error('Job %s failed', job['id'], exc_info=error)
+            metrics.count_event(_job_dnac(job), 'failed')
+        with jobs_lock:
+            if error is None:
+                job.update(status='completed', finished=time.time())
+            else:
+                job.update(status='failed', error=repr(error), finished=time.time())
+            # the events attached after the workflow posted the last update, by this process or the other processes
+            events = job['attached_events'] + job_store.finish_job(job)
+            job['attached_events'] = []
+            if error is None:
+                # post the events to the Webex thread
+                for payload in events:
+                    if _queue_job(payload, coalesced_into=job) is None:
+                        _event_dropped(job, payload)
+        if error is not None:
+            # the attached events will start a new workflow
+            for payload in events:
+                if submit_job(payload, job.get('coalesce_key'))[0] is None:
+                    _event_dropped(job, payload)
+    finally:
+        with jobs_lock:
+            busy_workers -= 1
+        metrics.running_jobs.labels(dnac=_job_dnac(job)).dec()
+        job_queue.task_done()
+
+
+def _event_dropped(job, payload):
+    """
+    Log the event attached to the {job}, not queued after the job finished because the job queue is full
+    """
+    logger.warning('Job queue full, event attached to Job Id: %s dropped, instanceId: %s', job['id'],
+                   payload.get('instanceId'))
+    metrics.count_event(payload.get('dnacIP'), 'rejected')
@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+import os
+import logging
+import time
+import uuid
+import json
+import sqlite3
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv('environment.env')
+
+logger = logging.getLogger(__name__)
+
+JOB_STORE_FILE = os.getenv('JOB_STORE_FILE', 'compliance_jobs.db')  # SQLite database for the jobs, '' to disable
+JOB_STORE_FLUSH_INTERVAL = float(os.getenv('JOB_STORE_FLUSH_INTERVAL', '0.5'))  # time between the batched writes
+JOB_STORE_RETENTION = int(os.getenv('JOB_STORE_RETENTION', '86400'))  # time to keep the finished jobs, seconds
+JOB_LEASE_TIME = float(os.getenv('JOB_LEASE_TIME', '60'))  # the jobs not renewed by the owner for this time are resumed
+
+connection = None
+connection_pid = None
+connection_lock = threading.Lock()
+pending_jobs = {}  # job id -> the last job record not written to the database
+pending_lock = threading.Lock()
+flusher = None
+owner = None  # (process id, owner id) of the current process
+lease_renewed = 0  # the last time the leases of the jobs owned by the current process were renewed
+
+
+def create_job(job):
+    """
+    This function will save the new {job} to the database, the function will return after the job is written.
+    The job is owned by the current process, with a lease of {JOB_LEASE_TIME} seconds renewed by the flusher thread,
+    the other processes will not resume the job while the lease is renewed
+    :param job: the job record
+    :return: none
+    """
+    if not JOB_STORE_FILE:
+        return
+    with connection_lock:
+        _write_jobs(_get_connection(), [_job_row(job)])
+    _start_flusher()
+
+
+def save_job(job):
+    """
+    This function will save the updated {job}. The updates are written by a background thread, every
+    {JOB_STORE_FLUSH_INTERVAL} seconds, one transaction for all the jobs updated since the last write
+    :param job: the job record
+    :return: none
+    """
+    if not JOB_STORE_FILE:
+        return
+    row = _job_row(job)
+    with pending_lock:
+        pending_jobs[job['id']] = row
+    _start_flusher()
+
+
+def finish_job(job):
+    """
+    This function will save the finished {job} right away, and return the events attached to the job by the other
+    processes. The events can not be attached to the job after this function returns
+    :param job: the job record
+    :return: list of the event notifications attached to the job
+    """
+    if not JOB_STORE_FILE:
+        return []
+    with connection_lock:
+        db = _get_connection()
+        with pending_lock:
+            pending_jobs.pop(job['id'], None)
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            _write_rows(db, [_job_row(job)])
+            return _pop_attached_events(db, job['id'])
+
+
+def get_job(job_id):
+    """
+    This function will return the {job_id} job record from the database, for the jobs owned by the other processes
+    :param job_id: the job id
+    :return: the job record, or None if not found
+    """
+    if not JOB_STORE_FILE:
+        return None
+    with connection_lock:
+        row = _get_connection().execute('SELECT record FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def find_recent_job(coalesce_key, window):
+    """
+    This function will find the last job for the {coalesce_key} owned by another process, in-flight or finished less
+    than {window} seconds ago
+    :param coalesce_key: the coalesce key, for example the device
+    :param window: the time, in seconds
+    :return: the job record, or None if not found
+    """
+    if not JOB_STORE_FILE:
+        return None
+    with connection_lock:
+        row = _get_connection().execute(
+            "SELECT record FROM jobs WHERE coalesce_key = ? AND owner IS NOT ? AND status != 'failed' AND "
+            "(finished IS NULL OR finished > ?) ORDER BY submitted DESC LIMIT 1",
+            (json.dumps(list(coalesce_key)), _owner(), time.time() - window)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def get_jobs_status(limit):
+    """
+    This function will return the number of jobs by status and owner, and the last jobs, for all the worker processes.
+    The pending updates are written first
+    :param limit: max number of jobs returned
+    :return: tuple, list of (status, owner, number of jobs) and the list of the last {limit} job records, or None if the
+    job store is not enabled
+    """
+    if not JOB_STORE_FILE:
+        return None
+    flush()
+    with connection_lock:
+        db = _get_connection()
+        counts = db.execute('SELECT status, owner, COUNT(*) FROM jobs GROUP BY status, owner').fetchall()
+        rows = db.execute('SELECT record FROM jobs ORDER BY submitted DESC LIMIT ?', (limit,)).fetchall()
+    return counts, [json.loads(row[0]) for row in rows]
+
+
+def attach_event(job_id, payload):
+    """
+    This function will attach the event {payload} to the in-flight job with the {job_id}, owned by another process.
+    The owner process will post the event to the job Webex thread
+    :param job_id: the job id
+    :param payload: the event notification
+    :return: True if the event was attached, False if the job is finished
+    """
+    if not JOB_STORE_FILE:
+        return False
+    with connection_lock:
+        db = _get_connection()
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            if db.execute('SELECT 1 FROM jobs WHERE id = ? AND finished IS NULL', (job_id,)).fetchone() is None:
+                return False
+            db.execute('INSERT INTO attached_events (job_id, payload) VALUES (?, ?)', (job_id, json.dumps(payload)))
+    return True
+
+
+def pop_attached_events(job_id):
+    """
+    This function will return the events attached to the job with the {job_id} by the other processes, since the last
+    call
+    :param job_id: the job id
+    :return: list of event notifications
+    """
+    if not JOB_STORE_FILE:
+        return []
+    with connection_lock:
+        db = _get_connection()
+        with db:
+            return _pop_attached_events(db, job_id)
+
+
+def add_playbook_device(device):
+    """
+    This function will save the {device} remediation for the consolidated playbook, the devices are shared by the
+    worker processes. For a device added again before the playbook is posted, the last remediation is saved
+    :param device: the device remediation, {'device_name': ..., 'dnac_host': ..., 'cli_template': ...}
+    :return: the time the first device not posted was added, the start of the playbook window, or None if the job
+    store is disabled
+    """
+    if not JOB_STORE_FILE:
+        return None
+    with connection_lock:
+        db = _get_connection()
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            db.execute('INSERT INTO playbook_devices (dnac_host, device_name, added, record) VALUES (?, ?, ?, ?) '
+                       'ON CONFLICT (dnac_host, device_name) DO UPDATE SET record = excluded.record',
+                       (device['dnac_host'], device['device_name'], time.time(), json.dumps(device)))
+            return db.execute('SELECT MIN(added) FROM playbook_devices').fetchone()[0]
+
+
+def pop_playbook_devices(added_before=None):
+    """
+    This function will return and remove the devices saved for the consolidated playbook, added before the time
+    {added_before}. Each device is returned to only one process
+    :param added_before: optional, the end of the playbook window, epoch seconds, all the devices if None
+    :return: tuple, the list of device remediations, oldest first, and the time the first device not returned was
+    added, or None
+    """
+    if not JOB_STORE_FILE:
+        return [], None
+    if added_before is None:
+        added_before = float('inf')
+    with connection_lock:
+        db = _get_connection()
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            rows = db.execute('SELECT record FROM playbook_devices WHERE added <= ? ORDER BY added',
+                              (added_before,)).fetchall()
+            db.execute('DELETE FROM playbook_devices WHERE added <= ?', (added_before,))
+            next_added = db.execute('SELECT MIN(added) FROM playbook_devices').fetchone()[0]
+    return [json.loads(record) for (record,) in rows], next_added
+
+
+def claim_unfinished_jobs():
+    """
+    This function will claim the jobs not completed by the processes that are not running anymore, for example the
+    jobs in-flight when the application was restarted. The jobs are claimed when released, or when the owner process
+    did not renew the job lease for {JOB_LEASE_TIME} seconds. Each job is claimed by only one process
+    :return: list of the claimed job records, oldest first
+    """
+    if not JOB_STORE_FILE:
+        return []
+    claimed_jobs = []
+    with connection_lock:
+        db = _get_connection()
+        rows = db.execute("SELECT id, owner, lease, record FROM jobs WHERE status IN ('queued', 'running') AND "
+                          "(owner IS NULL OR lease IS NULL OR lease < ?) ORDER BY submitted",
+                          (time.time(),)).fetchall()
+        with db:
+            for job_id, owner, lease, record in rows:
+                if owner == _owner():
+                    continue
+                # the job is claimed only if the owner and the lease were not changed by another process
+                cursor = db.execute('UPDATE jobs SET owner = ?, lease = ? WHERE id = ? AND owner IS ? AND lease IS ?',
+                                    (_owner(), time.time() + JOB_LEASE_TIME, job_id, owner, lease))
+                if cursor.rowcount:
+                    claimed_jobs.append(json.loads(record))
+    if claimed_jobs:
+        _start_flusher()
+    return claimed_jobs
+
+
+def release_jobs(job_ids):
+    """
+    This function will release the jobs with the {job_ids} not started by the current process, for example when the
+    process is stopped, the jobs will be claimed by the next process started
+    :param job_ids: list of job ids
+    :return: none
+    """
+    if not JOB_STORE_FILE or not job_ids:
+        return
+    flush()
+    with connection_lock:
+        db = _get_connection()
+        with db:
+            db.executemany('UPDATE jobs SET owner = NULL WHERE id = ? AND owner = ?',
+                           [(job_id, _owner()) for job_id in job_ids])
+
+
+def flush():
+    """
+    This function will write the pending job updates to the database
+    :return: none
+    """
+    if not JOB_STORE_FILE:
+        return
+    # the connection lock is held while collecting the updates, the writes will not be reordered
+    with connection_lock:
+        with pending_lock:
+            rows = list(pending_jobs.values())
+            pending_jobs.clear()
+        if rows:
+            _write_jobs(_get_connection(), rows)
+
+
+def _owner():
+    """
+    Return the owner id for the jobs created by the current process, "{process id}:{random id}", the random id is
+    required when the process ids are reused, for example in a container. The jobs are owned while the lease is renewed
+    """
+    global owner
+    if owner is None or owner[0] != os.getpid():
+        owner = (os.getpid(), str(os.getpid()) + ':' + uuid.uuid4().hex[:8])
+    return owner[1]
+
+
+def _renew_leases():
+    """
+    Renew the lease of the jobs owned by the current process, not finished, caller holds {connection_lock}
+    """
+    global lease_renewed
+    lease_renewed = time.time()
+    db = _get_connection()
+    with db:
+        db.execute('UPDATE jobs SET lease = ? WHERE owner = ? AND finished IS NULL',
+                   (lease_renewed + JOB_LEASE_TIME, _owner()))
+
+
+def _start_flusher():
+    """
+    Start the flusher thread, if not running
+    """
+    global flusher
+    with pending_lock:
+        if flusher is None or not flusher.is_alive():
+            flusher = threading.Thread(target=_flusher, name='job-store-flusher', daemon=True)
+            flusher.start()
+
+
+def _get_connection():
+    """
+    Return the database connection, create the tables if needed, caller holds {connection_lock}
+    """
+    global connection, connection_pid
+    if connection is None or connection_pid != os.getpid():
+        # a new connection for a forked worker process, the connections can not be shared by processes
+        connection_pid = os.getpid()
+        connection = sqlite3.connect(JOB_STORE_FILE, timeout=30, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT, submitted REAL, '
+                           'finished REAL, record TEXT)')
+        # the owner, coalesce key and lease columns were added for the multi-process mode
+        columns = [row[1] for row in connection.execute('PRAGMA table_info(jobs)')]
+        for column, column_type in (('owner', 'TEXT'), ('coalesce_key', 'TEXT'), ('lease', 'REAL')):
+            if column not in columns:
+                connection.execute('ALTER TABLE jobs ADD COLUMN ' + column + ' ' + column_type)
+        connection.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)')
+        connection.execute('CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished)')
+        connection.execute('CREATE INDEX IF NOT EXISTS jobs_coalesce_key ON jobs (coalesce_key, submitted)')
+        connection.execute('CREATE TABLE IF NOT EXISTS attached_events (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                           'job_id TEXT, payload TEXT)')
+        connection.execute('CREATE INDEX IF NOT EXISTS attached_events_job_id ON attached_events (job_id)')
+        connection.execute('CREATE TABLE IF NOT EXISTS playbook_devices (dnac_host TEXT, device_name TEXT, added REAL, '
+                           'record TEXT, PRIMARY KEY (dnac_host, device_name))')
+        connection.commit()
+    return connection
+
+
+def _job_row(job):
+    """
+    Return the database row for the {job}
+    """
+    coalesce_key = job.get('coalesce_key')
+    return (job['id'], job['status'], job['submitted'], job['finished'], _owner(), time.time() + JOB_LEASE_TIME,
+            json.dumps(list(coalesce_key)) if coalesce_key is not None else None, json.dumps(job))
+
+
+def _write_jobs(db, rows):
+    """
+    Write the job {rows} in one transaction, and remove the old finished jobs, caller holds {connection_lock}
+    """
+    with db:
+        _write_rows(db, rows)
+        db.execute('DELETE FROM jobs WHERE finished < ?', (time.time() - JOB_STORE_RETENTION,))
+
+
+def _write_rows(db, rows):
+    """
+    Write the job {rows}, caller holds {connection_lock}
+    """
+    db.executemany('INSERT OR REPLACE INTO jobs (id, status, submitted, finished, owner, lease, coalesce_key, record) '
+                   'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+
+def _pop_attached_events(db, job_id):
+    """
+    Return and remove the events attached to the job with the {job_id}, caller holds {connection_lock}
+    """
+    rows = db.execute('SELECT id, payload FROM attached_events WHERE job_id = ? ORDER BY id', (job_id,)).fetchall()
+    if rows:
+        db.execute('DELETE FROM attached_events WHERE job_id = ? AND id <= ?', (job_id, rows[-1][0]))
+    return [json.loads(payload) for _, payload in rows]
+
+
+def _flusher():
+    """
+    Flusher thread loop, write the pending job updates every {JOB_STORE_FLUSH_INTERVAL} seconds, and renew the job
+    leases three times for each {JOB_LEASE_TIME}
+    """
+    while True:
+        time.sleep(JOB_STORE_FLUSH_INTERVAL)
+        try:
+            flush()
+            if time.time() - lease_renewed > JOB_LEASE_TIME / 3:
+                with connection_lock:
+                    _renew_leases()
+        except Exception:
+            logger.exception('Job updates not saved')
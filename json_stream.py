@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import re
+import json
+import codecs
+
+CHUNK_SIZE = 65536  # the size of the chunks read from the streamed responses, bytes
+
+HIGH_SURROGATE = re.compile(r'\\u[dD][89abAB][0-9a-fA-F]{2}')  # the first escape sequence of a surrogate pair
+SCALAR = re.compile(r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?|true|false|null')
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+DELIMITER = re.compile(r'[ \t\n\r,\]}]')
+
+
+def load_chunks(chunks):
+    """
+    This function will decode the JSON document from the {chunks}, for example a streamed API response. The bytes are
+    decoded as they are received, the response is not saved in memory, and the long strings, the command outputs,
+    are copied once, the peak memory is about two times the size of the longest string
+    :param chunks: iterable of bytes, UTF-8 encoded JSON
+    :return: the JSON document
+    """
+    reader = _Reader(chunks)
+    value = _parse_value(reader)
+    if reader.peek():
+        raise ValueError('Extra data after the JSON document, position ' + str(reader.offset + reader.pos))
+    return value
+
+
+class _Reader(object):
+    """
+    The decoded text buffer, filled from the chunks as the document is parsed
+    """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.offset = 0  # the document position of the buffer start, for the error messages
+        self.eof = False
+
+    def fill(self):
+        """
+        Add the next chunk to the buffer, the parsed text is removed. Return False at the end of the document
+        """
+        while not self.eof:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.eof = True
+                text = self.decoder.decode(b'', final=True)
+            else:
+                text = self.decoder.decode(chunk)
+            if text:
+                self.offset += self.pos
+                self.buf = self.buf[self.pos:] + text
+                self.pos = 0
+                return True
+        return False
+
+    def peek(self):
+        """
+        Skip the whitespace, and return the next character, or '' at the end of the document
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        """
+        Skip the next character, {char}
+        """
+        if self.peek() != char:
+            raise ValueError('Expecting "' + char + '", position ' + str(self.offset + self.pos))
+        self.pos += 1
+
+
+def _parse_value(reader):
+    """
+    Parse the next JSON value
+    """
+    char = reader.peek()
+    if char == '{':
+        reader.pos += 1
+        value = {}
+        if reader.peek() == '}':
+            reader.pos += 1
+            return value
+        while True:
+            if reader.peek() != '"':
+                raise ValueError('Expecting property name, position ' + str(reader.offset + reader.pos))
+            key = _parse_string(reader)
+            reader.expect(':')
+            value[key] = _parse_value(reader)
+            if reader.peek() == ',':
+                reader.pos += 1
+                continue
+            reader.expect('}')
+            return value
+    if char == '[':
+        reader.pos += 1
+        value = []
+        if reader.peek() == ']':
+            reader.pos += 1
+            return value
+        while True:
+            value.append(_parse_value(reader))
+            if reader.peek() == ',':
+                reader.pos += 1
+                continue
+            reader.expect(']')
+            return value
+    if char == '"':
+        return _parse_string(reader)
+    # the numbers and literals are complete when followed by a delimiter, or at the end of the document
+    while DELIMITER.search(reader.buf, reader.pos) is None and reader.fill():
+        pass
+    match = SCALAR.match(reader.buf, reader.pos)
+    if not match:
+        raise ValueError('Expecting value, position ' + str(reader.offset + reader.pos))
+    reader.pos = match.end()
+    return json.loads(match.group())
+
+
+def _parse_string(reader):
+    """
+    Parse the string starting at the current position, the string is decoded one buffer at a time
+    """
+    reader.pos += 1
+    pieces = []
+    while True:
+        try:
+            value, reader.pos = json.decoder.scanstring(reader.buf, reader.pos)
+            pieces.append(value)
+            return ''.join(pieces)
+        except ValueError as e:
+            # the string continues in the next chunk, the other errors are raised
+            if not e.msg.startswith('Unterminated string') and e.pos < len(reader.buf) - 12:
+                raise
+        # decode the buffer, except an escape sequence, or a surrogate pair, at the end of the buffer
+        end = len(reader.buf)
+        backslash = reader.buf.rfind('\\', max(reader.pos, end - 12))
+        if backslash != -1 and _is_escape(reader.buf, backslash, reader.pos):
+            end = backslash
+            if end - 6 >= reader.pos and HIGH_SURROGATE.match(reader.buf, end - 6) and \
+                    _is_escape(reader.buf, end - 6, reader.pos):
+                end -= 6
+        if end > reader.pos:
+            pieces.append(json.decoder.scanstring(reader.buf[reader.pos:end] + '"', 0)[0])
+            reader.pos = end
+        if not reader.fill():
+            raise ValueError('Unterminated string, position ' + str(reader.offset + reader.pos))
+
+
+def _is_escape(buf, index, start):
+    """
+    Return True if the backslash at the {index} starts an escape sequence, not preceded by an escaped backslash
+    """
+    backslashes = 0
+    while index - backslashes - 1 >= start and buf[index - backslashes - 1] == '\\':
+        backslashes += 1
+    return backslashes % 2 == 0
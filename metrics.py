@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import os
+import prometheus_client
+
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, multiprocess
+from dotenv import load_dotenv
+
+load_dotenv('environment.env')
+
+# the step duration buckets, seconds, from the Webex posts to the Cisco DNA Center tasks
+STEP_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+step_duration = Histogram('compliance_step_duration_seconds', 'Duration of the compliance workflow steps',
+                          ['step', 'dnac'], buckets=STEP_BUCKETS)
+events = Counter('compliance_events_total',
+                 'Event notifications, by result: received, resolved, deduped, rejected, failed', ['dnac', 'result'])
+queued_jobs = Gauge('compliance_jobs_queued', 'Compliance check jobs waiting for a worker', ['dnac'],
+                    multiprocess_mode='livesum')
+running_jobs = Gauge('compliance_jobs_in_flight', 'Compliance check jobs in-flight', ['dnac'],
+                     multiprocess_mode='livesum')
+
+
+def time_step(step, dnac_ip):
+    """
+    This function will measure the duration of the workflow {step}, use as a context manager:
+    "with metrics.time_step('device lookup', dnac_ip):"
+    :param step: the step name
+    :param dnac_ip: the Cisco DNA Center IP address
+    :return: the context manager
+    """
+    return step_duration.labels(step=step, dnac=dnac_ip or '').time()
+
+
+def count_event(dnac_ip, result):
+    """
+    This function will count an event notification
+    :param dnac_ip: the Cisco DNA Center IP address
+    :param result: 'received', 'resolved', 'deduped', 'rejected' or 'failed'
+    :return: none
+    """
+    events.labels(dnac=dnac_ip or '', result=result).inc()
+
+
+def generate_metrics():
+    """
+    This function will return the metrics in the Prometheus text format. With multiple worker processes, the metrics
+    are collected from the files saved by all the workers to the folder {PROMETHEUS_MULTIPROC_DIR}
+    :return: tuple, the metrics text and the content type
+    """
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """
+    This function will remove the gauge values of the worker process with the {pid}, when the worker exits
+    :param pid: the worker process id
+    :return: none
+    """
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
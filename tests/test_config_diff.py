@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import config_diff
+
+ACL_CONFIG = """version 17.3
+ip access-list extended TEST
+ permit tcp any host 10.1.1.1 eq 22
+ deny   ip any any
+!
+interface Loopback0
+ ip address 10.2.2.2 255.255.255.255
+!
+end
+"""
+
+BGP_CONFIG = """version 17.3
+router bgp 65002
+ bgp log-neighbor-changes
+ address-family ipv4
+  neighbor 10.93.141.42 activate
+ exit-address-family
+ address-family ipv6
+  neighbor 10.93.141.42 activate
+ exit-address-family
+!
+end
+"""
+
+BANNER_CONFIG = """version 17.3
+banner motd ^C
+Authorized access only
+Disconnect now
+^C
+hostname PDX-RN
+end
+"""
+
+
+def test_identical_configs():
+    diff = config_diff.diff_configs(ACL_CONFIG, ACL_CONFIG)
+    assert diff == {'sections': [], 'added': [], 'removed': []}
+
+
+def test_reordered_access_list():
+    new_config = ACL_CONFIG.replace(' permit tcp any host 10.1.1.1 eq 22\n deny   ip any any\n',
+                                    ' deny   ip any any\n permit tcp any host 10.1.1.1 eq 22\n')
+    diff = config_diff.diff_configs(ACL_CONFIG, new_config)
+    assert [section['header'] for section in diff['sections']] == ['ip access-list extended TEST']
+    assert diff['sections'][0]['status'] == 'changed'
+    assert diff['added'] and diff['removed']
+    assert config_diff.remediation_cli(diff).splitlines() == [
+        'no ip access-list extended TEST',
+        'ip access-list extended TEST',
+        ' permit tcp any host 10.1.1.1 eq 22',
+        ' deny   ip any any']
+
+
+def test_line_added_to_access_list():
+    new_config = ACL_CONFIG.replace(' deny   ip any any\n', ' permit ip any any\n deny   ip any any\n')
+    diff = config_diff.diff_configs(ACL_CONFIG, new_config)
+    assert diff['added'] == [' permit ip any any']
+    assert diff['removed'] == []
+    assert 'restore' not in diff['sections'][0]
+    assert config_diff.remediation_cli(diff).splitlines() == ['ip access-list extended TEST', ' no permit ip any any']
+
+
+def test_duplicate_lines():
+    old_config = 'route-map RM permit 10\n match ip address 1\n match ip address 1\n set metric 10\n'
+    new_config = 'route-map RM permit 10\n match ip address 1\n set metric 10\n'
+    diff = config_diff.diff_configs(old_config, new_config)
+    assert diff['removed'] == [' match ip address 1']
+    assert diff['added'] == []
+    assert config_diff.diff_configs(new_config, old_config)['added'] == [' match ip address 1']
+
+
+def test_changed_banner():
+    new_config = BANNER_CONFIG.replace('Disconnect now\n', 'Welcome\n')
+    diff = config_diff.diff_configs(BANNER_CONFIG, new_config)
+    assert diff['added'] == ['Welcome']
+    assert diff['removed'] == ['Disconnect now']
+    assert config_diff.remediation_cli(diff).splitlines() == [
+        'banner motd ^C', 'Authorized access only', 'Disconnect now', '^C']
+
+
+def test_banner_lines_not_sections():
+    sections = config_diff.parse_config(BANNER_CONFIG)
+    assert ('Authorized access only', 1) not in sections
+    assert sections[('banner motd ^C', 1)]['children'][-1] == ((), '^C')
+    assert ('hostname PDX-RN', 1) in sections
+
+
+def test_nested_address_family_paths():
+    new_config = BGP_CONFIG.replace(' address-family ipv6\n  neighbor 10.93.141.42 activate\n',
+                                    ' address-family ipv6\n  neighbor 10.93.141.42 activate\n'
+                                    '  neighbor 10.93.141.43 activate\n')
+    diff = config_diff.diff_configs(BGP_CONFIG, new_config)
+    assert diff['sections'][0]['lines'] == [(' ', 'router bgp 65002'),
+                                            (' ', ' address-family ipv6'),
+                                            ('+', '  neighbor 10.93.141.43 activate')]
+    assert config_diff.remediation_cli(diff).splitlines() == [
+        'router bgp 65002', ' address-family ipv6', '  no neighbor 10.93.141.43 activate']
+
+
+def test_same_line_under_different_parents():
+    new_config = BGP_CONFIG.replace(' address-family ipv4\n  neighbor 10.93.141.42 activate\n',
+                                    ' address-family ipv4\n')
+    diff = config_diff.diff_configs(BGP_CONFIG, new_config)
+    assert diff['sections'][0]['lines'] == [(' ', 'router bgp 65002'),
+                                            (' ', ' address-family ipv4'),
+                                            ('-', '  neighbor 10.93.141.42 activate')]
+    assert 'restore' not in diff['sections'][0]
+
+
+def test_added_and_removed_sections():
+    new_config = ACL_CONFIG.replace('interface Loopback0\n ip address 10.2.2.2 255.255.255.255\n',
+                                    'interface Loopback1\n ip address 10.3.3.3 255.255.255.255\n')
+    diff = config_diff.diff_configs(ACL_CONFIG, new_config)
+    assert [(section['header'], section['status']) for section in diff['sections']] == [
+        ('interface Loopback1', 'added'), ('interface Loopback0', 'removed')]
+    assert config_diff.remediation_cli(diff).splitlines() == [
+        'no interface Loopback1', '!', 'interface Loopback0', ' ip address 10.2.2.2 255.255.255.255']
+
+
+def test_strip_config_header():
+    command_output = 'show running-config\nBuilding configuration...\nversion 17.3\nhostname PDX-RN\n'
+    assert config_diff.strip_config_header(command_output, 'show running-config') == ' 17.3\nhostname PDX-RN\n'
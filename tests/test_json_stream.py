@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import json
+import random
+
+import pytest
+
+import json_stream
+
+
+def chunks(data, size):
+    return (data[index:index + size] for index in range(0, len(data), size))
+
+
+def every_split(data):
+    """
+    The {data} split in two chunks at every position, and in one byte chunks
+    """
+    for index in range(len(data) + 1):
+        yield [data[:index], data[index:]]
+    yield list(chunks(data, 1))
+
+
+COMMAND_RUNNER_FILE = json.dumps([{
+    'deviceUuid': 'a1b2c3',
+    'commandResponses': {
+        'SUCCESS': {'show running-config': 'show running-config\nBuilding configuration...\n' +
+                                           'interface Loopback0\n description "lab" \\ é 😀\n' * 200},
+        'FAILURE': {},
+        'BLACKLISTED': {}}}]).encode('utf-8')
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 65536])
+def test_command_runner_file(chunk_size):
+    assert json_stream.load_chunks(chunks(COMMAND_RUNNER_FILE, chunk_size)) == json.loads(COMMAND_RUNNER_FILE)
+
+
+@pytest.mark.parametrize('document', [
+    '"line\\nnext \\"quoted\\" back\\\\slash \\/ \\t \\u00e9"',
+    '"\\\\\\\\\\\\"',
+    '"\\ud83d\\ude00 and \\uD83D\\uDE00"',
+    '"lone \\ud83d high and \\ude00 low surrogates"',
+    '"é 😀 €"',
+    '{"a": [1, -2.5e3, 0, true, false, null, {"b": ""}], "c": {}}',
+    '-1500.25',
+    '  [ 1 , 2 ]  ',
+])
+def test_split_at_every_position(document):
+    data = document.encode('utf-8')
+    expected = json.loads(data)
+    for split_chunks in every_split(data):
+        assert json_stream.load_chunks(split_chunks) == expected
+
+
+def test_escaped_text():
+    rng = random.Random(3)
+    for _ in range(200):
+        text = ''.join(rng.choice(['a', '\\', '"', '\n', '😀', '\ud83d', '\ude00', 'é', '\x01', ' '])
+                       for _ in range(rng.randint(0, 40)))
+        for ensure_ascii in (False, True):
+            try:
+                data = json.dumps({'text': text}, ensure_ascii=ensure_ascii).encode('utf-8')
+            except UnicodeEncodeError:
+                continue
+            for chunk_size in (1, 3, 5):
+                assert json_stream.load_chunks(chunks(data, chunk_size)) == json.loads(data)
+
+
+def test_truncated_input():
+    data = COMMAND_RUNNER_FILE[:2000] + b'"}}}]'
+    assert json.loads(data)
+    for index in range(len(data)):
+        with pytest.raises(ValueError):
+            json_stream.load_chunks(chunks(data[:index], 7))
+
+
+@pytest.mark.parametrize('data', [b'[1] x', b'{"a": 1} {}', b'"a" "b"', b'1 2', b'null,'])
+def test_trailing_data(data):
+    for chunk_size in (1, 100):
+        with pytest.raises(ValueError):
+            json_stream.load_chunks(chunks(data, chunk_size))
+
+
+@pytest.mark.parametrize('data', [b'[1,', b'{"a" 1}', b'"\\x"', b'tru', b'', b'{"a":1,}', b'\xff', b'[1.]', b'01',
+                                  b'"a\x01"', b'"ab\\'])
+def test_invalid_input(data):
+    for chunk_size in (1, 100):
+        with pytest.raises(ValueError):
+            json_stream.load_chunks(chunks(data, chunk_size))
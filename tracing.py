@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+import contextlib
+import contextvars
+import collections
+import urllib.parse
+
+from dotenv import load_dotenv
+
+load_dotenv('environment.env')
+
+logger = logging.getLogger(__name__)
+
+TRACE_FILE = os.getenv('TRACE_FILE', '')  # the traces file, OpenTelemetry JSON, one line for each job, '' to disable
+PROFILE_DIR = os.getenv('PROFILE_DIR', '')  # folder for the profiler stacks, '' to disable
+PROFILE_MIN_LINES = int(os.getenv('PROFILE_MIN_LINES', '5000'))  # profile only the configs with more lines
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))  # the profiler sampling interval, seconds
+
+SERVICE_NAME = 'dnacentersdk_compliance'
+SPAN_KINDS = {'internal': 1, 'client': 3}  # the OpenTelemetry span kinds
+# the URL path segments replaced in the span names: ids, UUIDs, IP addresses and the Webex base64 ids
+PATH_ID_PATTERN = re.compile(r'[0-9a-fA-F-]{16,}|[0-9.:]+|[A-Za-z0-9+/=_-]{40,}')
+
+# the current span, or the list of the spans shared by the jobs in a batch
+current_span = contextvars.ContextVar('current_span', default=None)
+traces = {}  # trace id -> list of the finished spans, written to the traces file when the trace is finished
+traces_lock = threading.Lock()
+write_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def start_trace(trace_id, name, **attributes):
+    """
+    This function will start a trace, use as a context manager: "with tracing.start_trace(instance_id, 'job'):".
+    The spans started in the context, including the spans in the workflow engine executor threads, are added to the
+    trace. The trace is written to the {TRACE_FILE} when the context exits
+    :param trace_id: the trace id, for example the notification instanceId, the dashes are removed
+    :param name: the root span name
+    :param attributes: the root span attributes
+    :return: the root span, or None if tracing is not enabled
+    """
+    if not TRACE_FILE:
+        yield None
+        return
+    trace_id = (trace_id or '').replace('-', '').lower()
+    if len(trace_id) != 32 or not all(c in '0123456789abcdef' for c in trace_id):
+        trace_id = uuid.uuid4().hex
+    with traces_lock:
+        traces[trace_id] = []
+    try:
+        with _span(trace_id, None, name, 'internal', attributes) as root_span:
+            yield root_span
+    finally:
+        with traces_lock:
+            spans = traces.pop(trace_id, [])
+        try:
+            _write_trace(spans)
+        except Exception:
+            logger.exception('Trace not saved: %s', trace_id)
+
+
+def span(name, kind='internal', **attributes):
+    """
+    This function will start a span in the current trace, use as a context manager:
+    "with tracing.span('Webex POST /messages', 'client') as span:". If there is no current trace, the span is not
+    recorded, the context returns None
+    :param name: the span name
+    :param kind: 'internal' or 'client', for the API calls
+    :param attributes: the span attributes
+    :return: the context manager, returns the span, a dict, the attributes can be updated
+    """
+    parent = current_span.get()
+    if parent is None:
+        return contextlib.nullcontext()
+    if isinstance(parent, list):
+        return _spans(parent, name, kind, attributes)
+    return _span(parent['traceId'], parent['spanId'], name, kind, attributes)
+
+
+def batch_span(parents, name, kind='internal', **attributes):
+    """
+    This function will start a span shared by the jobs in a batch, use as a context manager. The span, and the spans
+    started in the context, are recorded in the trace of each job, also when the batch runs in a thread without the
+    job context
+    :param parents: list of the job spans, from tracing.current_span.get() when the job joined the batch, None if the
+    job is not traced
+    :param name: the span name
+    :param kind: 'internal' or 'client', for the API calls
+    :param attributes: the span attributes
+    :return: the context manager, returns the span of the first job, the attributes are shared by all the jobs spans
+    """
+    parents = [parent for parent in parents if parent is not None]
+    if not parents:
+        return contextlib.nullcontext()
+    return _spans(parents, name, kind, attributes)
+
+
+def path_template(url):
+    """
+    This function will return the {url} path, with the ids and the IP addresses replaced with "{id}", used for the
+    span names, the values are recorded in the span attributes
+    :param url: the API URL, absolute or relative
+    :return: the path template, for example "/dna/intent/api/v1/task/{id}"
+    """
+    path = urllib.parse.urlsplit(url).path
+    return '/'.join('{id}' if PATH_ID_PATTERN.fullmatch(segment) else segment for segment in path.split('/'))
+
+
+@contextlib.contextmanager
+def profile(stage, lines):
+    """
+    This function will sample the stack of the current thread every {PROFILE_INTERVAL} seconds, while the {stage} is
+    executed, if the config has more than {PROFILE_MIN_LINES} {lines}. The stacks are saved to the {PROFILE_DIR}
+    folder, in the collapsed stacks format used by the flame graph tools, for example flamegraph.pl or speedscope
+    :param stage: the stage name, for example 'config diff'
+    :param lines: the number of config lines processed by the stage
+    :return: the context manager
+    """
+    if not PROFILE_DIR or lines < PROFILE_MIN_LINES:
+        yield
+        return
+    thread_id = threading.get_ident()
+    stacks = collections.Counter()
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(PROFILE_INTERVAL):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(code.co_name + ' (' + os.path.basename(code.co_filename) + ':' +
+                             str(code.co_firstlineno) + ')')
+                frame = frame.f_back
+            if stack:
+                stacks[';'.join(reversed(stack))] += 1
+
+    sampler = threading.Thread(target=sample, name='profiler', daemon=True)
+    sampler.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        sampler.join()
+        parent = current_span.get()
+        if isinstance(parent, list):
+            parent = parent[0]
+        file_name = (parent['traceId'] if parent else uuid.uuid4().hex) + '_' + stage.replace(' ', '_') + '.folded'
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(os.path.join(PROFILE_DIR, file_name), 'w') as file:
+            file.writelines(stack + ' ' + str(count) + '\n' for stack, count in stacks.items())
+        logger.info('Profile saved to file: %s, samples: %s', file_name, sum(stacks.values()))
+
+
+@contextlib.contextmanager
+def _span(trace_id, parent_span_id, name, kind, attributes):
+    """
+    Record a span, the span is the current span in the context
+    """
+    record = {'traceId': trace_id, 'spanId': os.urandom(8).hex(), 'parentSpanId': parent_span_id or '',
+              'name': name, 'kind': SPAN_KINDS[kind], 'startTimeUnixNano': time.time_ns(),
+              'attributes': dict(attributes), 'status': {'code': 1}}
+    token = current_span.set(record)
+    try:
+        yield record
+    except BaseException as e:
+        record['status'] = {'code': 2, 'message': repr(e)}
+        raise
+    finally:
+        current_span.reset(token)
+        record['endTimeUnixNano'] = time.time_ns()
+        with traces_lock:
+            spans = traces.get(trace_id)
+            if spans is not None:
+                spans.append(record)
+
+
+@contextlib.contextmanager
+def _spans(parents, name, kind, attributes):
+    """
+    Record one span for each of the {parents}, the spans share the attributes, the list of the spans is the current
+    span in the context
+    """
+    attributes = dict(attributes)
+    with contextlib.ExitStack() as stack:
+        records = [stack.enter_context(_span(parent['traceId'], parent['spanId'], name, kind, attributes))
+                   for parent in parents]
+        for record in records:
+            record['attributes'] = attributes
+        token = current_span.set(records)
+        try:
+            yield records[0]
+        finally:
+            current_span.reset(token)
+
+
+def _write_trace(spans):
+    """
+    Append the {spans} to the traces file, one line in the OpenTelemetry OTLP JSON format
+    """
+    if not spans:
+        return
+    otlp_spans = []
+    for record in spans:
+        otlp_span = dict(record, startTimeUnixNano=str(record['startTimeUnixNano']),
+                         endTimeUnixNano=str(record['endTimeUnixNano']),
+                         attributes=_otlp_attributes(record['attributes']))
+        otlp_spans.append(otlp_span)
+    line = json.dumps({'resourceSpans': [{
+        'resource': {'attributes': _otlp_attributes({'service.name': SERVICE_NAME, 'process.pid': os.getpid()})},
+        'scopeSpans': [{'scope': {'name': __name__}, 'spans': otlp_spans}]
+    }]})
+    with write_lock:
+        with open(TRACE_FILE, 'a') as file:
+            file.write(line + '\n')
+
+
+def _otlp_attributes(attributes):
+    """
+    Return the {attributes} in the OTLP JSON format
+    """
+    otlp_attributes = []
+    for key, value in attributes.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            otlp_value = {'boolValue': value}
+        elif isinstance(value, int):
+            otlp_value = {'intValue': str(value)}
+        elif isinstance(value, float):
+            otlp_value = {'doubleValue': value}
+        else:
+            otlp_value = {'stringValue': str(value)}
+        otlp_attributes.append({'key': key, 'value': otlp_value})
+    return otlp_attributes
@@ -29,9 +29,14 @@ import requests
 import urllib3
 import json
 import os
+import logging
 import time
+import random
+import threading
+import tracing
 
 from urllib3.exceptions import InsecureRequestWarning  # for insecure https warnings
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from requests_toolbelt.multipart.encoder import MultipartEncoder
 
@@ -39,29 +44,182 @@ urllib3.disable_warnings(InsecureRequestWarning)  # disable insecure https warni
 
 load_dotenv('environment.env')
 
+logger = logging.getLogger(__name__)
+
 WEBEX_BOT_AUTH = os.getenv('WEBHOOKD_BOT_AUTH')
 WEBEX_URL = os.getenv('WEBEX_URL')
 WEBEX_ROOM = os.getenv('WEBHOOKD_ROOM')
 WEBEX_BOT_ID = os.getenv('WEBHOOKD_BOT_ID')
 
+WEBEX_ROOM_CACHE_TTL = int(os.getenv('WEBEX_ROOM_CACHE_TTL', '3600'))  # room name to room id cache TTL, seconds
+WEBEX_ROOM_PAGE_SIZE = int(os.getenv('WEBEX_ROOM_PAGE_SIZE', '100'))  # number of rooms per /rooms page
+
+WEBEX_POOL_SIZE = int(os.getenv('WEBEX_POOL_SIZE', '10'))  # max keep-alive connections to Webex
+WEBEX_RATE_LIMIT = float(os.getenv('WEBEX_RATE_LIMIT', '5'))  # average number of API calls per second
+WEBEX_RATE_BURST = int(os.getenv('WEBEX_RATE_BURST', '10'))  # max number of API calls sent in a burst
+WEBEX_MAX_RETRIES = int(os.getenv('WEBEX_MAX_RETRIES', '5'))  # max retries for a rate limited or failed API call
+WEBEX_RETRY_BACKOFF = float(os.getenv('WEBEX_RETRY_BACKOFF', '1'))  # first retry backoff, seconds
+
+# shared session, all the API calls reuse the keep-alive connections to Webex
+webex_session = requests.Session()
+webex_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=WEBEX_POOL_SIZE))
+webex_session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=WEBEX_POOL_SIZE))
+
+# token bucket rate limiter, shared by all the API calls
+rate_limiter = {'tokens': float(WEBEX_RATE_BURST), 'updated': time.time(), 'blocked_until': 0}
+rate_limiter_lock = threading.Lock()
+
+room_cache = {}  # room name -> room id
+room_cache_expiry = 0
+room_cache_stats = {'hits': 0, 'misses': 0, 'refreshes': 0}
+room_cache_lock = threading.Lock()
+
+
+def webex_request(method, url, retry_on_error=False, multipart_fields=None, **kwargs):
+    """
+    This function will send the API call to Webex, using the shared session and the rate limiter.
+    The API calls rejected with "429 Too Many Requests", or "503 Service Unavailable", are retried after the
+    Retry-After time, the rate limiter will pause all the API calls for that time.
+    Server errors and connection errors are retried with exponential backoff only if {retry_on_error},
+    to be used for idempotent API calls
+    :param method: HTTP method
+    :param url: API URL
+    :param retry_on_error: retry the server and connection errors
+    :param multipart_fields: function that returns the multipart form fields, called for each attempt
+    :param kwargs: passed to the requests session
+    :return: the API call response
+    """
+    kwargs.setdefault('verify', False)
+    for attempt in range(WEBEX_MAX_RETRIES + 1):
+        last_attempt = attempt == WEBEX_MAX_RETRIES
+        backoff = WEBEX_RETRY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1)
+        _acquire_rate_token()
+        if multipart_fields:
+            # the multipart body is a stream, it is created again for each attempt
+            m = MultipartEncoder(multipart_fields())
+            kwargs['data'] = m
+            kwargs['headers'] = dict(kwargs.get('headers', {}), **{'Content-Type': m.content_type})
+        try:
+            with tracing.span('Webex ' + method + ' ' + tracing.path_template(url), 'client', **{
+                    'http.method': method, 'http.url': url, 'retry': attempt}) as span:
+                response = webex_session.request(method, url, **kwargs)
+                if span is not None:
+                    span['attributes']['http.status_code'] = response.status_code
+        except requests.exceptions.ConnectionError:
+            if not retry_on_error or last_attempt:
+                raise
+            time.sleep(backoff)
+            continue
+        if response.status_code in (429, 503) and not last_attempt:
+            retry_after = response.headers.get('Retry-After')
+            _pause_rate_limiter(int(retry_after) if retry_after and retry_after.isdigit() else backoff)
+            logger.warning('Webex API call rate limited, status code: %s, retry %s', response.status_code, attempt + 1)
+            continue
+        if response.status_code >= 500 and retry_on_error and not last_attempt:
+            time.sleep(backoff)
+            continue
+        return response
+    return response
+
+
+def _acquire_rate_token():
+    """
+    Wait for a token from the rate limiter bucket, the bucket is refilled with {WEBEX_RATE_LIMIT} tokens per second
+    """
+    while True:
+        with rate_limiter_lock:
+            now = time.time()
+            if now < rate_limiter['blocked_until']:
+                wait = rate_limiter['blocked_until'] - now
+            else:
+                elapsed = now - rate_limiter['updated']
+                rate_limiter['tokens'] = min(WEBEX_RATE_BURST, rate_limiter['tokens'] + elapsed * WEBEX_RATE_LIMIT)
+                rate_limiter['updated'] = now
+                if rate_limiter['tokens'] >= 1:
+                    rate_limiter['tokens'] -= 1
+                    return
+                wait = (1 - rate_limiter['tokens']) / WEBEX_RATE_LIMIT
+        time.sleep(wait)
+
+
+def _pause_rate_limiter(retry_after):
+    """
+    Pause all the API calls for {retry_after} seconds, and empty the bucket
+    """
+    with rate_limiter_lock:
+        rate_limiter['blocked_until'] = max(rate_limiter['blocked_until'], time.time() + retry_after)
+        rate_limiter['tokens'] = 0
+
 
 def get_room_id(room_name):
     """
     This function will find the Webex Teams room id based on the {room_name}
+    The room ids are cached for {WEBEX_ROOM_CACHE_TTL} seconds, the room list is fetched only when the cache expired,
+    or the room is not in the cache
     Call to Webex - /rooms
     :param room_name: The Webex Teams room name
     :return: the Webex Teams room Id
     """
-    room_id = None
-    url = WEBEX_URL + '/rooms' + '?max=1000'
+    global room_cache_expiry
+    with room_cache_lock:
+        if time.time() < room_cache_expiry and room_name in room_cache:
+            room_cache_stats['hits'] += 1
+            return room_cache[room_name]
+        room_cache_stats['misses'] += 1
+
+        # fetch the room list while holding the lock, concurrent lookups will wait for one refresh
+        rooms = get_rooms()
+        room_cache.clear()
+        for room in rooms:
+            room_cache[room['title']] = room['id']
+        room_cache_expiry = time.time() + WEBEX_ROOM_CACHE_TTL
+        room_cache_stats['refreshes'] += 1
+        return room_cache.get(room_name)
+
+
+def get_rooms():
+    """
+    This function will return the list of the Webex Teams rooms the bot is a member of.
+    The list is fetched using pages of {WEBEX_ROOM_PAGE_SIZE} rooms, following the "next" page links
+    Call to Webex - /rooms
+    :return: list of rooms
+    """
+    rooms = []
+    url = WEBEX_URL + '/rooms' + '?max=' + str(WEBEX_ROOM_PAGE_SIZE)
     header = {'content-type': 'application/json', 'authorization': WEBEX_BOT_AUTH}
-    room_response = requests.get(url, headers=header, verify=False)
-    room_list_json = room_response.json()
-    room_list = room_list_json['items']
-    for rooms in room_list:
-        if rooms['title'] == room_name:
-            room_id = rooms['id']
-    return room_id
+    while url:
+        room_response = webex_request('GET', url, retry_on_error=True, headers=header)
+        room_response.raise_for_status()
+        rooms.extend(room_response.json()['items'])
+        url = room_response.links.get('next', {}).get('url')
+    return rooms
+
+
+def invalidate_room_cache(room_name=None):
+    """
+    This function will remove the room with the {room_name} from the room id cache, or all rooms if not specified
+    :param room_name: the Webex Teams room name
+    :return: none
+    """
+    global room_cache_expiry
+    with room_cache_lock:
+        if room_name is None:
+            room_cache.clear()
+            room_cache_expiry = 0
+        else:
+            room_cache.pop(room_name, None)
+
+
+def get_room_cache_stats():
+    """
+    This function will return the room id cache hit and miss counters
+    :return: room id cache statistics
+    """
+    with room_cache_lock:
+        stats = dict(room_cache_stats)
+        stats['rooms'] = len(room_cache)
+        stats['expires_in'] = max(0, round(room_cache_expiry - time.time()))
+    return stats
 
 
 def post_room_message(room_name, message):
@@ -74,11 +232,10 @@ def post_room_message(room_name, message):
     :return: none
     """
     room_id = get_room_id(room_name)
-    time.sleep(2)
     payload = {'roomId': room_id, 'text': message}
     url = WEBEX_URL + '/messages'
     header = {'content-type': 'application/json', 'authorization': WEBEX_BOT_AUTH}
-    requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    webex_request('POST', url, data=json.dumps(payload), headers=header)
 
 
 def post_room_markdown_message(room_name, message):
@@ -91,11 +248,10 @@ def post_room_markdown_message(room_name, message):
     :return: none
     """
     room_id = get_room_id(room_name)
-    time.sleep(2)
     payload = {'roomId': room_id, 'markdown': message}
     url = WEBEX_URL + '/messages'
     header = {'content-type': 'application/json', 'authorization': WEBEX_BOT_AUTH}
-    requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    webex_request('POST', url, data=json.dumps(payload), headers=header)
 
 
 def post_room_url_message(room_name, message, url):
@@ -112,7 +268,7 @@ def post_room_url_message(room_name, message, url):
     payload = {'roomId': room_id, 'markdown': ('[' + message + '](' + url + ')')}
     url = WEBEX_URL + '/messages'
     header = {'content-type': 'application/json', 'authorization': WEBEX_BOT_AUTH}
-    requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    webex_request('POST', url, data=json.dumps(payload), headers=header)
 
 
 def post_room_card_message(room_name, card_message):
@@ -124,11 +280,14 @@ def post_room_card_message(room_name, card_message):
     """
     url = WEBEX_URL + '/messages'
     header = {'content-type': 'application/json', 'authorization': WEBEX_BOT_AUTH}
-    response = requests.post(url, data=json.dumps(card_message), headers=header, verify=False)
+    response = webex_request('POST', url, data=json.dumps(card_message), headers=header)
+    if response.status_code == 404:
+        # the room was deleted or the bot removed from the room, the cached room id is not valid
+        invalidate_room_cache(room_name)
     return response
 
 
-def post_room_file(room_name, file_name, file_type, parent_id):
+def post_room_file(room_name, file_name, file_type, parent_id, file_content=None):
     """
     This function will post the file with the name {file_name}, type of file {file_type},
     from the local folder with the path {file_path}, to the Spark room with the name {room_name}
@@ -138,15 +297,25 @@ def post_room_file(room_name, file_name, file_type, parent_id):
     :param file_name: File name to be uploaded
     :param file_type: File type
     :param parent_id: the message parent id to reply to, if available
+    :param file_content: the file content, if provided the file is not read from the local folder
     :return: response
     """
 
     room_id = get_room_id(room_name)
-    time.sleep(2)
-    m = MultipartEncoder({'roomId': room_id, 'parentId': parent_id, 'text': 'Ansible Playbook',
-                          'files': (file_name, open(file_name, 'rb'), file_type)})
     url = WEBEX_URL + '/messages'
-    header = {'Authorization': WEBEX_BOT_AUTH, 'Content-Type': m.content_type}
-    response = requests.post(url, data=m, headers=header)
+    header = {'Authorization': WEBEX_BOT_AUTH}
+    if file_content is not None:
+        file_data = file_content.encode('utf-8') if isinstance(file_content, str) else file_content
 
+        def multipart_fields():
+            return {'roomId': room_id, 'parentId': parent_id, 'text': 'Ansible Playbook',
+                    'files': (os.path.basename(file_name), file_data, file_type)}
+        return webex_request('POST', url, multipart_fields=multipart_fields, headers=header, verify=True)
 
+    with open(file_name, 'rb') as file:
+        def multipart_fields():
+            file.seek(0)
+            return {'roomId': room_id, 'parentId': parent_id, 'text': 'Ansible Playbook',
+                    'files': (file_name, file, file_type)}
+        response = webex_request('POST', url, multipart_fields=multipart_fields, headers=header, verify=True)
+    return response
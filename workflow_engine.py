@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2021 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2021 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+import os
+import asyncio
+import inspect
+import functools
+import threading
+import contextvars
+import tracing
+
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv('environment.env')
+
+WORKFLOW_EXECUTOR_SIZE = int(os.getenv('WORKFLOW_EXECUTOR_SIZE', '20'))  # threads for the blocking API calls
+
+loop = None
+loop_lock = threading.Lock()
+executor = ThreadPoolExecutor(max_workers=WORKFLOW_EXECUTOR_SIZE, thread_name_prefix='workflow-call')
+
+
+def get_loop():
+    """
+    This function will return the event loop shared by all the workflows, the loop runs in a background thread
+    :return: the event loop
+    """
+    global loop
+    with loop_lock:
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='workflow-engine', daemon=True).start()
+    return loop
+
+
+def run_coroutine(coroutine):
+    """
+    This function will schedule the {coroutine} on the shared event loop, it can be called from any thread
+    :param coroutine: the coroutine object
+    :return: a concurrent.futures.Future with the coroutine result
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, get_loop())
+
+
+async def run_blocking(function, *args, **kwargs):
+    """
+    This function will execute the blocking {function}, for example a Cisco DNA Center SDK or Webex API call, in one of
+    the {WORKFLOW_EXECUTOR_SIZE} executor threads. The workflow is suspended until the function returns.
+    The function is executed in a copy of the workflow context, for example the current trace span
+    :param function: the function to execute
+    :param args: the function arguments
+    :param kwargs: the function keyword arguments
+    :return: the function result
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(executor, context.run,
+                                                            functools.partial(function, *args, **kwargs))
+
+
+async def run_dag(steps, on_step=None, results=None, on_result=None):
+    """
+    This function will execute the workflow {steps}. Each step starts when the steps it depends on are completed,
+    the independent steps are executed concurrently. If a step fails, the steps not completed are cancelled
+    Sample steps:
+    {'device': (get_device, []), 'room': (get_room, []), 'message': (post_message, ['device', 'room'])}
+    :param steps: dict, step name -> (step function, list of the step names it depends on). The step function is called
+    with the dict of the step results, the coroutine functions are awaited, the other functions are executed with
+    run_blocking. A step can depend only on the steps before it
+    :param on_step: optional function called with the list of the running step names, when a step starts or ends
+    :param results: optional dict with the results of the steps already completed, these steps are not executed again
+    :param on_result: optional function called with the step name and the step result, when a step is completed
+    :return: dict, step name -> step result
+    """
+    results = dict(results or {})
+    completed_steps = set(results)
+    running = []
+    tasks = {}
+
+    async def run_step(name, function, requires):
+        if requires:
+            await asyncio.gather(*(tasks[step_name] for step_name in requires))
+        if name in completed_steps:
+            return
+        running.append(name)
+        if on_step:
+            on_step(list(running))
+        try:
+            with tracing.span('step ' + name):
+                if inspect.iscoroutinefunction(function):
+                    results[name] = await function(results)
+                else:
+                    results[name] = await run_blocking(function, results)
+        finally:
+            running.remove(name)
+            if on_step and running:
+                on_step(list(running))
+        if on_result:
+            on_result(name, results[name])
+
+    for name, (function, requires) in steps.items():
+        for step_name in requires:
+            if step_name not in tasks:
+                raise ValueError('Step ' + name + ' depends on the unknown step ' + step_name)
+        tasks[name] = asyncio.ensure_future(run_step(name, function, requires))
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    return results